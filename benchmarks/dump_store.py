@@ -0,0 +1,74 @@
+"""
+Compares the dump storage formats on the pages of a dump folder: disk space, number of files and read throughput.
+
+    python -m benchmarks.dump_store --dump "dump_folder" --limit 200
+
+The pages of the first `--limit` NIFs are copied to a temporary folder in every format and read back like the parser
+does, one page at a time.
+"""
+import argparse
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+from hotels_scraper.storage import DUMP_STORES, DumpStore, open_store
+
+
+def disk_usage(folder: str) -> Dict[str, int]:
+    sizes = [os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(folder) for name in names]
+    return {"bytes": sum(sizes), "files": len(sizes)}
+
+
+def copy_pages(source: DumpStore, target: DumpStore, nifs: List[str]) -> int:
+    pages = 0
+    for nif in nifs:
+        for page in source.pages(nif):
+            html_file = os.path.join(target.folder, nif, os.path.basename(page.html_file))
+            target.write(html_file, source.read(page.html_file), page.mtime_ns)
+            pages += 1
+    return pages
+
+
+def read_pages(store: DumpStore, nifs: List[str]) -> int:
+    size = 0
+    for nif in nifs:
+        for page in store.pages(nif):
+            size += len(store.read(page.html_file).encode("utf-8"))
+    return size
+
+
+def main(args: argparse.Namespace) -> None:
+    source = open_store(args.dump)
+    nifs = sorted(nif for nif in os.listdir(args.dump) if os.path.isdir(os.path.join(args.dump, nif)))[:args.limit]
+    print(f"{'format':<8} {'MB':>8} {'ratio':>6} {'files':>7} {'write (s)':>10} {'read (s)':>9} {'MB/s':>8} {'pages/s':>9}")
+    baseline = None
+    for name, store_class in DUMP_STORES.items():
+        with tempfile.TemporaryDirectory(dir=args.tmp) as folder:
+            store = store_class(folder)
+            start = time.perf_counter()
+            pages = copy_pages(source, store, nifs)
+            write_time = time.perf_counter() - start
+            usage = disk_usage(folder)
+            baseline = usage["bytes"] if baseline is None else baseline
+
+            read_time = None
+            for _ in range(args.repeat):
+                store = store_class(folder)  # indexes are read again, like in a new process
+                start = time.perf_counter()
+                size = read_pages(store, nifs)
+                elapsed = time.perf_counter() - start
+                read_time = elapsed if read_time is None else min(read_time, elapsed)
+
+            print(f"{name:<8} {usage['bytes'] / 1e6:>8.1f} {usage['bytes'] / max(baseline, 1):>6.2f} "
+                  f"{usage['files']:>7} {write_time:>10.2f} {read_time:>9.3f} {size / 1e6 / read_time:>8.1f} "
+                  f"{pages / read_time:>9.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dump", type=str, help="Dump folder with the downloaded pages", required=True)
+    parser.add_argument("--limit", type=int, default=200, help="Maximum number of NIFs copied")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions of the read, the best one is reported")
+    parser.add_argument("--tmp", type=str, help="Folder for the copies (default: system temporary folder)")
+    main(parser.parse_args())
@@ -0,0 +1,70 @@
+"""
+Compares the HTML parsing backends on the pages of a dump folder.
+
+    python -m benchmarks.html_backends --dump "dump_folder" --flavors Empresa Booking --limit 200
+"""
+import argparse
+import os
+import time
+from typing import Dict, List
+
+from hotels_scraper.enums import Flavor
+from hotels_scraper.html_backends import HTML_BACKENDS, HtmlBackend
+from hotels_scraper.storage import open_store
+
+
+def load_pages(dump_folder: str, flavor: Flavor, limit: int) -> List[str]:
+    store = open_store(dump_folder)
+    html_files = sorted(page.html_file for nif in os.listdir(dump_folder)
+                        if os.path.isdir(os.path.join(dump_folder, nif)) for page in store.find(nif, f"{nif}_{flavor}"))
+    return [store.read(html_file) for html_file in html_files[:limit]]
+
+
+def extract(backend: HtmlBackend, flavor: Flavor, html: str) -> None:
+    if flavor == Flavor.EMPRESA:
+        backend.text(html)
+        backend.links(html)
+    elif flavor == Flavor.BOOKING:
+        backend.booking_nodes(html)
+    elif flavor == Flavor.GOOGLE:
+        backend.google_nodes(html)
+
+
+def benchmark(pages: List[str], flavor: Flavor, repeat: int) -> Dict[str, float]:
+    timings = {}
+    for name, backend_class in HTML_BACKENDS.items():
+        try:
+            backend = backend_class()
+        except ImportError:
+            continue  # backend not installed
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for html in pages:
+                extract(backend, flavor, html)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+    return timings
+
+
+def main(args: argparse.Namespace) -> None:
+    for flavor in args.flavors:
+        pages = load_pages(args.dump, flavor, args.limit)
+        if len(pages) == 0:
+            print(f"{flavor}: no pages found")
+            continue
+        megabytes = sum(len(html.encode("utf-8")) for html in pages) / 1e6
+        print(f"{flavor}: {len(pages)} pages, {megabytes:.1f} MB")
+        for name, elapsed in sorted(benchmark(pages, flavor, args.repeat).items(), key=lambda x: x[1]):
+            print(f"  {name:<8} {elapsed:8.3f} s  {len(pages) / elapsed:8.1f} pages/s  {megabytes / elapsed:6.2f} MB/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dump", type=str, help="Dump folder with the downloaded html files", required=True)
+    parser.add_argument("--flavors", type=Flavor, nargs="*", choices=list(Flavor), default=list(Flavor),
+                        help="Flavors to benchmark")
+    parser.add_argument("--limit", type=int, default=500, help="Maximum number of pages per flavor")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions, the best one is reported")
+    main(parser.parse_args())
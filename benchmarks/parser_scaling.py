@@ -0,0 +1,35 @@
+"""
+Measures how the parser scales from 1 to N processes on a dump folder, without the parse cache.
+
+    python -m benchmarks.parser_scaling --dump "dump_folder" --indicators "resources/indicators.csv" --max-processes 8
+"""
+import argparse
+import os
+import time
+
+from hotels_scraper.enums import Flavor
+from hotels_scraper.main import load_indicators
+from hotels_scraper.parser import Parser
+
+
+def main(args: argparse.Namespace) -> None:
+    indicators = load_indicators(args.indicators, args.flavors)
+    baseline = None
+    print(f"{'processes':>9} {'time (s)':>9} {'speedup':>8} {'efficiency':>10}")
+    for processes in range(1, args.max_processes + 1):
+        start = time.perf_counter()
+        Parser(args.dump, indicators, args.html_backend, processes=processes).find_indicators_in_htmls()
+        elapsed = time.perf_counter() - start
+        baseline = elapsed if baseline is None else baseline
+        speedup = baseline / elapsed
+        print(f"{processes:>9} {elapsed:>9.2f} {speedup:>8.2f} {speedup / processes:>10.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dump", type=str, help="Dump folder with the downloaded html files", required=True)
+    parser.add_argument("--indicators", type=str, help="CSV file with indicators", required=True)
+    parser.add_argument("--flavors", type=Flavor, nargs="*", choices=list(Flavor), help="Flavors to parse")
+    parser.add_argument("--html-backend", type=str, help="HTML parsing backend")
+    parser.add_argument("--max-processes", type=int, default=os.cpu_count(), help="Largest number of processes")
+    main(parser.parse_args())
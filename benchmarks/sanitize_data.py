@@ -0,0 +1,90 @@
+"""
+Measures utils.sanitize_data on a synthetic panel of hotels with the columns of a SABI export merged with the parser results.
+
+    python -m benchmarks.sanitize_data --rows 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from hotels_scraper.enums import BookingPropertySustainabilitySplits
+from utils.sanitize_data import sanitize
+
+_TIERS = np.array(["BRONZE", "SILVER", "GOLD", "NONE", None], dtype=object)
+_INDEPENDENCE = np.array(["D", "C", "C+", "B-", "B", "B+", "A-", "A", "A+", "U"], dtype=object)
+_BEACH = np.array(["1", "0", "PLAYA", None], dtype=object)
+_FINANCIAL_COLUMNS = [
+    "Rentabilidad sobre capital empleado (%) % {year}",
+    "Rentabilidad económica (%) % {year}",
+    "Rentabilidad financiera (%) % {year}",
+    "Endeudamiento (%) % {year}",
+    "Margen de beneficio (%) % {year}",
+    "Ratio de solvencia % {year}",
+    "Ingresos de explotación EUR {year}",
+    "Result. ordinarios antes Impuestos EUR {year}",
+    "EBIT {year}",
+    "EBITDA {year}",
+    "Total Activo EUR {year}",
+    "Número empleados {year}",
+]
+
+
+def synthetic_panel(rows: int, seed: int = 0, facility_columns: bool = False) -> pd.DataFrame:
+    """Random hotels with every column sanitize_data reads, contexts built like the parser does"""
+    rng = np.random.default_rng(seed)
+    nifs = np.char.add("B", np.arange(rows).astype(str))
+    df = pd.DataFrame({
+        "NIF": nifs,
+        "Código NIF.1": nifs,
+        "Localidad.1": "Palma",
+        "Dirección web.1": "https://example.com",
+        "Nombre EMPRESA": np.char.add("Hotel ", nifs),
+        "Genero Director Ejecutivo": rng.integers(1, 4, rows),
+        "Indicator de Independencia BvD": rng.choice(_INDEPENDENCE, rows),
+        "PERTENECE A UN GRUPO O HAY MÁS HOTELES": rng.choice([1.0, np.nan], rows),
+        "PLAYA (PLAYA= 1 HASTA 10 KM; otros)": rng.choice(_BEACH, rows),
+        "Booking_Nivel_Sostenibilidad_Contexto": rng.choice(_TIERS, rows),
+        "Booking_Estrellas_Contexto": rng.choice([1.0, 2.0, 3.0, 4.0, 5.0, np.nan], rows),
+        "Booking_Puntuación_Contexto": rng.choice(["7,5", "8,1", "9,0", None], rows),
+    })
+    for year in (2018, 2019):
+        for column in _FINANCIAL_COLUMNS:
+            df[column.format(year=year)] = rng.uniform(1, 1000, rows).round(2)
+    df["Número empleados 2019"] = rng.integers(1, 400, rows)
+
+    for context_key, context_dict in BookingPropertySustainabilitySplits.items():
+        texts = list(context_dict)
+        # every hotel has a random subset of the facilities of each block, a third of them no Booking page
+        flags = rng.random((rows, len(texts))) < 0.4
+        flags[rng.random(rows) < 0.33] = False
+        contexts = pd.Series([""] * rows)
+        for i, text in enumerate(texts):
+            contexts = contexts.where(~flags[:, i], contexts + text + "; ")
+            if facility_columns:
+                df[context_dict[text]] = np.where(flags[:, i], True, None)
+        df[context_key] = contexts.replace("", None)
+    return df
+
+
+def main(args: argparse.Namespace) -> None:
+    start = time.perf_counter()
+    df = synthetic_panel(args.rows, args.seed, args.facility_columns)
+    print(f"Generated {len(df)} rows x {len(df.columns)} columns in {time.perf_counter() - start:.2f} s")
+
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        result = sanitize(df.copy())
+        elapsed = time.perf_counter() - start
+        print(f"sanitize: {elapsed:8.2f} s  {len(df) / elapsed:12.0f} rows/s  -> {len(result)} rows")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Number of synthetic hotels")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs")
+    parser.add_argument("--facility-columns", action="store_true",
+                        help="Include the one-hot facility columns written by the parser")
+    main(parser.parse_args())
@@ -0,0 +1,434 @@
+"""
+Benchmark suite on a synthetic dump: times the parser, the extractors of each flavor, the loading of the indicators,
+utils.sanitize_data and the downloader, also against a server that throttles it, and compares them with a stored baseline.
+
+    python -m benchmarks.suite --indicators "resources/indicators.csv" --nifs 100 --pages 10
+    python -m benchmarks.suite --indicators "resources/indicators.csv" --save-baseline "benchmarks/baseline.json"
+
+The dump is generated by benchmarks.synthetic in `--work-dir`, where it is reused while the scale doesn't change, or
+in a temporary folder. Each benchmark runs in a new process, so its peak RSS (including the processes it starts) is its
+own, and the best of `--repeat` runs is reported. Results are compared with `--baseline`, benchmarks/baseline.json by
+default: a benchmark slower or bigger than its baseline by more than `--tolerance` is a regression, and the suite exits
+with status 1. Baselines taken at another scale or on another machine aren't comparable, take your own first.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+
+from benchmarks.synthetic import generate_dump, matches, site_url
+from hotels_scraper.crawler import normalize_url, page_file_name
+from hotels_scraper.enums import Flavor
+from hotels_scraper.html_backends import get_html_backend
+from hotels_scraper.indicators import IndicatorRegistry
+from hotels_scraper.storage import DUMP_STORES, DumpStore, open_store
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+SCALE = ["nifs", "pages", "seed", "rows", "dump_format", "html_backend", "processes"]
+
+
+class Measure(NamedTuple):
+    seconds: float
+    items: int  # pages, rows or indicators processed in `seconds`
+    unit: str
+    bytes: int
+    details: Dict[str, float] = {}  # seconds of each stage
+
+
+def best_of(repeat: int, run: Callable[[], Measure], setup: Optional[Callable[[], None]] = None) -> Measure:
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        measure = run()
+        best = measure if best is None or measure.seconds < best.seconds else best
+    return best
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident memory of this process or of the largest of its finished children"""
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is in bytes on macOS, in KB elsewhere
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak * scale / 1e6
+
+
+def _dump_pages(store: DumpStore, flavor: Flavor) -> Dict[str, List[str]]:
+    nifs = sorted(nif for nif in os.listdir(store.folder) if os.path.isdir(os.path.join(store.folder, nif)))
+    return {nif: [store.read(page.html_file) for page in store.find(nif, f"{nif}_{flavor}")] for nif in nifs}
+
+
+def bench_find_indicators(args: argparse.Namespace, work_dir: str) -> Measure:
+    from hotels_scraper.main import load_indicators
+    from hotels_scraper.parser import Parser
+
+    dump = os.path.join(work_dir, "dump")
+    stats = matches(dump, args.nifs, args.pages, args.seed, args.dump_format, list(Flavor))
+    indicators = load_indicators(args.indicators)
+
+    def run() -> Measure:
+        start = time.perf_counter()
+        Parser(dump, indicators, args.html_backend, processes=args.processes).find_indicators_in_htmls()
+        return Measure(time.perf_counter() - start, stats.pages, "pages", stats.bytes)
+
+    return best_of(args.repeat, run)
+
+
+def _bench_extract(flavor: Flavor) -> Callable[[argparse.Namespace, str], Measure]:
+    def bench(args: argparse.Namespace, work_dir: str) -> Measure:
+        from hotels_scraper.dedupe import BlockIndex
+        from hotels_scraper.main import load_indicators
+        from hotels_scraper.parser import Parser
+        from hotels_scraper.profiling import Profiler
+
+        # pages are read before timing, only the backend and the matching are measured, in a single process
+        pages = _dump_pages(open_store(os.path.join(work_dir, "dump")), flavor)
+        size = sum(len(html.encode("utf-8")) for htmls in pages.values() for html in htmls)
+        indicators = load_indicators(args.indicators, [flavor])
+        backend = get_html_backend(args.html_backend).name
+
+        def run() -> Measure:
+            indexes = {matcher_flavor: BlockIndex(matcher) for matcher_flavor, matcher in indicators.matchers.items()}
+            profiler = Profiler()
+            start = time.perf_counter()
+            for nif, htmls in pages.items():
+                for html in htmls:
+                    Parser._process_single_html(flavor, html, indicators, indexes, backend, nif, profiler)
+            seconds = time.perf_counter() - start
+            details = {name: wall for (name, _, _), (_, wall, _) in profiler.totals().items()}
+            return Measure(seconds, sum(len(htmls) for htmls in pages.values()), "pages", size, details)
+
+        return best_of(args.repeat, run)
+
+    return bench
+
+
+def _bench_load_indicators(cached: bool) -> Callable[[argparse.Namespace, str], Measure]:
+    def bench(args: argparse.Namespace, work_dir: str) -> Measure:
+        from hotels_scraper.main import load_indicators
+
+        # a copy, so the compiled registry of the real file is left alone
+        path = os.path.join(work_dir, "indicators.csv")
+        shutil.copy2(args.indicators, path)
+        artifact = path + IndicatorRegistry.CACHE_SUFFIX
+
+        def setup() -> None:
+            if cached:
+                load_indicators(path)
+            elif os.path.exists(artifact):
+                os.remove(artifact)
+
+        def run() -> Measure:
+            start = time.perf_counter()
+            registry = load_indicators(path)
+            seconds = time.perf_counter() - start
+            return Measure(seconds, sum(len(registry[flavor]) for flavor in registry), "indicators",
+                           os.path.getsize(path))
+
+        return best_of(args.repeat, run, setup)
+
+    return bench
+
+
+def sanitize_input(args: argparse.Namespace, work_dir: str) -> str:
+    """Synthetic panel read by the sanitize_data benchmark, written once by the suite"""
+    path = os.path.join(work_dir, f"sanitize_{args.rows}_{args.seed}.csv")
+    if not os.path.exists(path):
+        from benchmarks.sanitize_data import synthetic_panel
+        synthetic_panel(args.rows, args.seed).to_csv(path, index=False)
+    return path
+
+
+def bench_sanitize_data(args: argparse.Namespace, work_dir: str) -> Measure:
+    from utils import sanitize_data
+
+    input_path = sanitize_input(args, work_dir)
+    output_path = os.path.join(work_dir, "sanitized.csv")
+
+    def run() -> Measure:
+        start = time.perf_counter()
+        sanitize_data.main(argparse.Namespace(input=input_path, output=output_path))
+        return Measure(time.perf_counter() - start, args.rows, "rows", os.path.getsize(input_path))
+
+    return best_of(args.repeat, run)
+
+
+class _SiteHandler(BaseHTTPRequestHandler):
+    """Serves the synthetic dump as websites, /<nif>/<path>, and as /<nif>/booking and /<nif>/google pages.
+
+    With a `rate`, it throttles like Booking and Google do: requests over `rate` per second get a 429, and
+    the first request of a quarter of the Booking and Google pages gets a captcha page.
+    """
+    protocol_version = "HTTP/1.1"
+    store: DumpStore = None
+    rate: Optional[float] = None
+    _lock = threading.Lock()
+    _tokens = 0.0
+    _updated = 0.0
+    _served: Set[str] = set()
+
+    @classmethod
+    def reset(cls, rate: Optional[float]) -> None:
+        cls.rate = rate
+        cls._tokens = 0.0
+        cls._updated = time.monotonic()
+        cls._served = set()
+
+    def do_GET(self) -> None:
+        nif, _, path = self.path.split("?")[0].lstrip("/").partition("/")
+        if self.rate is not None:
+            with _SiteHandler._lock:
+                now = time.monotonic()
+                # bursts of a tenth of a second of requests
+                tokens = min(max(self.rate / 10, 1), _SiteHandler._tokens + (now - _SiteHandler._updated) * self.rate)
+                _SiteHandler._updated = now
+                allowed = tokens >= 1
+                _SiteHandler._tokens = tokens - 1 if allowed else tokens
+                captcha = allowed and path in ("booking", "google") and zlib.crc32(nif.encode()) % 4 == 0 and \
+                    self.path not in _SiteHandler._served
+                if captcha:
+                    _SiteHandler._served.add(self.path)
+            if not allowed:
+                self._send(429, b"", {"Retry-After": "1"})
+                return
+            if captcha:
+                self._send(200, b'<html><body><div class="g-recaptcha"></div></body></html>')
+                return
+
+        if path in ("booking", "google"):
+            name = f"{nif}_{Flavor(path.capitalize())}.html"
+        elif path == "":
+            name = f"{nif}_{Flavor.EMPRESA}.html"
+        else:
+            name = page_file_name(nif, str(Flavor.EMPRESA), normalize_url(f"{site_url(nif)}/{path}"))
+        html_file = os.path.join(self.store.folder, nif, name)
+        if not self.store.exists(html_file):
+            self.send_error(404)
+            return
+        # links to the made up host of the hotel point to this server instead
+        body = self.store.read(html_file).replace(site_url(nif), f"http://{self.headers['Host']}/{nif}")
+        self._send(200, body.encode("utf-8"))
+
+    def _send(self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def _bench_download(throttled: bool) -> Callable[[argparse.Namespace, str], Measure]:
+    def bench(args: argparse.Namespace, work_dir: str) -> Measure:
+        import pandas as pd
+
+        from hotels_scraper.downloader import Downloader
+        from hotels_scraper.fetchers import HttpFetcher
+
+        # the server runs in a thread of the same process, so this is a lower bound of the downloader throughput
+        _SiteHandler.store = open_store(os.path.join(work_dir, "dump"))
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _SiteHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        root = f"http://127.0.0.1:{server.server_address[1]}"
+        nifs = sorted(nif for nif in os.listdir(_SiteHandler.store.folder)
+                      if os.path.isdir(os.path.join(_SiteHandler.store.folder, nif)))
+        df = pd.DataFrame({
+            "Dirección web": [f"{root}/{nif}/" for nif in nifs],
+            "BOOKING": [f"{root}/{nif}/booking" if len(_SiteHandler.store.find(nif, f"{nif}_{Flavor.BOOKING}")) > 0
+                        else None for nif in nifs],
+            "GOOGLE": [f"{root}/{nif}/google" if len(_SiteHandler.store.find(nif, f"{nif}_{Flavor.GOOGLE}")) > 0
+                       else None for nif in nifs],
+        }, index=nifs)
+        expected = sum(len(_SiteHandler.store.pages(nif)) for nif in nifs)
+        output = os.path.join(work_dir, "download")
+
+        def setup() -> None:
+            _SiteHandler.reset(args.server_rate if throttled else None)
+            shutil.rmtree(output, ignore_errors=True)
+            if os.path.exists(Downloader.manifest_path(output)):
+                os.remove(Downloader.manifest_path(output))
+
+        def run() -> Measure:
+            start = time.perf_counter()
+            downloader = Downloader(output, args.html_backend, args.concurrency, args.concurrency, HttpFetcher.name,
+                                    crawl_depth=1, crawl_budget=args.pages, dump_format=args.dump_format,
+                                    max_retries=8)
+            downloader.download_htmls(df, url_column="Dirección web", post_fix=str(Flavor.EMPRESA))
+            downloader.download_htmls(df, url_column="BOOKING", post_fix=str(Flavor.BOOKING))
+            downloader.download_htmls(df, url_column="GOOGLE", post_fix=str(Flavor.GOOGLE))
+            seconds = time.perf_counter() - start
+            store = open_store(output)
+            pages = [page for nif in nifs for page in store.pages(nif)]
+            # throttled and captcha pages must have been fetched again, not saved or lost
+            if len(pages) != expected:
+                raise RuntimeError(f"{len(pages)} pages downloaded, {expected} expected")
+            # gzip dumps list their compressed sizes, the pages are measured as served
+            size = sum(len(store.read(page.html_file).encode("utf-8")) for page in pages)
+            return Measure(seconds, len(pages), "pages", size)
+
+        try:
+            return best_of(args.repeat, run, setup)
+        finally:
+            server.shutdown()
+            setup()
+
+    return bench
+
+
+BENCHMARKS: Dict[str, Callable[[argparse.Namespace, str], Measure]] = {
+    "load_indicators": _bench_load_indicators(cached=False),
+    "load_indicators_cached": _bench_load_indicators(cached=True),
+    "extract_empresa": _bench_extract(Flavor.EMPRESA),
+    "extract_booking": _bench_extract(Flavor.BOOKING),
+    "extract_google": _bench_extract(Flavor.GOOGLE),
+    "find_indicators": bench_find_indicators,
+    "sanitize_data": bench_sanitize_data,
+    "download": _bench_download(throttled=False),
+    "download_throttled": _bench_download(throttled=True),
+}
+
+
+def _run_benchmark(name: str, args: argparse.Namespace, work_dir: str, queue: multiprocessing.Queue) -> None:
+    logging.disable(logging.WARNING)  # pages without some section are expected
+    try:
+        measure = BENCHMARKS[name](args, work_dir)
+        queue.put({**measure._asdict(), "peak_rss_mb": peak_rss_mb()})
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def run_benchmark(name: str, args: argparse.Namespace, work_dir: str) -> Dict:
+    """Result of a benchmark run in a new process, so its memory peak isn't the one of a previous benchmark"""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_benchmark, args=(name, args, work_dir, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def compare(results: Dict[str, Dict], baseline: Dict, tolerance: float) -> Dict[str, str]:
+    """Comparison with the baseline of each benchmark, regressions start with REGRESSION"""
+    comparisons = {}
+    for name, result in results.items():
+        base = baseline["results"].get(name)
+        if base is None or "error" in result or "error" in base:
+            continue
+        notes = []
+        regression = False
+        for metric, label in (("seconds", "time"), ("peak_rss_mb", "RSS")):
+            if result.get(metric) is None or base.get(metric) is None:
+                continue
+            ratio = result[metric] / base[metric]
+            regression |= ratio > 1 + tolerance
+            notes.append(f"{label} x{ratio:.2f}")
+        comparisons[name] = ("REGRESSION " if regression else "") + ", ".join(notes)
+    return comparisons
+
+
+def environment() -> Dict:
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "date": time.strftime("%Y-%m-%d")}
+
+
+def main(args: argparse.Namespace) -> int:
+    """Runs the benchmarks and returns the number of regressions"""
+    args.html_backend = get_html_backend(args.html_backend).name
+    args.processes = args.processes or os.cpu_count() or 1
+    args.dump_format = args.dump_format or "loose"
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="hotels-benchmark-")
+    try:
+        dump = os.path.join(work_dir, "dump")
+        stats = matches(dump, args.nifs, args.pages, args.seed, args.dump_format, list(Flavor))
+        if stats is None:
+            shutil.rmtree(dump, ignore_errors=True)
+            start = time.perf_counter()
+            stats = generate_dump(dump, IndicatorRegistry.load(args.indicators, cache=False), args.nifs, args.pages,
+                                  args.seed, args.dump_format)
+            print(f"Generated {stats.pages} pages of {stats.nifs} NIFs ({stats.bytes / 1e6:.1f} MB) "
+                  f"in {time.perf_counter() - start:.1f} s")
+        if args.only is None or "sanitize_data" in args.only:
+            sanitize_input(args, work_dir)
+
+        results = {}
+        print(f"{'benchmark':<24} {'time (s)':>9} {'throughput':>20} {'MB/s':>8} {'peak RSS (MB)':>14}")
+        for name in args.only or list(BENCHMARKS):
+            result = run_benchmark(name, args, work_dir)
+            results[name] = result
+            if "error" in result:
+                print(f"{name:<24} failed: {result['error']}")
+                continue
+            rss = "-" if result["peak_rss_mb"] is None else f"{result['peak_rss_mb']:.0f}"
+            details = ", ".join(f"{stage} {seconds:.2f} s" for stage, seconds in result["details"].items())
+            print(f"{name:<24} {result['seconds']:>9.4f} "
+                  f"{result['items'] / result['seconds']:>12,.0f} {result['unit'] + '/s':<7} "
+                  f"{result['bytes'] / 1e6 / result['seconds']:>8.1f} {rss:>14}" + (f"  ({details})" if details else ""))
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    scale = {key: getattr(args, key) for key in SCALE}
+    if args.save_baseline is not None:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"scale": scale, "environment": environment(), "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"Baseline saved to {args.save_baseline}")
+        return 0
+
+    baseline_path = args.baseline or (DEFAULT_BASELINE if os.path.exists(DEFAULT_BASELINE) else None)
+    if baseline_path is None:
+        return 0
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline["scale"] != scale:
+        print(f"{baseline_path} was taken with {baseline['scale']}, not comparable with {scale}")
+        return 0
+    print(f"Compared with {baseline_path} ({baseline['environment']['platform']}, "
+          f"{baseline['environment']['cpus']} CPUs, {baseline['environment']['date']}):")
+    comparisons = compare(results, baseline, args.tolerance)
+    for name, comparison in comparisons.items():
+        print(f"  {name:<24} {comparison}")
+    return sum(1 for comparison in comparisons.values() if comparison.startswith("REGRESSION"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--indicators", type=str, help="CSV file with indicators", required=True)
+    parser.add_argument("--nifs", type=int, default=100, help="Number of synthetic hotels")
+    parser.add_argument("--pages", type=int, default=10, help="Pages of each hotel website")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data")
+    parser.add_argument("--rows", type=int, default=100_000, help="Rows of the panel given to sanitize_data")
+    parser.add_argument("--dump-format", type=str, choices=list(DUMP_STORES), help="How the pages are stored")
+    parser.add_argument("--html-backend", type=str, help="HTML parsing backend")
+    parser.add_argument("--processes", type=int, help="Number of parser processes (default: number of CPUs)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Simultaneous downloads of the download benchmark")
+    parser.add_argument("--server-rate", type=float, default=50,
+                        help="Requests per second the server of the throttled download benchmark answers with a page")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each benchmark, the best one is reported")
+    parser.add_argument("--only", type=str, nargs="*", choices=list(BENCHMARKS), help="Benchmarks to run")
+    parser.add_argument("--work-dir", type=str,
+                        help="Folder for the synthetic dump, kept between runs (default: a temporary folder)")
+    parser.add_argument("--baseline", type=str, help="Results to compare with (default: benchmarks/baseline.json)")
+    parser.add_argument("--save-baseline", type=str, help="Save the results as a baseline to this file")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Relative slowdown or memory growth over the baseline reported as a regression")
+    sys.exit(1 if main(parser.parse_args()) > 0 else 0)
@@ -0,0 +1,281 @@
+"""
+Generates a synthetic dump folder of hotels, laid out like the one written by the downloader, to benchmark the tools
+on reproducible data of any scale.
+
+    python -m benchmarks.synthetic --output "synthetic_dump" --indicators "resources/indicators.csv" --nifs 500 --pages 10
+
+Every NIF gets a website of `--pages` Empresa pages sharing a header, cookie banner and footer, with the keywords of some
+of the Empresa indicators spread over their text. Most NIFs also get a Booking page, with the sustainability facilities,
+tier, chain programmes and stars in its embedded JSON and the review score block, and a Google page with the section
+headings, aria-label amenities and stars of the Google indicators. The same arguments always produce the same pages.
+"""
+import argparse
+import json
+import os
+import random
+from typing import Dict, List, NamedTuple, Optional
+
+from hotels_scraper.crawler import normalize_url, page_file_name
+from hotels_scraper.enums import BookingFacilityIndex, ExtractionTypes, Flavor
+from hotels_scraper.html_backends import BOOKING_BANNER_TESTID, BOOKING_REVIEW_COMPONENT
+from hotels_scraper.indicators import IndicatorRegistry
+from hotels_scraper.storage import DUMP_STORES, open_store
+
+PARAMETERS_FILE = "synthetic.json"
+
+_VOCABULARY = (
+    "hotel habitación habitaciones playa desayuno reserva reservar ofertas contacto servicios ubicación centro ciudad "
+    "piscina terraza vistas mar montaña restaurante bar cafetería cocina mediterránea tradicional menú carta cena "
+    "almuerzo buffet familia familias niños pareja parejas escapada fin de semana vacaciones verano invierno temporada "
+    "precio precios mejor garantizado directo web oficial tarifa flexible cancelación gratuita llegada salida "
+    "recepción horas atención personal equipo amable trato cercano confort descanso cama doble individual suite "
+    "junior superior estándar baño ducha secador televisión caja fuerte minibar aire acondicionado calefacción wifi "
+    "gratis aparcamiento garaje traslado aeropuerto estación excursiones actividades deporte golf tenis bicicleta "
+    "senderismo cultura museo casco antiguo paseo marítimo puerto calas arena fina agua cristalina sol luz jardín "
+    "naturaleza tranquilo tranquilidad relax masaje tratamientos belleza bienestar eventos bodas reuniones salón "
+    "capacidad personas grupo empresa historia desde años tradición calidad servicio excelente experiencia única "
+    "disfrute disfrutar descubra descubrir nuestro nuestra nuestros nuestras su sus el la los las un una de del en "
+    "con para por a y o que se al como más muy todo todos cada entre sin sobre hasta"
+).split()
+_SLUGS = ["habitaciones", "servicios", "restaurante", "ofertas", "ubicacion", "galeria", "contacto", "spa",
+          "sostenibilidad", "eventos", "actividades", "opiniones", "aviso-legal", "politica-de-privacidad",
+          "politica-de-cookies", "blog"]
+_LANGUAGES = ["", "en", "de", "fr"]
+_COOKIES = ("Utilizamos cookies propias y de terceros para mejorar nuestros servicios y mostrarle publicidad "
+            "relacionada con sus preferencias mediante el análisis de sus hábitos de navegación. Si continúa "
+            "navegando, consideramos que acepta su uso. Puede cambiar la configuración u obtener más información "
+            "en nuestra política de cookies.")
+_STYLE = ".nav{display:flex}.nav a{padding:0 1em}.hero{height:60vh;background:#eee}.footer{font-size:.8em}" * 20
+_TIERS = ["GOLD", "SILVER", "BRONZE", "NONE"]
+_CHAINS = [("Meliá", "Eco &amp; more"), ("Iberostar", "Wave of Change"), ("NH", "Green Hotels"),
+           ("Barceló", "Sustainability Plan"), ("Riu", "Proudly Committed")]
+_AMENITIES = ["Wi-Fi gratis", "Aparcamiento gratuito", "Aire acondicionado", "Restaurante", "Bar", "Desayuno",
+              "Servicio de habitaciones", "Admite mascotas", "Lavandería", "Centro de negocios"]
+_OTHER_HEADINGS = ["Servicios destacados", "Ubicación", "Llegada y salida", "Normas del alojamiento"]
+
+
+def site_url(nif: str) -> str:
+    """Made up url of the website of a synthetic hotel"""
+    return f"https://www.hotel-{nif.lower()}.example"
+
+
+class DumpStats(NamedTuple):
+    nifs: int
+    pages: int
+    bytes: int
+
+
+def _sentences(rng: random.Random, words: int, keywords: List[str], keyword_rate: float) -> List[str]:
+    """Random Spanish sentences of about `words` words, with a share of them replaced by `keywords`"""
+    tokens = rng.choices(_VOCABULARY, k=words)
+    if len(keywords) > 0:
+        for _ in range(int(words * keyword_rate)):
+            tokens[rng.randrange(words)] = rng.choice(keywords)
+    sentences = []
+    start = 0
+    while start < words:
+        length = rng.randint(8, 24)
+        sentence = " ".join(tokens[start:start + length])
+        sentences.append(sentence[:1].upper() + sentence[1:] + ".")
+        start += length
+    return sentences
+
+
+def _paragraphs(sentences: List[str], rng: random.Random) -> str:
+    paragraphs = []
+    start = 0
+    while start < len(sentences):
+        length = rng.randint(2, 6)
+        paragraphs.append("<p>" + " ".join(sentences[start:start + length]) + "</p>")
+        start += length
+    return "\n".join(paragraphs)
+
+
+def empresa_site(rng: random.Random, nif: str, keywords: List[str], pages: int, base_url: str,
+                 page_kb: int = 40) -> Dict[str, str]:
+    """Pages of a hotel website as {url: html}, the first one being its homepage.
+
+    Every page links to all the others from its navigation bar, so a crawl of depth 1 reaches them.
+    """
+    paths = [f"/{language}/{slug}".replace("//", "/") for language in _LANGUAGES for slug in _SLUGS]
+    urls = [base_url + "/"] + [base_url + path for path in paths[:pages - 1]]
+    name = f"Hotel {rng.choice(_VOCABULARY).capitalize()} {nif}"
+    navigation = "".join(f'<a href="{url}">{url.rsplit("/", 1)[-1] or "inicio"}</a>' for url in urls)
+    header = (f'<header><div class="logo">{name}</div><nav class="nav">{navigation}</nav>'
+              f'<div class="booking-widget">Reserve ahora al mejor precio garantizado | Llegada | Salida | '
+              f'Huéspedes</div></header>')
+    footer = (f'<footer class="footer"><p>{name} © 2023 · Todos los derechos reservados</p>'
+              f'<p>Calle {rng.choice(_VOCABULARY).capitalize()} {rng.randint(1, 200)}, 07001 Palma · '
+              f'Tel. +34 971 {rng.randint(100000, 999999)} · info@{nif.lower()}.example</p>'
+              f'<div id="cookies">{_COOKIES}</div></footer>')
+    words = page_kb * 1024 // 7  # about 7 bytes per word, with the markup
+    site = {}
+    for url in urls:
+        body = _paragraphs(_sentences(rng, words, keywords, 0.002), rng)
+        site[url] = (f'<!DOCTYPE html><html lang="es"><head><meta charset="utf-8"><title>{name}</title>'
+                     f'<style>{_STYLE}</style>'
+                     f'<script type="application/ld+json">{json.dumps({"@type": "Hotel", "name": name})}</script>'
+                     f'<script>window.dataLayer=window.dataLayer||[];dataLayer.push({{"page":"{url}"}});</script>'
+                     f'</head><body>{header}<main><div class="hero"><h1>{name}</h1></div>\n{body}\n</main>'
+                     f'{footer}</body></html>')
+    return site
+
+
+def booking_page(rng: random.Random, nif: str, page_kb: int = 400) -> str:
+    """Booking.com property page, with the Apollo state and the review score block the parser reads"""
+    state = {}
+    sustainable = rng.random() < 0.6
+    if sustainable:
+        for facility_id in rng.sample(sorted(BookingFacilityIndex), rng.randint(1, min(20, len(BookingFacilityIndex)))):
+            state[f'PropertySustainabilityFacility:{{"id":{facility_id}}}'] = {"__typename": "Facility",
+                                                                              "id": int(facility_id)}
+        state["PropertySustainabilityTier:{}"] = {"__typename": "Tier", "type": rng.choice(_TIERS)}
+    chains = [{"chainName": chain, "programmeName": programme}
+              for chain, programme in rng.sample(_CHAINS, rng.randint(0, 2))]
+    state["PropertySustainability:{}"] = {"chainProgrammes": chains or None}
+    if rng.random() < 0.9:
+        state["StarRating:{}"] = {"value": rng.randint(1, 5)}
+
+    # rooms, photos and reviews make most of the weight of a real page
+    rooms = []
+    reviews = []
+    size = 0
+    while size < page_kb * 1024:
+        description = " ".join(rng.choices(_VOCABULARY, k=40))
+        room_id = len(rooms)
+        state[f"Room:{{\"id\":{room_id}}}"] = {"__typename": "Room", "id": room_id, "description": description,
+                                                 "photos": [f"https://cf.bstatic.com/xdata/images/{rng.getrandbits(40)}"
+                                                            f".jpg" for _ in range(6)]}
+        rooms.append(f'<tr data-block-id="{room_id}"><td>{description[:60]}</td>'
+                     f'<td>€ {rng.randint(50, 400)}</td></tr>')
+        review = " ".join(rng.choices(_VOCABULARY, k=30))
+        reviews.append(f'<li class="review"><div class="review-score">{rng.randint(5, 10)}</div><p>{review}</p></li>')
+        size += len(description) + 420 + len(rooms[-1]) + len(reviews[-1])  # the state entry has 6 photo urls
+
+    score = f"{rng.randint(60, 99) / 10:.1f}".replace(".", ",")
+    comments = f"{rng.randint(3, 4999):,}".replace(",", ".")
+    banner = ("" if not sustainable else
+              f'<div data-testid="{BOOKING_BANNER_TESTID}"><h3>Sostenibilidad</h3>'
+              f'<span>Este alojamiento ha tomado medidas para ofrecer una estancia más sostenible</span></div>')
+    return (f'<!DOCTYPE html><html lang="es"><head><meta charset="utf-8"><title>Hotel {nif}, Palma – Precios '
+            f'actualizados 2023</title>'
+            f'<script>var booking = {{"env": {{"b_lang": "es", "b_hotel_id": {rng.randint(1, 10 ** 7)}}}}};</script>'
+            f'<script type="application/json" data-capla-store-data="apollo">{json.dumps(state)}</script>'
+            f'</head><body><div id="hotel-description"><h2>Hotel {nif}</h2>'
+            f'<p>{" ".join(rng.choices(_VOCABULARY, k=120))}</p></div>{banner}'
+            f'<div data-capla-component="b-property-web-property-page/{BOOKING_REVIEW_COMPONENT}">'
+            f'<div class="review-score"><div aria-label="Puntuación: {score}">{score}</div>'
+            f'<div><div>Fabuloso</div><div>{comments} comentarios</div></div></div><div>Ver comentarios</div></div>'
+            f'<table class="rooms">{"".join(rooms)}</table><ul class="reviews">{"".join(reviews)}</ul>'
+            f'</body></html>')
+
+
+def google_page(rng: random.Random, nif: str, indicators: Dict[str, Dict], page_kb: int = 150) -> str:
+    """Google Hotels page with the headings and aria-label amenities of a random subset of the Google indicators"""
+    headings = []
+    labels = [rng.choice(_AMENITIES) for _ in range(4)]
+    for definition in indicators.values():
+        keyword = next((k for k in definition["keywords"] if k != ""), None)
+        if keyword is None or rng.random() < 0.4:
+            continue
+        if definition["extract"] == ExtractionTypes.SECTION:
+            headings.append(keyword[:1].upper() + keyword[1:])
+        elif definition["extract"] == ExtractionTypes.PHRASE:
+            labels.append(keyword.capitalize())
+    headings += rng.sample(_OTHER_HEADINGS, 2)
+    rng.shuffle(headings)
+
+    score = f"{rng.randint(30, 50) / 10:.1f}".replace(".", ",")
+    reviews = f"{rng.randint(3, 9999):,}".replace(",", ".")
+    sections = "".join(f'<div><h4>{heading}</h4><ul>'
+                       + "".join(f"<li>{' '.join(rng.choices(_VOCABULARY, k=4))}</li>" for _ in range(3))
+                       + "</ul></div>" for heading in headings)
+    amenities = "".join(f'<div aria-label="{label}"><span>{label}</span></div>' for label in labels)
+    padding = []
+    size = 0
+    while size < page_kb * 1024:
+        review = " ".join(rng.choices(_VOCABULARY, k=40))
+        padding.append(f'<div class="review" data-review-id="{rng.getrandbits(48)}"><span>{rng.randint(1, 5)}/5'
+                       f'</span><p>{review}</p></div>')
+        size += len(padding[-1])
+    return (f'<!DOCTYPE html><html lang="es"><head><meta charset="utf-8"><title>Hotel {nif} - Google Hoteles</title>'
+            f'<script>AF_initDataCallback({{key: "ds:0", data: {json.dumps(rng.choices(_VOCABULARY, k=200))}}});'
+            f'</script></head><body><div role="main"><h1>Hotel {nif}</h1>'
+            f'<div aria-label="{score} de 5 estrellas a partir de {reviews} reseñas"><span>{score}</span></div>'
+            f'<section>{amenities}</section>{sections}<section class="reviews">{"".join(padding)}</section>'
+            f'</div></body></html>')
+
+
+def generate_dump(folder: str, indicators: IndicatorRegistry, nifs: int = 100, pages: int = 10, seed: int = 0,
+                  dump_format: Optional[str] = None, booking_share: float = 0.7,
+                  google_share: float = 0.7) -> DumpStats:
+    """Writes the pages of `nifs` synthetic hotels to `folder`, with the names the downloader would give them.
+
+    Empresa pages are named after their urls in `site_url`. The parameters are saved in the folder, see `matches`.
+    """
+    store = open_store(folder, dump_format)
+    empresa_keywords = [keyword for definition in indicators.get(Flavor.EMPRESA, {}).values()
+                        for keyword in definition["keywords"] if keyword != ""]
+    empresa_indicators = list(indicators.get(Flavor.EMPRESA, {}).values())
+    written = 0
+    size = 0
+    for number in range(nifs):
+        rng = random.Random(f"{seed}-{number}")  # each hotel is the same whatever the number of NIFs
+        nif = f"B{number:08d}"
+        folder_nif = os.path.join(folder, nif)
+        # each hotel mentions the keywords of a third of the indicators
+        keywords = [keyword for definition in empresa_indicators if rng.random() < 0.33
+                    for keyword in definition["keywords"] if keyword != ""] or empresa_keywords[:1]
+        site = empresa_site(rng, nif, keywords, pages, site_url(nif))
+        files = {}
+        for index, (url, html) in enumerate(site.items()):
+            name = (f"{nif}_{Flavor.EMPRESA}.html" if index == 0 else
+                    page_file_name(nif, str(Flavor.EMPRESA), normalize_url(url)))
+            files[name] = html
+        if Flavor.BOOKING in indicators and rng.random() < booking_share:
+            files[f"{nif}_{Flavor.BOOKING}.html"] = booking_page(rng, nif)
+        if Flavor.GOOGLE in indicators and rng.random() < google_share:
+            files[f"{nif}_{Flavor.GOOGLE}.html"] = google_page(rng, nif, indicators[Flavor.GOOGLE])
+        for name, html in files.items():
+            store.write(os.path.join(folder_nif, name), html)
+            written += 1
+            size += len(html.encode("utf-8"))
+
+    stats = DumpStats(nifs, written, size)
+    with open(os.path.join(folder, PARAMETERS_FILE), "w", encoding="utf-8") as f:
+        json.dump({"nifs": nifs, "pages": pages, "seed": seed, "dump_format": store.name,
+                   "flavors": sorted(str(flavor) for flavor in indicators), "stats": stats._asdict()}, f)
+    return stats
+
+
+def matches(folder: str, nifs: int, pages: int, seed: int, dump_format: Optional[str],
+            flavors: List[Flavor]) -> Optional[DumpStats]:
+    """Stats of the synthetic dump in `folder` if it was generated with these parameters, None otherwise"""
+    try:
+        with open(os.path.join(folder, PARAMETERS_FILE), "r", encoding="utf-8") as f:
+            parameters = json.load(f)
+    except FileNotFoundError:
+        return None
+    if (parameters["nifs"], parameters["pages"], parameters["seed"]) != (nifs, pages, seed) \
+            or parameters["dump_format"] != (dump_format or "loose") \
+            or parameters["flavors"] != sorted(str(flavor) for flavor in flavors):
+        return None
+    return DumpStats(**parameters["stats"])
+
+
+def main(args: argparse.Namespace) -> None:
+    indicators = IndicatorRegistry.load(args.indicators, args.flavors, cache=False)
+    stats = generate_dump(args.output, indicators, args.nifs, args.pages, args.seed, args.dump_format)
+    print(f"{stats.pages} pages of {stats.nifs} NIFs written to {args.output}: {stats.bytes / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", type=str, help="Dump folder to create", required=True)
+    parser.add_argument("--indicators", type=str, help="CSV file with indicators", required=True)
+    parser.add_argument("--flavors", type=Flavor, nargs="*", choices=list(Flavor), help="Flavors to generate")
+    parser.add_argument("--nifs", type=int, default=100, help="Number of hotels")
+    parser.add_argument("--pages", type=int, default=10, help="Pages of each hotel website")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic pages")
+    parser.add_argument("--dump-format", type=str, choices=list(DUMP_STORES), help="How pages are stored")
+    main(parser.parse_args())
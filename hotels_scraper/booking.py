@@ -0,0 +1,131 @@
+import json
+import logging
+import re
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from hotels_scraper.html_backends import BookingNodes, LabelledNode, ScriptNode
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+_COMMENTS_REGEX = re.compile(r"([\d\.]+) comentarios")
+_SCORE_REGEX = re.compile(r"Puntuación: ([\d,\.]+)")
+_SUSTAINABILITY_MARKER = "PropertySustainability"
+_BLOCKED_MARKERS = ("g-recaptcha", "px-captcha", "captcha-delivery", "awsWafCookieDomainList", "challenge-container")
+_CHAIN_PROGRAMMES_MARKER = "chainProgrammes"
+_SUSTAINABILITY_KEY = "PropertySustainability:{}"
+_STAR_RATING_KEY = "StarRating:{}"
+
+
+class BookingRecord(NamedTuple):
+    """Everything the indicators need from a Booking page, None when it couldn't be found"""
+    facility_ids: Optional[List[str]]
+    tier: Optional[str]
+    chain_programmes: Optional[List[str]]
+    stars: Optional[Any]
+    score: Optional[str]
+    review_count: Optional[str]
+
+
+def extract_booking(nodes: BookingNodes) -> BookingRecord:
+    """Reads the Booking nodes of a page, decoding each embedded JSON script at most once"""
+    # a single pass over the scripts finds the ones holding the sustainability and chain data
+    sustainability_scripts = []
+    chain_scripts = []
+    for script in nodes.scripts:
+        if _SUSTAINABILITY_MARKER in script.body:
+            sustainability_scripts.append(script)
+        if script.type == "application/json" and _CHAIN_PROGRAMMES_MARKER in script.body:
+            chain_scripts.append(script)
+
+    decoded: Dict[int, Dict] = {}
+
+    def decode(script: ScriptNode) -> Dict:
+        if id(script) not in decoded:
+            try:
+                decoded[id(script)] = _loads(script.body)
+            except ValueError as e:
+                raise RuntimeError(f"Can't decode Booking JSON script: {e}")
+        return decoded[id(script)]
+
+    facility_ids = None
+    tier = None
+    if nodes.banners != 1:
+        logger.warning("Can't find sustainability banner")
+    elif len(sustainability_scripts) != 1:
+        logger.warning("Problem retrieving SustainabilityBannerDesktop")
+    else:
+        facility_ids = []
+        for key, value in decode(sustainability_scripts[0]).items():
+            if "PropertySustainabilityFacility" in key:
+                facility_ids.append(str(value["id"]))
+            elif "PropertySustainabilityTier" in key:
+                tier = value["type"]
+
+    chain_programmes = None
+    stars = None
+    if len(chain_scripts) != 1:
+        logger.warning("Problem retrieving chainProgrammes")
+    else:
+        content = decode(chain_scripts[0])
+        sustainability = content.get(_SUSTAINABILITY_KEY)
+        if sustainability is not None and sustainability.get("chainProgrammes") is not None:
+            chain_programmes = [f"{x['chainName']}_{x['programmeName']}" for x in sustainability["chainProgrammes"]]
+        if _STAR_RATING_KEY in content and "value" in content[_STAR_RATING_KEY]:
+            stars = content[_STAR_RATING_KEY]["value"]
+
+    score = None
+    review_count = None
+    if len(nodes.review_blocks) != 1:
+        logger.warning("Problem retrieving PropertyReviewScoreRight")
+    else:
+        review_block = nodes.review_blocks[0]
+        try:
+            score = _score(review_block)
+        except RuntimeError as e:
+            logger.warning(str(e))
+        try:
+            review_count = _review_count(review_block)
+        except Exception as e:
+            logger.warning(f"Problem retrieving comentarios: {e}")
+
+    return BookingRecord(facility_ids, tier, chain_programmes, stars, score, review_count)
+
+
+def validate_booking_page(text: str) -> Optional[str]:
+    """Why a fetched page is not a Booking hotel page, None if it is: Booking answers bots with a captcha or challenge.
+
+    Hotels without sustainability data are valid pages; a page that has it is never taken for a blocked one.
+    """
+    if _SUSTAINABILITY_MARKER in text:
+        return None
+    for marker in _BLOCKED_MARKERS:
+        if marker in text:
+            return f"blocked page ({marker})"
+    return None
+
+
+def _review_count(review_block: List[LabelledNode]) -> str:
+    comments = [div.text for div in review_block if div.text.endswith("comentarios")][0]
+    regex_result = _COMMENTS_REGEX.search(comments)
+    if regex_result is not None:
+        comments = regex_result.group(1)
+    return comments
+
+
+def _score(review_block: List[LabelledNode]) -> str:
+    score = [div.aria_label for div in review_block
+             if div.aria_label is not None and div.aria_label.startswith("Puntuación")]
+    if len(score) != 1:
+        raise RuntimeError("Problem retrieving Puntuación")
+    score = score[0]
+    regex_result = _SCORE_REGEX.search(score)
+    if regex_result is not None:
+        score = regex_result.group(1)
+    return score
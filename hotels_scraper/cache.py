@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from hotels_scraper.enums import Flavor
+
+
+class ParseCache:
+    """On-disk cache of per-file parse results, backed by SQLite.
+
+    Entries are keyed by the hash of the HTML content and a fingerprint of the flavor's
+    indicator definitions, so a file is only parsed again when either of them changes.
+
+    Hits don't write on every read: the access time of an entry is only refreshed when it is
+    older than ACCESS_INTERVAL, and the refreshes are written in batches, with the next `put`
+    or `flush`, so the workers of a cached re-run don't wait on each other's write locks.
+    """
+    VERSION = 4
+    ACCESS_INTERVAL = 3600  # seconds
+    ACCESS_BATCH = 256  # access times written at once
+    _connections: Dict = {}
+
+    def __init__(self, path: str, max_size_mb: int = 1024):
+        self._path = path
+        self._max_size = max_size_mb * 1024 * 1024
+        self._accessed: List[Tuple[float, str, str]] = []
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        # connections can't be shared across processes, so keep one per worker
+        key = (os.getpid(), self._path)
+        if key not in ParseCache._connections:
+            connection = sqlite3.connect(self._path, timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS results ("
+                               "content_hash TEXT NOT NULL, "
+                               "fingerprint TEXT NOT NULL, "
+                               "result TEXT NOT NULL, "
+                               "size INTEGER NOT NULL, "
+                               "last_access REAL NOT NULL, "
+                               "PRIMARY KEY (content_hash, fingerprint))")
+            connection.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+            connection.commit()
+            ParseCache._connections[key] = connection
+        return ParseCache._connections[key]
+
+    @staticmethod
+    def content_hash(html_content: Union[str, Iterable[str]]) -> str:
+        """Hash of a page, given whole or in chunks"""
+        digest = hashlib.sha256()
+        for chunk in [html_content] if isinstance(html_content, str) else html_content:
+            digest.update(chunk.encode("utf-8"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def fingerprint(flavor: Flavor, indicators: Dict, html_backend: str, variant: str = "") -> str:
+        """Hash of everything a result depends on besides the page; `variant` tells apart results of other options"""
+        definitions = {name: {"keywords": indicators[name]["keywords"], "extract": str(indicators[name]["extract"])}
+                       for name in indicators}
+        key = [ParseCache.VERSION, str(flavor), html_backend, definitions] + ([variant] if variant != "" else [])
+        payload = json.dumps(key, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, content_hash: str, fingerprint: str) -> Optional[Dict]:
+        row = self._connection.execute("SELECT result, last_access FROM results "
+                                       "WHERE content_hash = ? AND fingerprint = ?",
+                                       (content_hash, fingerprint)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] > ParseCache.ACCESS_INTERVAL:
+            self._accessed.append((now, content_hash, fingerprint))
+            if len(self._accessed) >= ParseCache.ACCESS_BATCH:
+                self.flush()
+        return json.loads(row[0])
+
+    def put(self, content_hash: str, fingerprint: str, result: Dict) -> None:
+        # indicators not found are left out, merging treats missing and empty values the same
+        value = json.dumps({name: value for name, value in result.items() if value != ""}, ensure_ascii=False)
+        with self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                                     (content_hash, fingerprint, value, len(value), time.time()))
+            self._write_accesses()
+
+    def flush(self) -> None:
+        """Writes the access times of the entries read since the last write"""
+        if len(self._accessed) > 0:
+            with self._connection:
+                self._write_accesses()
+
+    def _write_accesses(self) -> None:
+        self._connection.executemany("UPDATE results SET last_access = ? WHERE content_hash = ? AND fingerprint = ?",
+                                     self._accessed)
+        self._accessed = []
+
+    def evict(self) -> int:
+        """Removes the least recently used entries until the cache fits in its maximum size"""
+        self.flush()
+        total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total_size <= self._max_size:
+            return 0
+
+        evicted = 0
+        rows = self._connection.execute("SELECT content_hash, fingerprint, size FROM results "
+                                        "ORDER BY last_access").fetchall()
+        with self._connection:
+            for content_hash, fingerprint, size in rows:
+                if total_size <= self._max_size:
+                    break
+                self._connection.execute("DELETE FROM results WHERE content_hash = ? AND fingerprint = ?",
+                                         (content_hash, fingerprint))
+                total_size -= size
+                evicted += 1
+        return evicted
+
+    def clear(self) -> None:
+        with self._connection:
+            self._connection.execute("DELETE FROM results")
@@ -0,0 +1,186 @@
+import hashlib
+import heapq
+import json
+import os
+import posixpath
+import re
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+from hotels_scraper.html_backends import get_html_backend
+from hotels_scraper.scheduler import FetchJob
+from hotels_scraper.storage import DumpStore, LooseStore
+
+_SKIPPED_EXTENSIONS = (".pdf", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".mp3", ".mp4", ".avi", ".zip",
+                       ".rar", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".ics", ".xml", ".css", ".js")
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+# pages whose path contains these hints are crawled first within the same depth
+_PRIORITY_HINTS = ("sosten", "sustain", "medio-ambiente", "medioambiente", "environment", "ecolog", "rsc",
+                   "responsab", "green", "verde", "calidad", "certifica")
+
+
+def normalize_url(url: str, base: Optional[str] = None) -> Optional[str]:
+    """Canonical form of `url` used to deduplicate pages, or None if it is not a web page"""
+    url = url.strip().replace("\n", "")
+    if base is not None:
+        url = urljoin(base, url)
+
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS or parts.hostname is None:
+        return None
+
+    host = parts.hostname.lower()
+    if port is not None and port != _DEFAULT_PORTS[scheme]:
+        host += f":{port}"
+
+    path = re.sub(r"/+", "/", posixpath.normpath(parts.path or "/"))
+    if path != "/":
+        path = path.rstrip("/")
+    return urlunsplit((scheme, host, path, "", ""))
+
+
+def page_file_name(nif: str, post_fix: str, url: str) -> str:
+    """Collision-free file name for an internal page, derived from its normalized url"""
+    url_hash = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+    return f"{nif}_{post_fix}_{url_hash}.html"
+
+
+def _same_site(host: str, other_host: str) -> bool:
+    return re.sub(r"^www\.", "", host) == re.sub(r"^www\.", "", other_host)
+
+
+class CrawlManifest:
+    """Append-only JSON lines log with the state of every url seen while crawling a site"""
+    QUEUED = "queued"
+    FETCHED = "fetched"
+    FAILED = "failed"
+
+    def __init__(self, path: str):
+        self._path = path
+        self.entries: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # last line of an interrupted run
+                    self.entries[entry["url"]] = entry
+
+    def record(self, url: str, depth: int, status: str, file: str, expanded: bool = False) -> None:
+        entry = {"url": url, "depth": depth, "status": status, "file": file, "expanded": expanded}
+        self.entries[url] = entry
+        with open(self._path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class SiteCrawler:
+    """Breadth-limited crawl of one company website.
+
+    Pages are fetched by increasing depth, with a prioritized frontier, until `max_depth` or
+    the `max_pages` budget is reached. State is persisted in a manifest so an interrupted
+    crawl resumes where it stopped: pages it records as fetched are taken as present without
+    looking at their files, and only those for which `is_stale` is true are fetched again.
+    """
+    MANIFEST_POSTFIX = "_crawl.jsonl"
+
+    def __init__(self, nif: str, url: str, folder: str, post_fix: str, max_depth: int = 1, max_pages: int = 100,
+                 html_backend: Optional[str] = None, is_stale: Optional[Callable[[str], bool]] = None,
+                 store: Optional[DumpStore] = None):
+        self._nif = nif
+        self._folder = folder
+        self._post_fix = post_fix
+        self._max_depth = max_depth
+        self._max_pages = max_pages
+        self._html_backend = html_backend
+        self._store = store or LooseStore(os.path.dirname(folder))
+        self._is_stale = is_stale
+        self._root = normalize_url(url)
+        self._host = urlsplit(self._root).netloc if self._root is not None else ""
+        self._manifest = CrawlManifest(os.path.join(folder, f"{nif}{SiteCrawler.MANIFEST_POSTFIX}"))
+        self._frontier = []
+        self._counter = 0
+        self._attempts = 0
+        self._in_flight: Dict[str, int] = {}
+
+        for entry in list(self._manifest.entries.values()):
+            if entry["status"] == CrawlManifest.QUEUED:
+                self._push(entry["url"], entry["depth"])
+                continue
+            if entry["status"] == CrawlManifest.FETCHED and self._is_stale is not None and \
+                    self._is_stale(os.path.join(folder, entry["file"])):
+                self._push(entry["url"], entry["depth"])
+                continue
+            self._attempts += 1
+            if entry["status"] == CrawlManifest.FETCHED and not entry["expanded"] and entry["depth"] < max_depth:
+                # crawled with a smaller depth by a previous run
+                self._expand(FetchJob(nif, entry["url"], os.path.join(folder, entry["file"])), entry["depth"])
+
+        if self._root is not None and self._root not in self._manifest.entries:
+            self._enqueue(self._root, 0)
+
+    @property
+    def homepage_file(self) -> str:
+        return os.path.join(self._folder, f"{self._nif}_{self._post_fix}.html")
+
+    def _homepage_is_stale(self) -> bool:
+        # the homepage may have been downloaded by runs older than the crawl manifest
+        if self._is_stale is not None:
+            return self._is_stale(self.homepage_file)
+        return not self._store.exists(self.homepage_file)
+
+    def _file_for(self, url: str) -> str:
+        if url == self._root:
+            return self.homepage_file
+        return os.path.join(self._folder, page_file_name(self._nif, self._post_fix, url))
+
+    def _push(self, url: str, depth: int) -> None:
+        path = urlsplit(url).path.lower()
+        priority = 0 if any(hint in path for hint in _PRIORITY_HINTS) else 1
+        heapq.heappush(self._frontier, (depth, priority, self._counter, url))
+        self._counter += 1
+
+    def _enqueue(self, url: str, depth: int) -> None:
+        self._manifest.record(url, depth, CrawlManifest.QUEUED, os.path.basename(self._file_for(url)))
+        self._push(url, depth)
+
+    def next_jobs(self, limit: int) -> List[FetchJob]:
+        jobs = []
+        while len(self._frontier) > 0 and len(jobs) < limit and \
+                self._attempts + len(self._in_flight) < self._max_pages:
+            depth, _, _, url = heapq.heappop(self._frontier)
+            if url == self._root and not self._homepage_is_stale():
+                self.on_done(FetchJob(self._nif, url, self.homepage_file), True, depth)  # downloaded by older runs
+                continue
+            self._in_flight[url] = depth
+            jobs.append(FetchJob(self._nif, url, self._file_for(url)))
+        return jobs
+
+    def on_done(self, job: FetchJob, saved: bool, depth: Optional[int] = None) -> None:
+        depth = self._in_flight.pop(job.url) if depth is None else depth
+        self._attempts += 1
+        if saved:
+            self._expand(job, depth)
+        else:
+            self._manifest.record(job.url, depth, CrawlManifest.FAILED, os.path.basename(job.html_file))
+
+    def _expand(self, job: FetchJob, depth: int) -> None:
+        # links are queued before the page is marked as fetched, so none is lost if the run is interrupted
+        expanded = depth < self._max_depth
+        if expanded:
+            self._enqueue_links(job, depth + 1)
+        self._manifest.record(job.url, depth, CrawlManifest.FETCHED, os.path.basename(job.html_file), expanded)
+
+    def _enqueue_links(self, job: FetchJob, depth: int) -> None:
+        for link in get_html_backend(self._html_backend).links(self._store.read_chunks(job.html_file)):
+            url = normalize_url(link, base=job.url)
+            if url is None or url in self._manifest.entries or \
+                    not _same_site(urlsplit(url).netloc, self._host) or \
+                    urlsplit(url).path.lower().endswith(_SKIPPED_EXTENSIONS):
+                continue
+            self._enqueue(url, depth)
@@ -0,0 +1,121 @@
+import zlib
+from collections import OrderedDict, deque
+from typing import Deque, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
+
+from hotels_scraper.matcher import KeywordMatcher
+
+Sketch = FrozenSet[int]
+
+
+class BlockIndex:
+    """Keyword occurrences of every distinct text block seen by a worker.
+
+    Hotel websites repeat the same header, footer and cookie banner on every page: each block
+    is scanned by the matcher the first time it is seen and its occurrences are reused after
+    that, so only new text is scanned. Occurrences of a whole text are assembled from those of
+    its blocks and are the same as scanning it in full, so a block repeated on several pages
+    adds its occurrences on each of them. The index is emptied when it holds
+    more than `max_chars` characters; every pool worker has one index per flavor.
+    """
+
+    def __init__(self, matcher: KeywordMatcher, max_chars: int = 4_000_000):
+        self._matcher = matcher
+        self._max_chars = max_chars
+        self._blocks: Dict[str, Dict[str, Tuple[int, ...]]] = {}
+        self._chars = 0
+
+    @property
+    def matcher(self) -> KeywordMatcher:
+        return self._matcher
+
+    def occurrences(self, text: str, blocks: Optional[List[Tuple[int, str]]] = None) -> Dict[str, List[int]]:
+        blocks = self._matcher.split_blocks(text) if blocks is None else blocks
+        new_blocks = [block for block in dict.fromkeys(block for _, block in blocks) if block not in self._blocks]
+        if self._chars + sum(len(block) for block in new_blocks) > self._max_chars:
+            self._blocks.clear()
+            self._chars = 0
+            new_blocks = list(dict.fromkeys(block for _, block in blocks))
+        for block, block_occurrences in zip(new_blocks, self._matcher.block_occurrences(new_blocks)):
+            # dicts of tuples of ints are untracked by the garbage collector, a large index doesn't slow it down
+            self._blocks[block] = {keyword: tuple(offsets) for keyword, offsets in block_occurrences.items()}
+            self._chars += len(block)
+
+        occurrences = {}
+        for start, block in blocks:
+            for keyword, offsets in self._blocks[block].items():
+                occurrences.setdefault(keyword, []).extend(start + offset for offset in offsets)
+        return occurrences
+
+
+def lines(chunks: Iterable[str]) -> Iterator[str]:
+    """Lines of a text read in chunks, without their line breaks"""
+    partial = []  # start of a line that continues in the next chunk
+    for chunk in chunks:
+        for piece in chunk.splitlines(keepends=True):
+            line = piece.splitlines()[0]
+            partial.append(line)
+            if len(line) < len(piece):  # ends with a line break
+                yield "".join(partial)
+                partial = []
+    if len(partial) > 0:
+        yield "".join(partial)
+
+
+def sketch(blocks: Iterable[str], size: int = 64) -> Sketch:
+    """Bottom-k MinHash of a set of blocks, such as the lines of a page: the `size` smallest block hashes.
+
+    Blocks are hashed with CRC-32, not the salted `hash`, so sketches are the same in every process and run.
+    """
+    hashes = {zlib.crc32(block.encode("utf-8")) for block in blocks if block != "" and not block.isspace()}
+    return frozenset(sorted(hashes)[:size])
+
+
+def similarity(sketch: Sketch, other: Sketch, size: int = 64) -> float:
+    """Estimated Jaccard similarity of the sets of blocks of two sketches"""
+    union = sorted(sketch | other)[:size]
+    if len(union) == 0:
+        return 1.0
+    both = sketch & other
+    return sum(1 for value in union if value in both) / len(union)
+
+
+class NearDuplicates:
+    """Pages of one NIF, given in merge order, whose blocks are at least `threshold` similar to an earlier one.
+
+    Each page is compared with the last `max_sketches` pages kept, so a site costs at most that many
+    comparisons per page.
+    """
+
+    def __init__(self, threshold: float, max_sketches: int = 64):
+        self._threshold = threshold
+        self._kept: Deque[Sketch] = deque(maxlen=max_sketches)
+
+    def seen(self, page_sketch: Sketch) -> bool:
+        """Whether the page is a near duplicate of a page kept before, otherwise it is kept"""
+        if any(similarity(page_sketch, other) >= self._threshold for other in self._kept):
+            return True
+        self._kept.append(page_sketch)
+        return False
+
+
+class PageMemo:
+    """Results of the pages recently processed by a worker.
+
+    Identical pages are recognized by their content hash and get the stored results, so repeated
+    pages are parsed once. At most `max_pages` results are kept.
+    """
+
+    def __init__(self, max_pages: int = 4096):
+        self._max_pages = max_pages
+        self._results: OrderedDict = OrderedDict()  # (fingerprint, content hash) -> results
+
+    def get(self, fingerprint: str, content_hash: str) -> Optional[Dict]:
+        results = self._results.get((fingerprint, content_hash))
+        if results is not None:
+            self._results.move_to_end((fingerprint, content_hash))
+        return results
+
+    def put(self, fingerprint: str, content_hash: str, results: Dict) -> None:
+        self._results[(fingerprint, content_hash)] = results
+        if len(self._results) > self._max_pages:
+            self._results.popitem(last=False)
@@ -1,25 +1,74 @@
+import logging
 import os
-import subprocess
-from typing import Optional
-from urllib.parse import urlparse
+from typing import TYPE_CHECKING, Dict, List, Optional
 
-import pandas as pd
-from bs4 import BeautifulSoup
-from tqdm import tqdm
+from hotels_scraper.booking import validate_booking_page
+from hotels_scraper.crawler import SiteCrawler
+from hotels_scraper.enums import Flavor
+from hotels_scraper.fetchers import FETCHERS, BrowserFetcher, Fetcher, HttpFetcher
+from hotels_scraper.google import validate_google_page
+from hotels_scraper.manifest import FetchManifest
+from hotels_scraper.profiling import Profiler
+from hotels_scraper.scheduler import DownloadScheduler, FetchJob, PageValidator
+from hotels_scraper.storage import open_store
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
 
 
 class Downloader:
     __LIMIT: Optional[int] = None
+    _CRAWL_WAVE_SIZE = 8
+    DEFAULT_FETCHERS: Dict[Flavor, str] = {
+        Flavor.EMPRESA: HttpFetcher.name,
+        Flavor.BOOKING: BrowserFetcher.name,
+        Flavor.GOOGLE: BrowserFetcher.name,
+    }
+    # pages of these flavors are fetched again until they have what the parser needs
+    PAGE_VALIDATORS: Dict[Flavor, PageValidator] = {
+        Flavor.BOOKING: validate_booking_page,
+        Flavor.GOOGLE: validate_google_page,
+    }
 
-    def __init__(self, output_folder: str):
+    def __init__(self, output_folder: str, html_backend: Optional[str] = None, concurrency: int = 8,
+                 per_host_concurrency: int = 2, fetcher: Optional[str] = None, crawl_depth: int = 1,
+                 crawl_budget: int = 100, profiler: Optional[Profiler] = None,
+                 refresh_older_than: Optional[float] = None, dump_format: Optional[str] = None,
+                 rate_per_host: Optional[float] = None, max_retries: int = 4):
         self._output_folder = output_folder
+        self._html_backend = html_backend
+        self._store = open_store(output_folder, dump_format)
+        self._manifest = FetchManifest(Downloader.manifest_path(output_folder), self._store)
+        self._scheduler = DownloadScheduler(concurrency, per_host_concurrency, profiler, self._manifest, self._store,
+                                            rate_per_host, max_retries)
+        self._fetcher = fetcher
+        self._crawl_depth = crawl_depth
+        self._crawl_budget = crawl_budget
+        self._refresh_older_than = refresh_older_than
+
+    @staticmethod
+    def manifest_path(output_folder: str) -> str:
+        return os.path.normpath(output_folder) + ".fetch.jsonl"
+
+    def _is_stale(self, html_file: str) -> bool:
+        # without --refresh-older-than only missing pages are downloaded
+        return self._manifest.is_stale(html_file, self._refresh_older_than)
+
+    def _create_fetcher(self, post_fix: str) -> Fetcher:
+        name = self._fetcher or Downloader.DEFAULT_FETCHERS[Flavor(post_fix)]
+        return FETCHERS[name]()
+
+    def download_htmls(self, df: "pd.DataFrame", url_column: str, post_fix: str) -> None:
+        import pandas as pd
 
-    def download_htmls(self, df: pd.DataFrame, url_column: str, post_fix: str) -> None:
         counter = 0
+        pages = []
 
         for nif, url in df[url_column].items():
             if pd.isna(url) or url == "":
-                print(f"{nif} no tiene información en {url_column}")
+                logger.warning(f"{nif} no tiene información en {url_column}", extra={"nif": nif})
                 continue
 
             url = url.split("?")[0]
@@ -27,50 +76,39 @@ class Downloader:
             this_web_folder = os.path.join(self._output_folder, nif)
             os.makedirs(this_web_folder, exist_ok=True)
             html_file = os.path.join(this_web_folder, f"{nif}_{post_fix}.html")
-            print(f"[{counter}] Procesando {nif} x {url_column}")
-            if not os.path.exists(html_file):
-                subprocess.call(
-                    f"shot-scraper html {url} -o \"{html_file}\" --wait 500 --browser firefox --locale es-ES")
-
-            if post_fix == "Empresa" and os.path.exists(html_file):
-                self._download_internal_links(html_file, url, nif, post_fix)
+            logger.debug(f"[{counter}] Procesando {nif} x {url_column}")
+            pages.append(FetchJob(nif, url, html_file))
 
             counter += 1
             if self.__LIMIT is not None and counter > self.__LIMIT:
                 break
 
-    def _download_internal_links(self, html_file: str, url: str, nif: str, post_fix: str) -> None:
-        parsed_url = urlparse(url)
-        main_url = parsed_url.scheme + "://" + parsed_url.hostname
-
-        with open(html_file, "r", encoding="utf-8") as f:
-            html_content = f.read()
-            soup = BeautifulSoup(html_content, "html.parser")
-            links = [a["href"] for a in soup.find_all("a", href=True)]
-            links = {link for link in links if (link.startswith(main_url) or link.startswith("/"))
-                     and not link.endswith("pdf")
-                     and not link.endswith("jpg")
-                     and not link.endswith("png")
-                     and not link.endswith("mp4")}
-            this_web_folder = os.path.join(self._output_folder, nif)
-            if len(links) > 0:
-                for link in tqdm(links, desc=f"Internal links of {nif}"):
-                    if link.endswith("/"):
-                        link = link[:-1]
-
-                    link = link.split("?")[0]
-                    page_name = os.path.basename(link)
-                    page_name = page_name.replace("\n", "")
-                    if page_name == "" or \
-                            page_name.startswith("?") or \
-                            page_name.startswith("#") or \
-                            page_name.startswith("@"):
-                        continue
-                    link = link.replace("\n", "")
-                    if link.startswith("/"):
-                        link = main_url + link
-
-                    html_file = os.path.join(this_web_folder, f"{nif}_{post_fix}_{page_name}.html")
-                    if not os.path.exists(html_file):
-                        subprocess.call(
-                            f"shot-scraper html {link} -o \"{html_file}\" --wait 500 --browser firefox --locale es-ES")
+        fetcher = self._create_fetcher(post_fix)
+        if post_fix == "Empresa":
+            self._crawl(pages, post_fix, fetcher)
+        else:
+            jobs = [page for page in pages if self._is_stale(page.html_file)]
+            self._scheduler.run(jobs, fetcher, desc=f"Downloading {url_column}", flavor=post_fix,
+                                validate=Downloader.PAGE_VALIDATORS.get(Flavor(post_fix)))
+
+    def _crawl(self, pages: List[FetchJob], post_fix: str, fetcher: Fetcher) -> None:
+        # the pages a crawl manifest records as fetched are only checked when they have to be refreshed
+        is_stale = self._is_stale if self._refresh_older_than is not None else None
+        crawlers = [SiteCrawler(page.nif, page.url, os.path.dirname(page.html_file), post_fix, self._crawl_depth,
+                                self._crawl_budget, self._html_backend, is_stale, self._store)
+                    for page in pages]
+
+        # every wave takes the best pages from the frontier of each site until all of them are exhausted
+        wave = 0
+        while True:
+            owners = {}
+            for crawler in crawlers:
+                for job in crawler.next_jobs(Downloader._CRAWL_WAVE_SIZE):
+                    owners[job.html_file] = (job, crawler)
+            if len(owners) == 0:
+                break
+
+            self._scheduler.run([job for job, _ in owners.values()], fetcher, desc=f"Crawling (wave {wave})",
+                                on_done=lambda job, saved: owners[job.html_file][1].on_done(job, saved),
+                                flavor=post_fix)
+            wave += 1
@@ -1,4 +1,5 @@
 from enum import Enum
+from typing import Dict, NamedTuple
 
 
 class ExtractionTypes(str, Enum):
@@ -164,3 +165,25 @@ BookingColumnsIndicators = ['community_art', 'community_ecosystem', 'community_i
                             'waste_bins', 'waste_drink_bottle', 'waste_food', 'waste_mini_toil', 'waste_plates',
                             'waste_reusable_cups', 'waste_stirrer', 'waste_straw', 'waste_water_bottle',
                             'waste_water_cooler', 'water_cleaning', 'water_shower', 'water_toilet', 'water_towel']
+
+
+class BookingFacility(NamedTuple):
+    indicator: str  # e.g. Booking_Agua
+    column: str  # one-hot column, e.g. water_towel
+    text: str  # added to the context of the indicator
+
+
+def _index_booking_facilities() -> Dict[str, BookingFacility]:
+    columns = {text: column for splits in BookingPropertySustainabilitySplits.values() for text, column in splits.items()}
+    index = {}
+    for property_id, property_key in BookingPropertySustainabilityFacilityMapping.items():
+        for indicator, prefix in BookingSustainabilityMapping.items():
+            if property_key.startswith(prefix):
+                text = BookingPropertySustainabilityTextMapping[property_key]
+                index[property_id] = BookingFacility(indicator, columns[text], text)
+                break
+    return index
+
+
+# facility id -> indicator, one-hot column and context text, resolved once instead of per page
+BookingFacilityIndex = _index_booking_facilities()
@@ -0,0 +1,113 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Dict, NamedTuple, Optional
+
+DEFAULT_USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/115.0"
+DEFAULT_LOCALE = "es-ES"
+
+
+class FetchError(RuntimeError):
+    pass
+
+
+class FetchResponse(NamedTuple):
+    status: int
+    text: str
+    headers: Dict[str, str]
+
+
+class Fetcher(ABC):
+    """Fetch strategy that keeps one long-lived session open for many pages.
+
+    Fetchers are async context managers: the session is opened on enter and closed on exit.
+    Those with `conditional` set send the given request headers, so a page can be revalidated
+    with If-None-Match/If-Modified-Since and answered with a 304 and no body.
+    """
+    name = ""
+    conditional = False
+
+    async def __aenter__(self) -> "Fetcher":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        pass
+
+    @abstractmethod
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> FetchResponse:
+        pass
+
+
+class HttpFetcher(Fetcher):
+    """Plain HTTP client, enough for company websites that don't need JavaScript"""
+    name = "http"
+    conditional = True
+
+    def __init__(self, timeout: float = 30, user_agent: str = DEFAULT_USER_AGENT, locale: str = DEFAULT_LOCALE):
+        self._timeout = timeout
+        self._headers = {"User-Agent": user_agent, "Accept-Language": f"{locale},{locale.split('-')[0]};q=0.9"}
+        self._session = None
+
+    async def __aenter__(self) -> "HttpFetcher":
+        import aiohttp
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self._timeout),
+                                              headers=self._headers)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._session.close()
+        self._session = None
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> FetchResponse:
+        import aiohttp
+        try:
+            async with self._session.get(url, headers=headers) as response:
+                text = await response.text(errors="replace")
+                return FetchResponse(response.status, text, dict(response.headers))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise FetchError(str(e) or type(e).__name__)
+
+
+class BrowserFetcher(Fetcher):
+    """Headless browser shared by all pages, needed by Booking and Google which render with JavaScript"""
+    name = "browser"
+
+    def __init__(self, browser: str = "firefox", locale: str = DEFAULT_LOCALE, wait: int = 500,
+                 timeout: float = 60):
+        self._browser_name = browser
+        self._locale = locale
+        self._wait = wait
+        self._timeout = timeout
+        self._playwright = None
+        self._browser = None
+        self._context = None
+
+    async def __aenter__(self) -> "BrowserFetcher":
+        from playwright.async_api import async_playwright
+        self._playwright = await async_playwright().start()
+        self._browser = await getattr(self._playwright, self._browser_name).launch()
+        self._context = await self._browser.new_context(locale=self._locale)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._context.close()
+        await self._browser.close()
+        await self._playwright.stop()
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> FetchResponse:
+        # the browser manages its own cache, so pages are always downloaded in full
+        from playwright.async_api import Error as PlaywrightError
+        page = await self._context.new_page()
+        try:
+            response = await page.goto(url, timeout=self._timeout * 1000)
+            await page.wait_for_timeout(self._wait)
+            text = await page.content()
+            if response is None:
+                return FetchResponse(200, text, {})
+            return FetchResponse(response.status, text, await response.all_headers())
+        except PlaywrightError as e:
+            raise FetchError(str(e))
+        finally:
+            await page.close()
+
+
+FETCHERS = {fetcher.name: fetcher for fetcher in [HttpFetcher, BrowserFetcher]}
@@ -0,0 +1,42 @@
+import re
+from typing import Dict, NamedTuple, Optional
+
+from hotels_scraper.html_backends import GoogleNodes, HeadingNode, LabelledNode
+
+_STARS_REGEX = re.compile(r"([\d,\.]+) de 5 estrellas a partir de ([\d\.]+) reseñas")
+_BLOCKED_MARKERS = ("g-recaptcha", "/sorry/index", "unusual traffic", "tráfico inusual")
+
+
+class GoogleIndex(NamedTuple):
+    """Google Hotels nodes indexed for constant time lookups by keyword"""
+    headings: Dict[str, HeadingNode]  # lowercased h4 text -> first heading with it
+    labels: Dict[str, LabelledNode]  # lowercased aria-label -> first div with it
+    score: Optional[str]
+    reviews: Optional[str]
+
+
+def index_google(nodes: GoogleNodes) -> GoogleIndex:
+    """Indexes the nodes of a page in a single pass, keeping the first node of each key like a scan would"""
+    headings = {}
+    for heading in nodes.headings:
+        headings.setdefault(heading.text.lower(), heading)
+
+    labels = {}
+    score = None
+    reviews = None
+    for div in nodes.labelled_divs:
+        labels.setdefault(div.aria_label.lower(), div)
+        if score is None:
+            regex_result = _STARS_REGEX.match(div.aria_label)
+            if regex_result is not None:
+                score, reviews = regex_result.group(1), regex_result.group(2)
+
+    return GoogleIndex(headings, labels, score, reviews)
+
+
+def validate_google_page(text: str) -> Optional[str]:
+    """Why a fetched page is not a Google Hotels page, None if it is: Google answers bots with a captcha page"""
+    for marker in _BLOCKED_MARKERS:
+        if marker in text:
+            return f"blocked page ({marker})"
+    return None
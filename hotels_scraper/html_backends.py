@@ -0,0 +1,578 @@
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from html.parser import HTMLParser
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+BOOKING_BANNER_TESTID = "sustainability-banner-container"
+BOOKING_REVIEW_COMPONENT = "PropertyReviewScoreRight"
+BOOKING_STATE_MARKER = "chainProgrammes"  # only in the Apollo state script, with the sustainability data
+BOOKING_FACILITY_MARKER = "PropertySustainabilityFacility"
+HEADING_TAGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+
+_VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source",
+                  "track", "wbr"}
+_HIDDEN_ELEMENTS = {"script", "style", "template"}
+
+
+HtmlSource = Union[str, Iterable[str]]  # a whole page or its successive chunks, see `DumpStore.read_chunks`
+
+
+def _joined(html: HtmlSource) -> str:
+    return html if isinstance(html, str) else "".join(html)
+
+
+class ScriptNode(NamedTuple):
+    type: Optional[str]
+    body: str
+
+
+class PageText(NamedTuple):
+    text: str
+    headings: List[Tuple[int, int]]  # start and end offsets in `text` of the h1-h6 elements
+
+
+class LabelledNode(NamedTuple):
+    aria_label: Optional[str]
+    text: str
+
+
+class HeadingNode(NamedTuple):
+    text: str
+    sibling_strings: List[str]
+
+
+class BookingNodes(NamedTuple):
+    banners: int
+    scripts: List[ScriptNode]
+    review_blocks: List[List[LabelledNode]]
+
+
+class GoogleNodes(NamedTuple):
+    headings: List[HeadingNode]
+    labelled_divs: List[LabelledNode]
+
+
+class BookingProgress:
+    """Whether the parts of a Booking page the parser reads have been seen.
+
+    They are the Apollo state script, the review score block and, when the state lists
+    sustainability facilities, their banner; the rest of the page (rooms, photos and reviews)
+    is much larger and not needed, so reading stops there. Anything repeated after that point,
+    like a second banner, isn't seen.
+    """
+
+    def __init__(self):
+        self._state = False
+        self._facilities = False
+        self._banner = False
+        self._review = False
+
+    @property
+    def complete(self) -> bool:
+        return self._state and self._review and (self._banner or not self._facilities)
+
+    def script(self, script_type: Optional[str], body: str) -> None:
+        if script_type == "application/json" and BOOKING_STATE_MARKER in body:
+            self._state = True
+            self._facilities = self._facilities or BOOKING_FACILITY_MARKER in body
+
+    def banner(self) -> None:
+        self._banner = True
+
+    def review_block(self) -> None:
+        self._review = True
+
+
+class HtmlBackend(ABC):
+    """Extracts what each flavor needs from a page, given whole or in chunks.
+
+    Chunks are consumed as the page is parsed, so the page is never held whole by the backends
+    that parse incrementally; `booking_nodes` stops reading once `BookingProgress` is complete.
+    """
+    name = ""
+
+    @abstractmethod
+    def text(self, html: HtmlSource) -> str:
+        """Visible text of the page, without script, style and template contents"""
+
+    @abstractmethod
+    def page_text(self, html: HtmlSource) -> PageText:
+        """Visible text of the page, the same as `text`, with the spans of its headings"""
+
+    @abstractmethod
+    def links(self, html: HtmlSource) -> List[str]:
+        """`href` of every `<a>` element, in document order"""
+
+    @abstractmethod
+    def booking_nodes(self, html: HtmlSource) -> BookingNodes:
+        pass
+
+    @abstractmethod
+    def google_nodes(self, html: HtmlSource) -> GoogleNodes:
+        pass
+
+
+class SoupBackend(HtmlBackend):
+    """Reference backend building a full BeautifulSoup tree with `html.parser`"""
+    name = "soup"
+
+    def text(self, html: HtmlSource) -> str:
+        return self._soup(html).text
+
+    def page_text(self, html: HtmlSource) -> PageText:
+        strings = []
+        headings = []
+        length = 0
+        current = None
+        for string in self._soup(html).strings:
+            heading = string.find_parent(HEADING_TAGS)
+            if heading is not None:
+                if heading is current:
+                    headings[-1] = (headings[-1][0], length + len(string))
+                else:
+                    headings.append((length, length + len(string)))
+            current = heading
+            strings.append(string)
+            length += len(string)
+        return PageText("".join(strings), headings)
+
+    def links(self, html: HtmlSource) -> List[str]:
+        return [a["href"] for a in self._soup(html).find_all("a", href=True)]
+
+    def booking_nodes(self, html: HtmlSource) -> BookingNodes:
+        soup = self._soup(html)
+        all_divs = soup.find_all("div")
+        banners = len([div for div in all_divs if div.attrs.get("data-testid") == BOOKING_BANNER_TESTID])
+        scripts = [ScriptNode(script.attrs.get("type"), script.text) for script in soup.find_all("script")]
+        review_blocks = []
+        for div in all_divs:
+            if div.attrs.get("data-capla-component", "").endswith(BOOKING_REVIEW_COMPONENT):
+                children = div.find_all(recursive=False)
+                review_blocks.append([] if len(children) == 0 else
+                                     [LabelledNode(d.attrs.get("aria-label"), d.text) for d in children[0].find_all("div")])
+        return BookingNodes(banners, scripts, review_blocks)
+
+    def google_nodes(self, html: HtmlSource) -> GoogleNodes:
+        soup = self._soup(html)
+        headings = []
+        for h4 in soup.find_all("h4"):
+            sibling = h4.nextSibling
+            headings.append(HeadingNode(h4.text, [] if sibling is None else list(sibling.strings)))
+        labelled_divs = [LabelledNode(div.attrs["aria-label"], div.text)
+                         for div in soup.find_all("div") if "aria-label" in div.attrs]
+        return GoogleNodes(headings, labelled_divs)
+
+    @staticmethod
+    def _soup(html: HtmlSource):
+        from bs4 import BeautifulSoup
+        return BeautifulSoup(_joined(html), "html.parser")
+
+
+class LxmlBackend(HtmlBackend):
+    """Fast C tree built with lxml, only available when lxml is installed"""
+    name = "lxml"
+    _VISIBLE_TEXT = ".//text()[not(ancestor::script) and not(ancestor::style) and not(ancestor::template)]"
+    _VISIBLE_TEXT_AND_HEADINGS = _VISIBLE_TEXT + "".join(" | .//" + tag for tag in HEADING_TAGS)
+
+    def __init__(self):
+        import lxml.etree
+        import lxml.html
+        self._lxml_etree = lxml.etree
+        self._lxml_html = lxml.html
+
+    def text(self, html: HtmlSource) -> str:
+        return "".join(self._document(html).xpath(LxmlBackend._VISIBLE_TEXT))
+
+    def page_text(self, html: HtmlSource) -> PageText:
+        strings = []
+        headings = []
+        length = 0
+        # headings come before their own text in document order
+        for item in self._document(html).xpath(LxmlBackend._VISIBLE_TEXT_AND_HEADINGS):
+            if isinstance(item, str):
+                strings.append(item)
+                length += len(item)
+            elif len(headings) == 0 or length >= headings[-1][1]:  # nested headings are part of the outer one
+                end = length + sum(len(string) for string in item.xpath(LxmlBackend._VISIBLE_TEXT))
+                if end > length:
+                    headings.append((length, end))
+        return PageText("".join(strings), headings)
+
+    def links(self, html: HtmlSource) -> List[str]:
+        return [str(href) for href in self._document(html).xpath("//a/@href")]
+
+    def booking_nodes(self, html: HtmlSource) -> BookingNodes:
+        document = self._booking_document(html)
+        banners = len(document.xpath(f"//div[@data-testid='{BOOKING_BANNER_TESTID}']"))
+        scripts = [ScriptNode(script.get("type"), script.text or "") for script in document.iter("script")]
+        review_blocks = []
+        for div in document.xpath("//div[@data-capla-component]"):
+            if div.get("data-capla-component").endswith(BOOKING_REVIEW_COMPONENT):
+                review_blocks.append([] if len(div) == 0 else
+                                     [LabelledNode(d.get("aria-label"), self._element_text(d))
+                                      for d in div[0].iterdescendants("div")])
+        return BookingNodes(banners, scripts, review_blocks)
+
+    def google_nodes(self, html: HtmlSource) -> GoogleNodes:
+        document = self._document(html)
+        headings = []
+        for h4 in document.iter("h4"):
+            if h4.tail:
+                sibling_strings = [h4.tail]
+            elif h4.getnext() is not None:
+                sibling_strings = [str(s) for s in h4.getnext().xpath(LxmlBackend._VISIBLE_TEXT)]
+            else:
+                sibling_strings = []
+            headings.append(HeadingNode(self._element_text(h4), sibling_strings))
+        labelled_divs = [LabelledNode(div.get("aria-label"), self._element_text(div))
+                         for div in document.xpath("//div[@aria-label]")]
+        return GoogleNodes(headings, labelled_divs)
+
+    def _document(self, html: HtmlSource):
+        if isinstance(html, str):
+            return self._parsed(lambda: self._lxml_html.document_fromstring(html))
+        parser = self._lxml_html.HTMLParser()
+        for chunk in html:
+            self._parsed(lambda: parser.feed(chunk))
+        return self._parsed(parser.close)
+
+    def _booking_document(self, html: HtmlSource):
+        """Document of a Booking page, read until `BookingProgress` is complete"""
+        if isinstance(html, str):
+            return self._document(html)  # already read whole
+        parser = self._lxml_etree.HTMLPullParser(events=("end",), tag=("script", "div"))
+        progress = BookingProgress()
+        for chunk in html:
+            self._parsed(lambda: parser.feed(chunk))
+            for _, element in parser.read_events():
+                if element.tag == "script":
+                    progress.script(element.get("type"), element.text or "")
+                elif element.get("data-testid") == BOOKING_BANNER_TESTID:
+                    progress.banner()
+                elif (element.get("data-capla-component") or "").endswith(BOOKING_REVIEW_COMPONENT):
+                    progress.review_block()
+            if progress.complete:
+                break
+        return self._parsed(parser.close)
+
+    @staticmethod
+    def _parsed(parse: Callable):
+        try:
+            return parse()
+        except Exception as e:  # lxml raises several types for empty or broken documents
+            raise RuntimeError(f"lxml can't parse the document: {e}")
+
+    @staticmethod
+    def _element_text(element) -> str:
+        return "".join(element.xpath(LxmlBackend._VISIBLE_TEXT))
+
+
+class _Capture:
+    def __init__(self, depth: int, on_close: Callable[[List[str]], None]):
+        self.depth = depth
+        self.strings = []
+        self.on_close = on_close
+
+
+class _StreamExtractor(HTMLParser, ABC):
+    """Event-driven extractor that keeps an element stack but never builds a tree.
+
+    Subclasses react to start tags and open captures, which collect the visible strings
+    of an element until it is closed. Text split across fed chunks is delivered whole.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._stack = []
+        self._hidden = 0
+        self._captures = []
+        self._data = []
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self._flush_data()
+        self.on_start(tag, dict(attrs))
+        if tag in _VOID_ELEMENTS:
+            self._close_captures(len(self._stack))
+            return
+        self._stack.append(tag)
+        if tag in _HIDDEN_ELEMENTS:
+            self._hidden += 1
+
+    def handle_startendtag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.handle_starttag(tag, attrs)
+        if tag not in _VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag: str) -> None:
+        self._flush_data()
+        if tag not in self._stack:
+            return  # stray closing tag
+        while len(self._stack) > 0:
+            open_tag = self._stack.pop()
+            if open_tag in _HIDDEN_ELEMENTS:
+                self._hidden -= 1
+            self.on_end(open_tag, len(self._stack))
+            self._close_captures(len(self._stack))
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data: str) -> None:
+        self._data.append(data)
+
+    def handle_comment(self, data: str) -> None:
+        self._flush_data()
+
+    def handle_decl(self, decl: str) -> None:
+        self._flush_data()
+
+    def handle_pi(self, data: str) -> None:
+        self._flush_data()
+
+    def unknown_decl(self, data: str) -> None:
+        self._flush_data()
+
+    def _flush_data(self) -> None:
+        if len(self._data) == 0:
+            return
+        data = "".join(self._data)
+        self._data = []
+        if self._hidden > 0:
+            self.on_hidden_data(data)
+            return
+        self.on_data(data)
+        for capture in self._captures:
+            capture.strings.append(data)
+
+    def open_capture(self, on_close: Callable[[List[str]], None]) -> None:
+        self._captures.append(_Capture(len(self._stack), on_close))
+
+    def open_slot_capture(self, nodes: List, build: Callable[[List[str]], object]) -> None:
+        """Reserves a slot in `nodes` so nested elements keep document order once closed"""
+        index = len(nodes)
+        nodes.append(None)
+        self.open_capture(lambda strings: nodes.__setitem__(index, build(strings)))
+
+    @property
+    def depth(self) -> int:
+        return len(self._stack)
+
+    @property
+    def complete(self) -> bool:
+        """Whether the rest of the page can be skipped"""
+        return False
+
+    def extract(self, html: HtmlSource):
+        for chunk in [html] if isinstance(html, str) else html:
+            self.feed(chunk)
+            if self.complete:
+                break
+        self.close()
+        self._flush_data()
+        while len(self._stack) > 0:  # close elements left open at the end of the document
+            self.handle_endtag(self._stack[0])
+        return self.result()
+
+    def on_start(self, tag: str, attrs: Dict[str, Optional[str]]) -> None:
+        pass
+
+    def on_end(self, tag: str, depth: int) -> None:
+        pass
+
+    def on_data(self, data: str) -> None:
+        pass
+
+    def on_hidden_data(self, data: str) -> None:
+        pass
+
+    @abstractmethod
+    def result(self):
+        """What was extracted from the chunks fed so far"""
+
+    def _close_captures(self, depth: int) -> None:
+        while len(self._captures) > 0 and self._captures[-1].depth >= depth:
+            capture = self._captures.pop()
+            capture.on_close(capture.strings)
+
+
+class _TextExtractor(_StreamExtractor):
+    def __init__(self):
+        super().__init__()
+        self._strings = []
+
+    def on_data(self, data: str) -> None:
+        self._strings.append(data)
+
+    def result(self) -> str:
+        return "".join(self._strings)
+
+
+class _PageTextExtractor(_TextExtractor):
+    def __init__(self):
+        super().__init__()
+        self._length = 0
+        self._headings = []
+        self._heading_start = None
+        self._heading_depth = None
+
+    def on_start(self, tag: str, attrs: Dict[str, Optional[str]]) -> None:
+        if tag in HEADING_TAGS and self._heading_depth is None and tag not in _VOID_ELEMENTS:
+            self._heading_start = self._length
+            self._heading_depth = self.depth
+
+    def on_end(self, tag: str, depth: int) -> None:
+        if self._heading_depth is not None and depth == self._heading_depth:
+            if self._length > self._heading_start:
+                self._headings.append((self._heading_start, self._length))
+            self._heading_depth = None
+
+    def on_data(self, data: str) -> None:
+        super().on_data(data)
+        self._length += len(data)
+
+    def result(self) -> PageText:
+        return PageText(super().result(), self._headings)
+
+
+class _LinkExtractor(_StreamExtractor):
+    def __init__(self):
+        super().__init__()
+        self._links = []
+
+    def on_start(self, tag: str, attrs: Dict[str, Optional[str]]) -> None:
+        if tag == "a" and attrs.get("href") is not None:
+            self._links.append(attrs["href"])
+
+    def result(self) -> List[str]:
+        return self._links
+
+
+class _BookingExtractor(_StreamExtractor):
+    def __init__(self):
+        super().__init__()
+        self._banners = 0
+        self._scripts = []
+        self._script_type = None
+        self._script_body = None
+        self._review_blocks = []
+        self._review_depth = None
+        self._review_root_depth = None
+        self._progress = BookingProgress()
+
+    @property
+    def complete(self) -> bool:
+        return self._progress.complete
+
+    def on_start(self, tag: str, attrs: Dict[str, Optional[str]]) -> None:
+        if tag == "script":
+            self._script_type = attrs.get("type")
+            self._script_body = []
+        elif tag == "div":
+            if attrs.get("data-testid") == BOOKING_BANNER_TESTID:
+                self._banners += 1
+                self._progress.banner()
+            if self._review_root_depth is not None and self.depth > self._review_root_depth:
+                aria_label = attrs.get("aria-label")
+                self.open_slot_capture(self._review_blocks[-1], lambda strings: LabelledNode(aria_label, "".join(strings)))
+            if (attrs.get("data-capla-component") or "").endswith(BOOKING_REVIEW_COMPONENT):
+                self._review_blocks.append([])
+                self._review_depth = self.depth
+                self._review_root_depth = None
+
+        if self._review_depth is not None and self._review_root_depth is None and self.depth == self._review_depth + 1:
+            self._review_root_depth = self.depth  # first child element of the review component
+
+    def on_end(self, tag: str, depth: int) -> None:
+        if tag == "script" and self._script_body is not None:
+            self._scripts.append(ScriptNode(self._script_type, "".join(self._script_body)))
+            self._progress.script(self._script_type, self._scripts[-1].body)
+            self._script_body = None
+        if self._review_root_depth is not None and depth == self._review_root_depth:
+            self._review_root_depth = None
+            self._review_depth = None
+            self._progress.review_block()  # only the first child of the review component is read
+        elif self._review_depth is not None and depth == self._review_depth:
+            self._review_depth = None
+            self._progress.review_block()
+
+    def on_hidden_data(self, data: str) -> None:
+        if self._script_body is not None:
+            self._script_body.append(data)
+
+    def result(self) -> BookingNodes:
+        return BookingNodes(self._banners, self._scripts, self._review_blocks)
+
+
+class _GoogleExtractor(_StreamExtractor):
+    def __init__(self):
+        super().__init__()
+        self._headings = []
+        self._labelled_divs = []
+        self._pending_heading = None
+        self._pending_depth = None
+
+    def on_start(self, tag: str, attrs: Dict[str, Optional[str]]) -> None:
+        if self._pending_heading is not None and self.depth == self._pending_depth:
+            heading = self._pending_heading
+            self._pending_heading = None
+            self.open_capture(lambda strings: heading.sibling_strings.extend(strings))
+
+        if tag == "h4":
+            self.open_capture(self._on_heading)
+        elif tag == "div" and "aria-label" in attrs:
+            aria_label = attrs["aria-label"] or ""
+            self.open_slot_capture(self._labelled_divs, lambda strings: LabelledNode(aria_label, "".join(strings)))
+
+    def on_end(self, tag: str, depth: int) -> None:
+        if self._pending_heading is not None and depth < self._pending_depth:
+            self._pending_heading = None  # the heading was the last child
+
+    def on_data(self, data: str) -> None:
+        if self._pending_heading is not None and self.depth == self._pending_depth:
+            self._pending_heading.sibling_strings.append(data)
+            self._pending_heading = None
+
+    def _on_heading(self, strings: List[str]) -> None:
+        heading = HeadingNode("".join(strings), [])
+        self._headings.append(heading)
+        self._pending_heading = heading
+        self._pending_depth = self.depth
+
+    def result(self) -> GoogleNodes:
+        return GoogleNodes(self._headings, self._labelled_divs)
+
+
+class StreamBackend(HtmlBackend):
+    """Pure standard library backend based on `html.parser.HTMLParser` events"""
+    name = "stream"
+
+    def text(self, html: HtmlSource) -> str:
+        return _TextExtractor().extract(html)
+
+    def page_text(self, html: HtmlSource) -> PageText:
+        return _PageTextExtractor().extract(html)
+
+    def links(self, html: HtmlSource) -> List[str]:
+        return _LinkExtractor().extract(html)
+
+    def booking_nodes(self, html: HtmlSource) -> BookingNodes:
+        return _BookingExtractor().extract(html)
+
+    def google_nodes(self, html: HtmlSource) -> GoogleNodes:
+        return _GoogleExtractor().extract(html)
+
+
+HTML_BACKENDS = {backend.name: backend for backend in [LxmlBackend, StreamBackend, SoupBackend]}
+
+
+@lru_cache(maxsize=None)
+def get_html_backend(name: Optional[str] = None) -> HtmlBackend:
+    """Returns the requested backend, or the fastest one installed when `name` is None"""
+    if name is not None:
+        if name not in HTML_BACKENDS:
+            raise ValueError(f"HTML backend not supported: {name}")
+        return HTML_BACKENDS[name]()
+
+    try:
+        return LxmlBackend()
+    except ImportError:
+        return StreamBackend()
@@ -0,0 +1,143 @@
+import csv
+import hashlib
+import logging
+import os
+import pickle
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from hotels_scraper.enums import ExtractionTypes, Flavor
+from hotels_scraper.matcher import KeywordMatcher
+
+logger = logging.getLogger(__name__)
+
+
+class IndicatorRegistry(Mapping):
+    """Indicator definitions per flavor, validated once and compiled into keyword matchers.
+
+    It is the {flavor: {name: {"keywords": [...], "extract": ExtractionTypes}}} mapping used
+    across the package. Registries loaded from a CSV are cached in a pickle next to it, which
+    is reused while the CSV doesn't change. With `stemming`, the matchers also find the singular
+    and plural forms of the keywords.
+    """
+    VERSION = 3
+    COLUMNS = ["Web", "Identificador", "Búsqueda", "Extracción"]
+    CACHE_SUFFIX = ".registry.pickle"
+
+    def __init__(self, definitions: Dict[Flavor, Dict[str, Dict]],
+                 matchers: Optional[Dict[Flavor, KeywordMatcher]] = None, stemming: bool = False):
+        self._definitions = definitions
+        self._stemming = stemming
+        matchers = {flavor: matcher for flavor, matcher in (matchers or {}).items() if matcher.stemming == stemming}
+        # only the Empresa flavor searches keywords in free text
+        self._matchers = {flavor: matchers.get(flavor) or KeywordMatcher.from_indicators(definitions[flavor], stemming)
+                          for flavor in definitions if flavor == Flavor.EMPRESA}
+
+    def __getitem__(self, flavor: Flavor) -> Dict[str, Dict]:
+        return self._definitions[flavor]
+
+    def __iter__(self) -> Iterator[Flavor]:
+        return iter(self._definitions)
+
+    def __len__(self) -> int:
+        return len(self._definitions)
+
+    @property
+    def matchers(self) -> Dict[Flavor, KeywordMatcher]:
+        return self._matchers
+
+    @property
+    def stemming(self) -> bool:
+        return self._stemming
+
+    def select(self, flavors: Optional[Iterable[Flavor]], stemming: Optional[bool] = None) -> "IndicatorRegistry":
+        """Registry restricted to `flavors`, all of them when None, and with `stemming` when given"""
+        stemming = self._stemming if stemming is None else stemming
+        if flavors is None and stemming == self._stemming:
+            return self
+        flavors = set(flavors) if flavors is not None else set(self._definitions)
+        return IndicatorRegistry({flavor: definitions for flavor, definitions in self._definitions.items()
+                                  if flavor in flavors}, self._matchers, stemming)
+
+    @classmethod
+    def from_csv(cls, path: str) -> "IndicatorRegistry":
+        definitions = {}
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.DictReader(f)
+            missing = [column for column in IndicatorRegistry.COLUMNS if column not in (reader.fieldnames or [])]
+            if len(missing) > 0:
+                raise ValueError(f"{path}: missing columns {', '.join(missing)}")
+
+            for row in reader:
+                where = f"{path}:{reader.line_num}"
+                try:
+                    flavor = Flavor(row["Web"])
+                    extract = ExtractionTypes(row["Extracción"])
+                except ValueError as e:
+                    raise ValueError(f"{where}: {e}")
+                name = row["Identificador"]
+                if name == "" or any(name in flavor_definitions for flavor_definitions in definitions.values()):
+                    raise ValueError(f"{where}: missing or duplicated Identificador '{name}'")
+
+                # split keywords into a list
+                keywords = [k.strip().lower() for k in row["Búsqueda"].replace("\n", "/").split("/")]
+                if all(k == "" for k in keywords):
+                    raise ValueError(f"{where}: {name} has no keywords")
+
+                definitions.setdefault(flavor, {})[name] = {
+                    "keywords": keywords,
+                    "extract": extract
+                }
+        return cls(definitions)
+
+    @classmethod
+    def load(cls, path: str, flavors: Optional[List[Flavor]] = None, cache: bool = True,
+             stemming: bool = False) -> "IndicatorRegistry":
+        """Registry of the CSV at `path`, from its cached artifact when the CSV didn't change"""
+        if not cache:
+            return cls.from_csv(path).select(flavors, stemming)
+
+        cache_path = path + IndicatorRegistry.CACHE_SUFFIX
+        stat = os.stat(path)
+        artifact = IndicatorRegistry._read_artifact(cache_path)
+        if artifact is not None:
+            if (artifact["size"], artifact["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+                return artifact["registry"].select(flavors, stemming)
+            if artifact["sha1"] == IndicatorRegistry._sha1(path):  # touched but not modified
+                IndicatorRegistry._write_artifact(cache_path, artifact["registry"], stat, artifact["sha1"])
+                return artifact["registry"].select(flavors, stemming)
+
+        registry = cls.from_csv(path)
+        IndicatorRegistry._write_artifact(cache_path, registry, stat, IndicatorRegistry._sha1(path))
+        return registry.select(flavors, stemming)
+
+    @staticmethod
+    def _sha1(path: str) -> str:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    @staticmethod
+    def _read_artifact(cache_path: str) -> Optional[Dict]:
+        try:
+            with open(cache_path, "rb") as f:
+                artifact = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable indicators cache {cache_path}: {e}")
+            return None
+        if not isinstance(artifact, dict) or artifact.get("version") != IndicatorRegistry.VERSION:
+            return None
+        return artifact
+
+    @staticmethod
+    def _write_artifact(cache_path: str, registry: "IndicatorRegistry", stat: os.stat_result, sha1: str) -> None:
+        artifact = {"version": IndicatorRegistry.VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                    "sha1": sha1, "registry": registry}
+        tmp_path = cache_path + ".part"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Can't write indicators cache {cache_path}: {e}")
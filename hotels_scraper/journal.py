@@ -0,0 +1,56 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+from hotels_scraper.storage import PageInfo
+
+
+class ProgressJournal:
+    """Durable record of the NIFs already parsed, used to resume an interrupted run.
+
+    Every completed NIF is appended together with a fingerprint of its pages, so it
+    is only skipped on resume if none of its pages changed in the meantime.
+    """
+
+    def __init__(self, path: str, reset: bool = False):
+        self._path = path
+        self._entries: Dict[str, str] = {}
+        if reset and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # last line of an interrupted run
+                    self._entries[entry["nif"]] = entry["fingerprint"]
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, nif: str) -> Optional[str]:
+        return self._entries.get(nif)
+
+    def record(self, nif: str, fingerprint: str) -> None:
+        self._entries[nif] = fingerprint
+        with open(self._path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"nif": nif, "fingerprint": fingerprint}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def remove(self) -> None:
+        """Deletes the journal, which is only written once a NIF is recorded"""
+        if os.path.exists(self._path):
+            os.remove(self._path)
+
+    @staticmethod
+    def pages_fingerprint(pages: List[PageInfo], salt: str = "") -> str:
+        """Hash of the name, size and modification time of every page of a NIF"""
+        entries = sorted((os.path.basename(page.html_file), page.size, page.mtime_ns) for page in pages)
+        return hashlib.sha1(json.dumps([salt, entries]).encode("utf-8")).hexdigest()
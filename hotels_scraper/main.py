@@ -1,18 +1,34 @@
 import argparse
+import logging
 import os
-from typing import Dict, List
-
-import pandas as pd
+import socket
+from typing import TYPE_CHECKING, List
 
+from hotels_scraper.cache import ParseCache
 from hotels_scraper.downloader import Downloader
-from hotels_scraper.enums import ExtractionTypes, Flavor
+from hotels_scraper.enums import Flavor
+from hotels_scraper.fetchers import FETCHERS
+from hotels_scraper.html_backends import HTML_BACKENDS
+from hotels_scraper.indicators import IndicatorRegistry
+from hotels_scraper.journal import ProgressJournal
+from hotels_scraper.output import StreamingResultWriter
 from hotels_scraper.parser import Parser
+from hotels_scraper.profiling import Profiler
+from hotels_scraper.progress import LOGGER_NAME, configure_logging
+from hotels_scraper.storage import DUMP_STORES
+from hotels_scraper.work_queue import WorkQueue
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 VALID_BOOKING_URL = "https://www.booking.com/hotel/es"
+DISTRIBUTED_ROLES = ["coordinator", "worker", "merge"]
 AUTOFIX = True
 
 
-def sanity_check(df: pd.DataFrame) -> None:
+def sanity_check(df: "pd.DataFrame") -> None:
+    import pandas as pd
+
     nifs = df["Código NIF"]
     if len(nifs.unique()) != len(nifs):
         raise RuntimeError("Hay NIFs duplicados, por favor revise el listado")
@@ -33,65 +49,158 @@ def sanity_check(df: pd.DataFrame) -> None:
             df.at[nif, "Dirección web"] = f"https://{url}"
 
 
-def load_indicators(csv_path: str, flavors_to_load: List[Flavor] = None) -> Dict:
-    df = pd.read_csv(csv_path)
-    indicators = {}
-
-    # split keywords into a list
-    for i, row in df.iterrows():
-        keywords = row["Búsqueda"]
-        keywords = keywords.replace("\n", "/")
-        keywords = keywords.split("/")
-        keywords = [k.strip().lower() for k in keywords]
-
-        flavor = Flavor(row["Web"])
-        if flavors_to_load is not None and flavor not in flavors_to_load:
-            continue
-
-        if flavor not in indicators:
-            indicators[flavor] = {}
-
-        indicators[flavor][row["Identificador"]] = {
-            "keywords": keywords,
-            "extract": ExtractionTypes(row["Extracción"])
-        }
-
-    return indicators
+def load_indicators(csv_path: str, flavors_to_load: List[Flavor] = None, stemming: bool = False) -> IndicatorRegistry:
+    return IndicatorRegistry.load(csv_path, flavors_to_load, stemming=stemming)
 
 
 def main() -> None:
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--input", type=str, help="Input CSV file", required=True)
+    parser = argparse.ArgumentParser(
+        epilog="Text repeated across the pages of a website (menus, footers, cookie banners) is only scanned for the "
+               "Empresa keywords once per parser process, but its hits are still counted in <indicator>_Ocurrencias "
+               "on every page it appears on.")
+    parser.add_argument("--input", type=str, help="Input CSV file (not needed by distributed workers and merges)")
     parser.add_argument("--output", type=str, help="Output CSV file", required=True)
     parser.add_argument("--dump", type=str, help="Dump folder to save html files", required=True)
     parser.add_argument("--indicators", type=str, help="CSV file with indicators", required=True)
     parser.add_argument("--flavors", type=Flavor, nargs="*", choices=list(Flavor), help="Flavors to process")
+    parser.add_argument("--dump-format", type=str, choices=list(DUMP_STORES),
+                        help="How pages are stored in a new dump folder (default: loose html files); existing "
+                             "folders keep their format, convert them with utils.migrate_dump")
     parser.add_argument("--skip-download", action="store_true", help="Avoid to download the pages")
     parser.add_argument("--skip-parser", action="store_true", help="Avoid parsing the pages")
+    parser.add_argument("--html-backend", type=str, choices=list(HTML_BACKENDS),
+                        help="HTML parsing backend (default: lxml if installed, otherwise stream)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum number of simultaneous downloads")
+    parser.add_argument("--per-host-concurrency", type=int, default=2,
+                        help="Maximum number of simultaneous downloads from the same host")
+    parser.add_argument("--rate-per-host", type=float, default=2.0,
+                        help="Maximum requests per second to the same host, 0 for no limit; the concurrency against "
+                             "a host is also halved every time it throttles the downloads")
+    parser.add_argument("--max-retries", type=int, default=4,
+                        help="Times a page is fetched again after a throttled, failed or blocked response, with "
+                             "exponential backoff")
+    parser.add_argument("--fetcher", type=str, choices=list(FETCHERS),
+                        help="Fetch strategy for all flavors (default: http for Empresa, browser for Booking and Google)")
+    parser.add_argument("--crawl-depth", type=int, default=1, help="Depth of internal links followed in hotels websites")
+    parser.add_argument("--crawl-budget", type=int, default=100,
+                        help="Maximum number of pages downloaded from each hotel website")
+    parser.add_argument("--refresh-older-than", type=float,
+                        help="Download again the pages fetched more than this many days ago, revalidating them "
+                             "with conditional requests when the fetcher supports it")
+    parser.add_argument("--processes", type=int, help="Number of parser processes (default: number of CPUs)")
+    parser.add_argument("--near-duplicates", type=float, metavar="THRESHOLD",
+                        help="Skip the Empresa pages of a website whose text blocks are at least this similar "
+                             "(0-1) to one of its earlier pages, trading some recall for speed")
+    parser.add_argument("--stemming", action="store_true",
+                        help="Also match the singular and plural forms of the Empresa keywords")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip NIFs completed by an interrupted parser run whose pages didn't change")
+    parser.add_argument("--distributed", type=str, choices=DISTRIBUTED_ROLES,
+                        help="Parse with several machines sharing the dump: a coordinator plans the pages in a work "
+                             "queue, workers on every machine parse them, and a merge writes the output")
+    parser.add_argument("--queue", type=str,
+                        help="SQLite work queue of a distributed run, on the shared filesystem (default: next to "
+                             "the output)")
+    parser.add_argument("--lease-timeout", type=float, default=300,
+                        help="Seconds after which pages claimed by a distributed worker that stopped responding are "
+                             "parsed by another one")
+    parser.add_argument("--cache", type=str, help="SQLite file to cache parse results (default: next to the dump)")
+    parser.add_argument("--cache-size", type=int, default=1024, help="Maximum size of the parse cache in MB")
+    parser.add_argument("--no-cache", action="store_true", help="Parse every page without using the cache")
+    parser.add_argument("--rebuild-cache", action="store_true", help="Discard the cached results before parsing")
+    parser.add_argument("--failures", type=str,
+                        help="JSON lines file where failed pages are recorded (default: next to the output)")
+    parser.add_argument("--log-level", type=str, default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Minimum level of the messages shown and recorded")
+    parser.add_argument("--profile", type=str, nargs="?", const="",
+                        help="Time every stage and write the metrics to this JSON file (default: next to the output); "
+                             "distributed workers add their host and process to the name")
     args = parser.parse_args()
+    # distributed workers and merges only parse the pages a coordinator planned
+    planned = args.distributed in ("worker", "merge")
+    if args.input is None and not planned:
+        parser.error("the following arguments are required: --input")
+
+    failures_path = args.failures or os.path.splitext(args.output)[0] + ".failures.jsonl"
+    if not args.resume and args.distributed != "worker" and os.path.exists(failures_path):
+        os.remove(failures_path)
+    configure_logging(failures_path, getattr(logging, args.log_level))
+    profiler = Profiler(enabled=args.profile is not None)
 
     output_folder = args.dump
     os.makedirs(output_folder, exist_ok=True)
 
-    df = pd.read_csv(args.input)
-    sanity_check(df)
-    df.sort_index(inplace=True)
-
-    if not args.skip_download:
-        d = Downloader(output_folder)
+    if not planned:
+        import pandas as pd  # imported late, so --help and argument errors don't pay for it
+        df = pd.read_csv(args.input)
+        sanity_check(df)
+        df.sort_index(inplace=True)
+
+    if not args.skip_download and not planned:
+        d = Downloader(output_folder, args.html_backend, args.concurrency, args.per_host_concurrency, args.fetcher,
+                       args.crawl_depth, args.crawl_budget, profiler,
+                       args.refresh_older_than * 24 * 3600 if args.refresh_older_than is not None else None,
+                       args.dump_format, args.rate_per_host or None, args.max_retries)
         if Flavor.EMPRESA in args.flavors:
-            d.download_htmls(df, url_column="Dirección web", post_fix="Empresa")
+            with profiler.stage("download", Flavor.EMPRESA):
+                d.download_htmls(df, url_column="Dirección web", post_fix="Empresa")
         if Flavor.BOOKING in args.flavors:
-            d.download_htmls(df, url_column="BOOKING", post_fix="Booking")
+            with profiler.stage("download", Flavor.BOOKING):
+                d.download_htmls(df, url_column="BOOKING", post_fix="Booking")
         if Flavor.GOOGLE in args.flavors:
-            d.download_htmls(df, url_column="GOOGLE", post_fix="Google")
+            with profiler.stage("download", Flavor.GOOGLE):
+                d.download_htmls(df, url_column="GOOGLE", post_fix="Google")
 
     if not args.skip_parser:
-        indicators = load_indicators(args.indicators, args.flavors)
-        p = Parser(output_folder, indicators)
-        results = p.find_indicators_in_htmls()
-        results.to_csv(args.output, encoding="utf-8")
-        results.to_excel(args.output.replace(".csv", ".xls"))
+        indicators = load_indicators(args.indicators, args.flavors, args.stemming)
+        cache = None
+        if not args.no_cache:
+            cache_path = args.cache or os.path.normpath(output_folder) + ".cache.sqlite"
+            cache = ParseCache(cache_path, args.cache_size)
+            if args.rebuild_cache:
+                cache.clear()
+        p = Parser(output_folder, indicators, args.html_backend, cache, args.processes, profiler,
+                   args.near_duplicates)
+        # rows are streamed to a partial file and journaled as NIFs complete, the sorted outputs are assembled from it
+        partial_output = os.path.splitext(args.output)[0] + ".partial.csv"
+        results = None
+        if args.distributed is not None:
+            queue = WorkQueue(args.queue or os.path.splitext(args.output)[0] + ".queue.sqlite", args.lease_timeout)
+        if args.distributed == "coordinator":
+            tasks = p.enqueue(queue)
+            print(f"{tasks} páginas pendientes en {queue.path}")
+        elif args.distributed == "worker":
+            tasks = p.work(queue)
+            print(f"{tasks} páginas procesadas en {socket.gethostname()}")
+        elif args.distributed == "merge":
+            writer = StreamingResultWriter(partial_output, Parser.result_columns(indicators))
+            try:
+                results = p.merge_queue(queue, writer)
+            except Exception:
+                # a queue not planned or not drained yet leaves nothing behind, the merge is run again later
+                if os.path.exists(partial_output):
+                    os.remove(partial_output)
+                raise
+        else:
+            writer = StreamingResultWriter(partial_output, Parser.result_columns(indicators), append=args.resume)
+            journal = ProgressJournal(os.path.splitext(args.output)[0] + ".journal.jsonl", reset=not args.resume)
+            results = p.find_indicators_in_htmls(writer, journal)
+            journal.remove()
+        if results is not None:
+            with profiler.stage("output"):
+                results.to_csv(args.output, encoding="utf-8")
+                results.to_excel(args.output.replace(".csv", ".xls"))
+            os.remove(partial_output)
+
+    if profiler.enabled:
+        # every distributed worker writes its own metrics
+        profile_path = args.profile or os.path.splitext(args.output)[0] + ".profile.json"
+        if args.distributed == "worker":
+            root, extension = os.path.splitext(profile_path)
+            profile_path = f"{root}.{socket.gethostname()}-{os.getpid()}{extension}"
+        profiler.write(profile_path, {"args": {key: str(value) for key, value in vars(args).items()}})
+        # __name__ is __main__ when run as a script, outside the configured logger
+        logging.getLogger(LOGGER_NAME).info(profiler.report())
 
 
 if __name__ == "__main__":
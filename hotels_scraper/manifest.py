@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Optional
+
+from hotels_scraper.storage import DumpStore
+
+
+class FetchManifest:
+    """Append-only JSON lines log with the last fetch of every page of a dump folder.
+
+    Each entry has the url, the validators sent back by the server (ETag and Last-Modified),
+    the hash of the saved content, the fetch time and the HTTP status, so stale pages can be
+    refreshed with conditional requests instead of being downloaded again.
+    """
+
+    def __init__(self, path: str, store: DumpStore):
+        self._path = path
+        self._store = store
+        self.entries: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # last line of an interrupted run
+                    self.entries[entry["file"]] = entry
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def _key(self, html_file: str) -> str:
+        return os.path.relpath(html_file, self._store.folder).replace(os.sep, "/")
+
+    def get(self, html_file: str) -> Optional[Dict]:
+        return self.entries.get(self._key(html_file))
+
+    def record(self, html_file: str, url: str, status: int, headers: Dict[str, str],
+               content_hash: Optional[str]) -> None:
+        headers = {name.lower(): value for name, value in headers.items() if value is not None}
+        entry = {"file": self._key(html_file), "url": url, "status": status, "fetched_at": time.time(),
+                 "etag": headers.get("etag"), "last_modified": headers.get("last-modified"), "hash": content_hash}
+        self.entries[entry["file"]] = entry
+        with open(self._path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def revalidated(self, html_file: str, headers: Dict[str, str]) -> None:
+        """Records that the saved page is still current, the server may send updated validators"""
+        entry = self.get(html_file)
+        self.record(html_file, entry["url"], 304, {"etag": entry["etag"], "last-modified": entry["last_modified"],
+                                                   **{name.lower(): value for name, value in headers.items()}},
+                    entry["hash"])
+
+    def conditional_headers(self, html_file: str, url: str) -> Dict[str, str]:
+        """Headers to revalidate the saved page, empty if there is nothing to revalidate"""
+        entry = self.get(html_file)
+        if entry is None or entry["url"] != url or entry["hash"] is None or not self._store.exists(html_file):
+            return {}
+        headers = {}
+        if entry["etag"] is not None:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"] is not None:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def is_stale(self, html_file: str, max_age: Optional[float]) -> bool:
+        """Whether the page is missing or was fetched more than `max_age` seconds ago.
+
+        Pages recorded in the manifest are taken as present, so checking them doesn't touch the dump.
+        """
+        entry = self.get(html_file)
+        if entry is not None:
+            return max_age is not None and time.time() - entry["fetched_at"] > max_age
+        # pages saved before the manifest existed are as old as their file
+        page = self._store.stat(html_file)
+        if page is None:
+            return True
+        return max_age is not None and time.time() - page.mtime_ns / 1e9 > max_age
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
@@ -0,0 +1,115 @@
+import re
+from typing import Dict, Iterable, List, Tuple
+
+from hotels_scraper.normalize import keyword_forms
+
+
+class KeywordMatcher:
+    """Finds every occurrence of many keywords in a single pass over a text.
+
+    All keywords are compiled into one trie-shaped alternation regex wrapped in a
+    lookahead, so overlapping keywords (e.g. "agua" and "consumo de agua") are all
+    reported. At every position the regex yields the longest keyword; shorter keywords
+    that are prefixes of it are expanded from a precomputed table.
+
+    Keywords are searched by their folded forms (see `normalize`), in texts normalized the
+    same way, and with `stemming` also in their singular and plural forms; occurrences are
+    reported per form, `forms` gives those of each keyword.
+
+    Texts can also be split into blocks at separators that no keyword contains: no keyword
+    spans two blocks, so the occurrences of a text can be assembled from those of its blocks.
+    """
+    _BLOCK_SEPARATORS = "\n\r\t.!?|•·©«»"
+
+    def __init__(self, keywords: Iterable[str], stemming: bool = False):
+        self._keywords = list(dict.fromkeys(k for k in keywords if k != ""))
+        self._stemming = stemming
+        self._forms = {keyword: keyword_forms(keyword, stemming) for keyword in self._keywords}
+        patterns = list(dict.fromkeys(form for forms in self._forms.values() for form in forms))
+        self._prefixes = {pattern: [p for p in patterns if pattern.startswith(p)] for pattern in patterns}
+        if len(patterns) > 0:
+            self._regex = re.compile("(?=(" + KeywordMatcher._build_trie_pattern(patterns) + "))")
+        else:
+            self._regex = None
+        separators = [char for char in KeywordMatcher._BLOCK_SEPARATORS
+                      if not any(char in pattern for pattern in patterns)]
+        self._block_separator = separators[0] if len(separators) > 0 else None
+        self._blocks_regex = re.compile("[^" + re.escape("".join(separators)) + "]+") if separators else None
+
+    @classmethod
+    def from_indicators(cls, indicators: Dict, stemming: bool = False) -> "KeywordMatcher":
+        return cls((keyword for name in indicators for keyword in indicators[name]["keywords"]), stemming)
+
+    @property
+    def keywords(self) -> List[str]:
+        return self._keywords
+
+    @property
+    def stemming(self) -> bool:
+        return self._stemming
+
+    def forms(self, keywords: Iterable[str]) -> List[str]:
+        """Forms searched for `keywords`, the keys of their occurrences"""
+        return [form for keyword in keywords for form in self._forms.get(keyword, ())]
+
+    def occurrences(self, text: str) -> Dict[str, List[int]]:
+        """Offsets of every occurrence of each keyword form found in the normalized `text`, in order"""
+        occurrences = {}
+        if self._regex is None:
+            return occurrences
+
+        for match in self._regex.finditer(text):
+            for form in self._prefixes[match.group(1)]:
+                occurrences.setdefault(form, []).append(match.start())
+
+        return occurrences
+
+    def split_blocks(self, text: str) -> List[Tuple[int, str]]:
+        """Start and text of the blocks of `text`, separators are left out"""
+        if self._blocks_regex is None:
+            return [(0, text)]
+        return [(match.start(), match.group()) for match in self._blocks_regex.finditer(text)]
+
+    def block_occurrences(self, blocks: List[str]) -> List[Dict[str, List[int]]]:
+        """Occurrences of every keyword within each block, scanning all blocks in a single pass"""
+        occurrences = [{} for _ in blocks]
+        if self._regex is None or len(blocks) == 0:
+            return occurrences
+        if self._block_separator is None:
+            return [self.occurrences(block) for block in blocks]
+
+        starts = []
+        position = 0
+        for block in blocks:
+            starts.append(position)
+            position += len(block) + 1
+        text = self._block_separator.join(blocks)
+
+        block_index = 0
+        for match in self._regex.finditer(text):
+            while block_index + 1 < len(starts) and starts[block_index + 1] <= match.start():
+                block_index += 1
+            block_occurrences = occurrences[block_index]
+            for form in self._prefixes[match.group(1)]:
+                block_occurrences.setdefault(form, []).append(match.start() - starts[block_index])
+        return occurrences
+
+    @staticmethod
+    def _build_trie_pattern(keywords: List[str]) -> str:
+        trie = {}
+        for keyword in keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[""] = {}  # end of keyword
+
+        def build(node: Dict) -> str:
+            branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char != ""]
+            if len(branches) == 0:
+                return ""
+            pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+            if "" in node:
+                pattern = "(?:" + pattern + ")?"  # greedy, so the longest keyword wins
+            return pattern
+
+        return build(trie)
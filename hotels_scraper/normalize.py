@@ -0,0 +1,76 @@
+import re
+import unicodedata
+from functools import lru_cache
+from itertools import product
+from typing import List, NamedTuple, Optional
+
+_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+_VOWELS = "aeiou"
+_MIN_INFLECTED = 4  # shorter words, like articles and prepositions, are left as they are
+
+
+class NormalizedText(NamedTuple):
+    text: str
+    offsets: Optional[List[int]]  # offset in the original text of every character and of the end, None if the same
+
+
+@lru_cache(maxsize=None)
+def fold(text: str) -> str:
+    """Casefolded `text` without accents: "Energía" and "ENERGIA" are both "energia" """
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def normalize(text: str) -> NormalizedText:
+    """Folded `text`, normalized once per page so keywords are matched regardless of case and accents"""
+    lower = text.lower()
+    if len(lower) == len(text):
+        if lower.isascii():
+            return NormalizedText(lower, None)
+        folded = {char: fold(char) for char in set(_NON_ASCII.findall(lower))}
+        if all(len(replacement) == 1 for replacement in folded.values()):
+            for char, replacement in folded.items():
+                if replacement != char:
+                    lower = lower.replace(char, replacement)
+            return NormalizedText(lower, None)
+
+    # a few characters grow or vanish when folded ("ß", combining accents): offsets are mapped one by one
+    pieces = [fold(char) if not char.isascii() else char.lower() for char in text]
+    offsets = [i for i, piece in enumerate(pieces) for _ in piece]
+    offsets.append(len(text))
+    return NormalizedText("".join(pieces), offsets)
+
+
+def singular(word: str) -> str:
+    """Light Spanish stemming: the singular of a folded plural word, other words as they are"""
+    if len(word) < _MIN_INFLECTED:
+        return word
+    if word.endswith("ces"):
+        return word[:-3] + "z"
+    if word.endswith("es") and word[-3] not in _VOWELS:
+        return word[:-2]
+    if word.endswith("s") and word[-2] in _VOWELS:
+        return word[:-1]
+    return word
+
+
+def plural(word: str) -> str:
+    """Plural of a folded singular Spanish word"""
+    if word.endswith("z"):
+        return word[:-1] + "ces"
+    return word + ("s" if word[-1] in _VOWELS else "es")
+
+
+def keyword_forms(keyword: str, stemming: bool = False) -> List[str]:
+    """Folded forms of `keyword` to look for in normalized texts, with stemming the singular and plural of its words"""
+    folded = fold(keyword)
+    if not stemming:
+        return [folded]
+    word_forms = []
+    for word in folded.split(" "):
+        if len(word) < _MIN_INFLECTED or not word.isalpha():
+            word_forms.append([word])
+        else:
+            stem = singular(word)
+            word_forms.append(list(dict.fromkeys([word, stem, plural(stem)])))
+    return list(dict.fromkeys(" ".join(words) for words in product(*word_forms)))
@@ -0,0 +1,52 @@
+import csv
+import os
+from typing import TYPE_CHECKING, Dict, List, Set
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class StreamingResultWriter:
+    """Appends the row of every NIF to a CSV file as soon as it has been parsed.
+
+    The column order is fixed up front, so rows can be appended across runs and a crash
+    only loses the NIFs that were being parsed.
+    """
+    INDEX_COLUMN = "NIF"
+
+    def __init__(self, path: str, columns: List[str], append: bool = False):
+        self._path = path
+        self._columns = columns
+        header = [StreamingResultWriter.INDEX_COLUMN] + columns
+
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                existing_header = next(csv.reader(f))
+            if existing_header != header:
+                raise RuntimeError(f"{path} was written with different indicators, it can't be appended to")
+        else:
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                csv.writer(f).writerow(header)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def write(self, nif: str, row: Dict) -> None:
+        with open(self._path, "a", encoding="utf-8", newline="") as f:
+            csv.writer(f).writerow([nif] + [row.get(column, "") for column in self._columns])
+
+    def written_nifs(self) -> Set[str]:
+        with open(self._path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            next(reader)
+            return {row[0] for row in reader if len(row) == len(self._columns) + 1}
+
+    def read(self) -> "pd.DataFrame":
+        """All written rows, as strings, keeping the last row of NIFs written more than once"""
+        import pandas as pd
+
+        df = pd.read_csv(self._path, dtype=str, keep_default_na=False, index_col=StreamingResultWriter.INDEX_COLUMN)
+        df = df[~df.index.duplicated(keep="last")]
+        df.index.name = None
+        return df
@@ -1,287 +1,510 @@
 import json
+import logging
 import multiprocessing
 import os
-import re
-from functools import partial
-from glob import glob
-from typing import Dict, Tuple, List
+import socket
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
-import pandas as pd
-from bs4 import BeautifulSoup
 from natsort import natsorted
-from tqdm import tqdm
 
-from hotels_scraper.enums import ExtractionTypes, Flavor, BookingSustainabilityMapping, \
-    BookingPropertySustainabilityFacilityMapping, BookingPropertySustainabilityTextMapping
+from hotels_scraper.booking import extract_booking
+from hotels_scraper.cache import ParseCache
+from hotels_scraper.dedupe import BlockIndex, NearDuplicates, PageMemo, Sketch, lines, sketch
+from hotels_scraper.enums import ExtractionTypes, Flavor, BookingFacilityIndex
+from hotels_scraper.google import index_google
+from hotels_scraper.html_backends import BookingNodes, GoogleNodes, HtmlSource, PageText, get_html_backend
+from hotels_scraper.indicators import IndicatorRegistry
+from hotels_scraper.journal import ProgressJournal
+from hotels_scraper.normalize import normalize
+from hotels_scraper.output import StreamingResultWriter
+from hotels_scraper.profiling import Profiler, Stats
+from hotels_scraper.progress import ProgressMonitor, ProgressReporter
+from hotels_scraper.storage import DumpStore, open_store
+from hotels_scraper.text_index import TextIndex
+from hotels_scraper.work import WorkUnit, balance_chunks, plan_units
+from hotels_scraper.work_queue import WorkQueue
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# state of each pool worker, set once by the pool initializer
+_worker_state: Dict = {}
 
 
 class Parser:
-    _GOOGLE_STARS_REGEX = re.compile(r"([\d,\.]+) de 5 estrellas a partir de ([\d\.]+) reseñas")
-    _BOOKING_COMMENTS_REGEX = re.compile(r"([\d\.]+) comentarios")
-    _BOOKING_SCORE_REGEX = re.compile("Puntuación: ([\d,\.]+)")
     CONTEXT_POSTFIX = "_Contexto"
-
-    def __init__(self, output_folder: str, indicators: Dict):
+    COUNT_POSTFIX = "_Ocurrencias"
+    MAX_CONTEXTS = 3  # contexts kept for each Empresa indicator, from all the pages of a NIF
+    CONTEXT_SEPARATOR = " | "
+    CONTENT_HASH_KEY = "__content_hash__"  # set in the results of a file, identical pages of a NIF count once
+    QUEUE_BATCH_SIZE = 8  # tasks claimed at once from a work queue
+    QUEUE_POLL_INTERVAL = 2  # seconds between checks for expired leases once the queue is drained
+
+    def __init__(self, output_folder: str, indicators: Dict[Flavor, Dict], html_backend: Optional[str] = None,
+                 cache: Optional[ParseCache] = None, processes: Optional[int] = None,
+                 profiler: Optional[Profiler] = None, near_duplicate_threshold: Optional[float] = None):
         self._output_folder = output_folder
+        self._store = open_store(output_folder)
+        if not isinstance(indicators, IndicatorRegistry):
+            indicators = IndicatorRegistry(indicators)
         self._indicators = indicators
+        self._html_backend = html_backend
+        self._cache = cache
+        self._processes = processes or os.cpu_count() or 1
+        self._profiler = profiler or Profiler(enabled=False)
+        self._near_duplicate_threshold = near_duplicate_threshold
+        backend_name = get_html_backend(html_backend).name
+        # runs that skip near duplicates or match with stemming are told apart by the cache, journal and queues
+        variant = ",".join(([f"near-duplicates={near_duplicate_threshold}"] if near_duplicate_threshold is not None
+                            else []) + (["stemming"] if indicators.stemming else []))
+        self._fingerprints = {flavor: ParseCache.fingerprint(flavor, indicators[flavor], backend_name,
+                                                             variant if flavor == Flavor.EMPRESA else "")
+                              for flavor in indicators}
 
-    def find_indicators_in_htmls(self) -> pd.DataFrame:
-        nifs_availables = os.listdir(self._output_folder)
+    @staticmethod
+    def result_columns(indicators: Dict) -> List[str]:
+        """Sorted output columns, each indicator followed by its context and, for Empresa, its number of hits,
+        then the Booking facility flags"""
+        names = natsorted(name for flavor in indicators for name in indicators[flavor])
+        counted = indicators.get(Flavor.EMPRESA, {})
+        columns = [column for name in names for column in (name, name + Parser.CONTEXT_POSTFIX)
+                   + ((name + Parser.COUNT_POSTFIX,) if name in counted else ())]
+        return columns + Parser.facility_columns(indicators)
 
-        with multiprocessing.Pool() as pool:
-            results = []
-            for result in tqdm(pool.imap_unordered(partial(Parser._process_single_nif,
-                                                           output_folder=self._output_folder,
-                                                           indicators=self._indicators),
-                                                   nifs_availables),
-                               total=len(nifs_availables),
-                               desc="Finding indicators"):
-                results.append(result)
-
-        results = {nif: x[nif] for nif, x in results}
-
-        df = pd.DataFrame(results).T
-        df = Parser._sort_columns(df)
-        return df
+    @staticmethod
+    def facility_columns(indicators: Dict) -> List[str]:
+        """One-hot columns of the Booking sustainability facilities of the indicators being parsed"""
+        booking = indicators.get(Flavor.BOOKING, {})
+        return natsorted(facility.column for facility in BookingFacilityIndex.values() if facility.indicator in booking)
+
+    def find_indicators_in_htmls(self, writer: Optional[StreamingResultWriter] = None,
+                                 journal: Optional[ProgressJournal] = None) -> "pd.DataFrame":
+        if journal is not None and writer is None:
+            raise ValueError("Resuming requires the results of previous runs to be streamed to a writer")
+
+        nifs_availables = self._nifs()
+
+        # skip NIFs completed by a previous run whose pages didn't change
+        folder_fingerprints = {}
+        if journal is not None:
+            salt = json.dumps(self._fingerprints, sort_keys=True)
+            for nif in nifs_availables:
+                folder_fingerprints[nif] = ProgressJournal.pages_fingerprint(self._store.pages(nif), salt)
+        nifs_pending = [nif for nif in nifs_availables
+                        if journal is None or journal.get(nif) != folder_fingerprints[nif]]
+        if len(nifs_pending) < len(nifs_availables):
+            logger.info(f"Resuming: {len(nifs_availables) - len(nifs_pending)} NIFs already processed")
+
+        results = {}
+
+        def complete(nif: str, row: Dict) -> None:
+            with self._profiler.stage("output", nif=nif):
+                if writer is not None:
+                    writer.write(nif, row)  # keep nothing in memory
+                else:
+                    results[nif] = row
+                if journal is not None:
+                    journal.record(nif, folder_fingerprints[nif])
+
+        # split the work into html files, balanced by size, and merge them back per NIF
+        units = self._skip_near_duplicates(plan_units(self._store, nifs_pending, list(self._indicators)))
+        pending_files = {nif: len(nif_units) for nif, nif_units in units.items()}
+        file_results = {nif: {} for nif in units}
+        for nif, count in pending_files.items():
+            if count == 0:
+                complete(nif, self._merge_files({}))
+
+        chunks = balance_chunks(units, self._processes)
+        with ProgressMonitor(sum(pending_files.values()), desc="Finding indicators") as monitor, \
+                self._pool(monitor) as pool:
+            for chunk_results, chunk_stats in pool.imap_unordered(Parser._process_chunk, chunks):
+                self._profiler.merge(chunk_stats)
+                for unit, unit_results in chunk_results:
+                    file_results[unit.nif][unit.order] = unit_results
+                    pending_files[unit.nif] -= 1
+                    if pending_files[unit.nif] == 0:
+                        complete(unit.nif, self._merge_files(file_results.pop(unit.nif)))
+            # let the workers flush their pending counters and records before the monitor stops
+            pool.close()
+            pool.join()
+
+        if self._cache is not None:
+            self._cache.evict()
+
+        with self._profiler.stage("output"):
+            if writer is not None:
+                df = writer.read()
+                return Parser._from_stream(df[df.index.isin(nifs_availables)])
+
+            import pandas as pd
+            df = pd.DataFrame(results).T
+            df = Parser._sort_columns(df)
+            return df
+
+    def enqueue(self, queue: WorkQueue) -> int:
+        """Plans the html files of the dump as tasks of a work queue shared by several machines.
+
+        Tasks of NIFs whose pages didn't change since they were planned are kept, with their results.
+        Returns the number of tasks planned.
+        """
+        salt = json.dumps(self._fingerprints, sort_keys=True)
+        nif_fingerprints = {nif: ProgressJournal.pages_fingerprint(self._store.pages(nif), salt)
+                            for nif in self._nifs()}
+        planned = queue.nif_fingerprints()
+        nifs_changed = [nif for nif, fingerprint in nif_fingerprints.items() if planned.get(nif) != fingerprint]
+        if len(nifs_changed) < len(nif_fingerprints):
+            logger.info(f"Resuming: {len(nif_fingerprints) - len(nifs_changed)} NIFs already planned")
+
+        # largest files first within each batch of NIFs, as they are spread over the pool
+        units = self._skip_near_duplicates(plan_units(self._store, nifs_changed, list(self._indicators)))
+        tasks = [unit for chunk in balance_chunks(units, self._processes) for unit in chunk]
+        queue.plan(self._configuration(), nif_fingerprints, tasks)
+        return len(tasks)
+
+    def work(self, queue: WorkQueue) -> int:
+        """Parses tasks of a work queue with the processes of this machine until every task is done.
+
+        Returns the number of tasks parsed here.
+        """
+        self._check_queue(queue)
+        counts = queue.counts()
+        remaining = counts.get("pending", 0) + counts.get("leased", 0)
+        with ProgressMonitor(remaining, desc="Finding indicators") as monitor, self._pool(monitor) as pool:
+            parsed = 0
+            for process_parsed, process_stats in pool.starmap(Parser._drain_queue, [(queue,)] * self._processes):
+                parsed += process_parsed
+                self._profiler.merge(process_stats)
+            pool.close()
+            pool.join()
+
+        if self._cache is not None:
+            self._cache.evict()
+        return parsed
+
+    def merge_queue(self, queue: WorkQueue, writer: StreamingResultWriter) -> "pd.DataFrame":
+        """Results of every NIF of a drained work queue, the same `find_indicators_in_htmls` returns"""
+        self._check_queue(queue)
+        for nif, html_file in queue.failed():
+            logger.error(f"Can't process file: its workers died {html_file}", extra={"nif": nif, "file": html_file})
+        with self._profiler.stage("output"):
+            for nif, file_results in queue.results():
+                writer.write(nif, self._merge_files(file_results))
+            return Parser._from_stream(writer.read())
+
+    def _nifs(self) -> List[str]:
+        return [nif for nif in os.listdir(self._output_folder) if os.path.isdir(os.path.join(self._output_folder, nif))]
+
+    def _configuration(self) -> Dict:
+        # everything the results of a task depend on, so all the machines parse them the same way
+        return {"fingerprints": {str(flavor): fingerprint for flavor, fingerprint in self._fingerprints.items()}}
+
+    def _check_queue(self, queue: WorkQueue) -> None:
+        configuration = queue.configuration()
+        if configuration is None:
+            raise RuntimeError(f"{queue.path} has no tasks, plan them first")
+        if configuration != self._configuration():
+            raise RuntimeError(f"{queue.path} was planned with other indicators or options")
+
+    def _pool(self, monitor: ProgressMonitor) -> multiprocessing.Pool:
+        return multiprocessing.Pool(self._processes, initializer=Parser._init_worker,
+                                    initargs=(self._indicators, self._store, self._html_backend, self._cache,
+                                              self._fingerprints, monitor.reporter(), self._profiler.enabled))
+
+    def _skip_near_duplicates(self, units: Dict[str, List[WorkUnit]]) -> Dict[str, List[WorkUnit]]:
+        # decided per NIF in merge order, whatever process parses each page; a skipped page would only repeat
+        # indicators and contexts of the earlier page it resembles, which are merged already
+        if self._near_duplicate_threshold is None:
+            return units
+        empresa = [unit for nif_units in units.values() for unit in nif_units if unit.flavor == Flavor.EMPRESA]
+        with self._profiler.stage("cache", Flavor.EMPRESA), multiprocessing.Pool(self._processes) as pool:
+            sketches = dict(zip((unit.html_file for unit in empresa),
+                                pool.starmap(Parser._sketch_page, [(self._store, unit.html_file) for unit in empresa],
+                                             chunksize=16)))
+        kept = {}
+        skipped = 0
+        for nif, nif_units in units.items():
+            near_duplicates = NearDuplicates(self._near_duplicate_threshold)
+            kept[nif] = [unit for unit in nif_units
+                         if unit.flavor != Flavor.EMPRESA or not near_duplicates.seen(sketches[unit.html_file])]
+            skipped += len(nif_units) - len(kept[nif])
+        logger.info(f"{skipped} near duplicate pages skipped")
+        return kept
 
     @staticmethod
-    def _sort_columns(df: pd.DataFrame) -> pd.DataFrame:
+    def _sketch_page(store: DumpStore, html_file: str) -> Sketch:
+        return sketch(lines(store.read_chunks(html_file)))
+
+    @staticmethod
+    def _from_stream(df: "pd.DataFrame") -> "pd.DataFrame":
+        # match the in-memory frame: contexts and counts never filled are dropped and flags are booleans
+        postfixes = (Parser.CONTEXT_POSTFIX, Parser.COUNT_POSTFIX)
+        empty_contexts = [column for column in df.columns if column.endswith(postfixes) and (df[column] == "").all()]
+        df = df.drop(columns=empty_contexts)
+        flags = [column for column in df.columns if not column.endswith(postfixes)]
+        df[flags] = df[flags].replace("True", True)
+        df = df.sort_index()
+        return Parser._sort_columns(df)
+
+    @staticmethod
+    def _sort_columns(df: "pd.DataFrame") -> "pd.DataFrame":
         sorted_columns = []
         for column in natsorted(df.columns):
-            if column.endswith(Parser.CONTEXT_POSTFIX):
+            if column.endswith((Parser.CONTEXT_POSTFIX, Parser.COUNT_POSTFIX)):
                 continue
             sorted_columns.append(column)
-            if column + Parser.CONTEXT_POSTFIX in df.columns:
-                sorted_columns.append(column + Parser.CONTEXT_POSTFIX)
+            for postfix in (Parser.CONTEXT_POSTFIX, Parser.COUNT_POSTFIX):
+                if column + postfix in df.columns:
+                    sorted_columns.append(column + postfix)
         df = df.reindex(sorted_columns, axis=1)
         return df
 
+    def _merge_files(self, file_results: Dict[Tuple[int, int], Optional[Dict]]) -> Dict:
+        results = {name: "" for flavor in self._indicators for name in self._indicators[flavor]}
+        results.update((column, "") for column in Parser.facility_columns(self._indicators))
+        # a page repeated within the website of a NIF, parsed or looked up, adds its hits only once
+        content_hashes = set()
+        for order in sorted(file_results):
+            if file_results[order] is not None:
+                content_hash = file_results[order].get(Parser.CONTENT_HASH_KEY)
+                Parser._merge_results(results, file_results[order], count=content_hash not in content_hashes)
+                if content_hash is not None:
+                    content_hashes.add(content_hash)
+        for name, value in results.items():
+            if isinstance(value, list):
+                results[name] = Parser.CONTEXT_SEPARATOR.join(value)
+        return results
+
     @staticmethod
-    def _process_single_nif(nif: str, output_folder: str, indicators: Dict) -> Tuple[str, Dict]:
-        results = {nif: {}}
-        for flavor in indicators:
+    def _init_worker(indicators: IndicatorRegistry, store: DumpStore, html_backend: Optional[str],
+                     cache: Optional[ParseCache], fingerprints: Dict[Flavor, str], reporter: ProgressReporter,
+                     profile: bool) -> None:
+        # the registry and its compiled matchers are sent once per worker, not per task; the text blocks
+        # and pages already seen are remembered by each worker
+        reporter.install()
+        _worker_state.update({
+            "indicators": indicators,
+            "indexes": {flavor: BlockIndex(matcher) for flavor, matcher in indicators.matchers.items()},
+            "memo": PageMemo(),
+            "store": store,
+            "html_backend": html_backend,
+            "cache": cache,
+            "fingerprints": fingerprints,
+            "reporter": reporter,
+            "profile": profile,
+        })
 
-            # initialize indicators
-            for name in indicators[flavor]:
-                results[nif][name] = ""
+    @staticmethod
+    def _process_chunk(chunk: List[WorkUnit]) -> Tuple[List[Tuple[WorkUnit, Optional[Dict]]], Stats]:
+        profiler = Profiler(_worker_state["profile"])
+        results = [(unit, Parser._process_unit(unit, profiler)) for unit in chunk]
+        Parser._flush_cache()
+        return results, profiler.stats
 
-            # process all HTMLs for this company
-            html_files = glob(os.path.join(output_folder, nif, f"{nif}_{flavor}*.html"))
-            for html_file in html_files:
-                try:
-                    Parser._process_single_html(flavor, html_file, indicators, nif, results)
-                except RuntimeError as e:
-                    print(f"[{nif}] Can't process {html_file}: {e}")
+    @staticmethod
+    def _drain_queue(queue: WorkQueue) -> Tuple[int, Stats]:
+        profiler = Profiler(_worker_state["profile"])
+        owner = f"{socket.gethostname()}:{os.getpid()}"
+        parsed = 0
+        while True:
+            tasks = queue.claim(owner, Parser.QUEUE_BATCH_SIZE)
+            if len(tasks) == 0:
+                # tasks leased by other workers are claimed again if their lease expires before they finish
+                wait = queue.next_expiry()
+                if wait is None:
+                    break
+                time.sleep(min(wait, Parser.QUEUE_POLL_INTERVAL) + 0.1)
+                continue
+
+            # results are stored once per batch, every write to the shared file is a synchronous commit
+            results = []
+            renewed = time.monotonic()
+            for task_id, unit in tasks:
+                results.append((task_id, Parser._process_unit(unit, profiler)))
+                if time.monotonic() - renewed > queue.lease_timeout / 2:
+                    queue.renew(owner, [task_id for task_id, _ in tasks])
+                    renewed = time.monotonic()
+            Parser._flush_cache()
+            queue.complete(results)
+            parsed += len(results)
+        return parsed, profiler.stats
 
-        return nif, results
+    @staticmethod
+    def _flush_cache() -> None:
+        # pool workers never close their cache, the access times of its hits are written after each chunk
+        if _worker_state["cache"] is not None:
+            _worker_state["cache"].flush()
 
     @staticmethod
-    def _process_single_html(flavor: Flavor, html_file: str, indicators: Dict, nif: str, results: Dict) -> None:
-        with open(html_file, "r", encoding="utf-8") as f:
-            html_content = f.read()
-        soup = BeautifulSoup(html_content, "html.parser")
+    def _process_unit(unit: WorkUnit, profiler: Profiler) -> Optional[Dict]:
+        reporter = _worker_state["reporter"]
+        reporter.start(unit.nif, unit.html_file)
+        try:
+            file_results = Parser._process_cached_html(unit.flavor, unit.html_file, _worker_state["store"],
+                                                       _worker_state["indicators"], _worker_state["indexes"],
+                                                       _worker_state["html_backend"], _worker_state["cache"],
+                                                       _worker_state["fingerprints"][unit.flavor], unit.nif,
+                                                       profiler, _worker_state["memo"])
+        except RuntimeError as e:
+            logger.error(f"Can't process file: {e}")
+            file_results = None
+        reporter.done(unit.size)
+        return file_results
 
+    @staticmethod
+    def _merge_results(results: Dict, file_results: Dict, count: bool = True) -> None:
+        # the first file that fills an indicator wins; hits of Empresa indicators are added up, unless not
+        # `count`, and their contexts, lists in the results of a file, are kept from every file until there are enough
+        for name, value in file_results.items():
+            if name.endswith(Parser.COUNT_POSTFIX):
+                if count:
+                    results[name] = results.get(name, 0) + value
+                continue
+            if name.endswith(Parser.CONTEXT_POSTFIX) or name == Parser.CONTENT_HASH_KEY or value == "":
+                continue
+            context = file_results.get(name + Parser.CONTEXT_POSTFIX)
+            if results[name] != "":
+                merged = results.get(name + Parser.CONTEXT_POSTFIX)
+                if isinstance(merged, list) and isinstance(context, list):
+                    merged += [c for c in context if c not in merged][:Parser.MAX_CONTEXTS - len(merged)]
+                continue
+            results[name] = value
+            if context is not None:
+                results[name + Parser.CONTEXT_POSTFIX] = list(context) if isinstance(context, list) else context
+
+    @staticmethod
+    def _process_cached_html(flavor: Flavor, html_file: str, store: DumpStore, indicators: Dict,
+                             indexes: Dict[Flavor, BlockIndex], html_backend: Optional[str],
+                             cache: Optional[ParseCache], fingerprint: str, nif: str,
+                             profiler: Optional[Profiler] = None, memo: Optional[PageMemo] = None) -> Dict:
+        # pages are streamed from the store in chunks and never held whole, they are read again when needed
+        profiler = profiler or Profiler(enabled=False)
+        if cache is None and memo is None:
+            return Parser._process_single_html(flavor, store.read_chunks(html_file), indicators, indexes,
+                                               html_backend, nif, profiler)
+
+        # identical pages, often repeated within a website, are looked up instead of parsed again
+        with profiler.stage("read", flavor, nif):
+            content_hash = ParseCache.content_hash(store.read_chunks(html_file))
+        with profiler.stage("cache", flavor, nif):
+            file_results = memo.get(fingerprint, content_hash) if memo is not None else None
+            if file_results is None and cache is not None:
+                file_results = cache.get(content_hash, fingerprint)
+        if file_results is None:
+            file_results = Parser._process_single_html(flavor, store.read_chunks(html_file), indicators, indexes,
+                                                       html_backend, nif, profiler)
+            if cache is not None:
+                with profiler.stage("cache", flavor, nif):
+                    cache.put(content_hash, fingerprint, file_results)
+        if memo is not None:
+            memo.put(fingerprint, content_hash, file_results)
+        return dict(file_results, **{Parser.CONTENT_HASH_KEY: content_hash})
+
+    @staticmethod
+    def _process_single_html(flavor: Flavor, html_content: HtmlSource, indicators: Dict,
+                             indexes: Dict[Flavor, BlockIndex], html_backend: Optional[str], nif: str,
+                             profiler: Optional[Profiler] = None) -> Dict:
+        # results of a single file, so they can be cached and merged independently
+        results = {nif: {name: "" for name in indicators[flavor]}}
+        backend = get_html_backend(html_backend)
+        profiler = profiler or Profiler(enabled=False)
+
+        # "parse" reads the page, builds the tree and extracts the flavor's nodes, "match" looks for the
+        # indicators in them
         if flavor == Flavor.EMPRESA:
-            Parser._process_empresa(soup, indicators[flavor], nif, results)
+            with profiler.stage("parse", flavor, nif):
+                page = backend.page_text(html_content)
+            with profiler.stage("match", flavor, nif):
+                Parser._process_empresa(page, indicators[flavor], indexes[flavor], nif, results)
         elif flavor == Flavor.BOOKING:
-            Parser._process_booking(soup, indicators[flavor], nif, results)
+            with profiler.stage("parse", flavor, nif):
+                nodes = backend.booking_nodes(html_content)
+            with profiler.stage("match", flavor, nif):
+                Parser._process_booking(nodes, indicators[flavor], nif, results)
         elif flavor == Flavor.GOOGLE:
-            Parser._process_google(soup, indicators[flavor], nif, results)
+            with profiler.stage("parse", flavor, nif):
+                nodes = backend.google_nodes(html_content)
+            with profiler.stage("match", flavor, nif):
+                Parser._process_google(nodes, indicators[flavor], nif, results)
         else:
             raise ValueError(f"Flavor not supported: {flavor}")
 
-    @staticmethod
-    def _sanitize(content: str) -> str:
-        content = content.replace("\n", " ")
-        content = " ".join(content.split())
-        return content
+        return results[nif]
 
     @staticmethod
-    def _process_empresa(soup: BeautifulSoup, indicators: Dict, nif: str, results: Dict) -> None:
-        # Extract text
-        html_content = soup.text.lower()
+    def _process_empresa(page: PageText, indicators: Dict, index: BlockIndex, nif: str, results: Dict) -> None:
+        # Case and accents are folded once per page, contexts are still cut from the original text
+        text = normalize(page.text)
 
-        # Find indicators
-        for name in tqdm(indicators, desc="Searching indicators"):
+        # Locate every keyword in a single pass over the text blocks not seen before
+        occurrences = index.occurrences(text.text)
+
+        # Find indicators, each extraction is answered from the sentences, headings and words of the page
+        text_index = TextIndex(page.text, page.headings, text.offsets)
+        for name in indicators:
             if results[nif][name] != "":
                 continue  # skip if this indicator is already filled
 
-            extraction_type = indicators[name]["extract"]
-            keywords = indicators[name]["keywords"]
-            for keyword in keywords:
-                # TODO improve finding
-                if keyword in html_content:
-                    index = html_content.find(keyword)
-                    first_index = max(index - 80, 0)
-                    last_index = min(index + 80, len(html_content))
-                    context = html_content[first_index:last_index]
-                    occurrences = re.findall(fr"( {keyword}(\s|\.|,|;|:)+)", context)
-                    if len(occurrences) == 0:
-                        continue
-
-                    if extraction_type == ExtractionTypes.PHRASE:
-                        # phrases = re.findall(fr"([^.]*? {keyword} [^.]*\.)", context)
-                        pass  # TODO
-                    elif extraction_type == ExtractionTypes.SECTION:
-                        pass  # TODO
-                    elif extraction_type == ExtractionTypes.WORD:
-                        pass  # TODO
-                    elif extraction_type == ExtractionTypes.NUMBER:
-                        pass  # TODO
-
-                    # Set flag
-                    results[nif][name] = True
-
-                    # Add context
-                    context = context.replace(keyword, f"**{keyword}**")
-                    results[nif][name + Parser.CONTEXT_POSTFIX] = Parser._sanitize(context)
-                    # print(f"[{name}]\t[{extraction_type}]\t{keyword=}\t`{results[nif][name + Parser.CONTEXT_POSTFIX]}`")
-                    break
+            extraction = text_index.extract(index.matcher.forms(indicators[name]["keywords"]), occurrences,
+                                            indicators[name]["extract"], Parser.MAX_CONTEXTS)
+            if extraction.hits > 0:
+                results[nif][name] = True
+                results[nif][name + Parser.CONTEXT_POSTFIX] = extraction.contexts
+                results[nif][name + Parser.COUNT_POSTFIX] = extraction.hits
 
     @staticmethod
-    def _process_booking(soup: BeautifulSoup, indicators: Dict, nif: str, results: Dict) -> None:
-        all_divs = soup.find_all(name="div")
-        all_scripts = soup.find_all(name="script")
-
-        relevant_div = [div for div in all_divs
-                        if "data-testid" in div.attrs and div.attrs["data-testid"] == "sustainability-banner-container"]
-
-        if len(relevant_div) != 1:
-            print("Can't find sustainability banner")
-            booking_sustainability_content = None
-            booking_sustainability_tier = None
-        else:
-
-            relevant_script = [script for script in all_scripts if "PropertySustainability" in script.text]
-            if len(relevant_script) != 1:
-                print("Problem retrieving SustainabilityBannerDesktop")
-                booking_sustainability_content = None
-                booking_sustainability_tier = None
-            else:
-                booking_sustainability_content = []
-                booking_sustainability_tier = None
-                relevant_script = relevant_script[0]
-                script_content = json.loads(relevant_script.contents[0])
-                for key, value in script_content.items():
-                    if "PropertySustainabilityFacility" in key:
-                        property_id = str(value["id"])
-                        booking_sustainability_content.append(property_id)
-                    elif "PropertySustainabilityTier" in key:
-                        booking_sustainability_tier = value["type"]
-
-        relevant_script = [script for script in all_scripts
-                           if "type" in script.attrs and script.attrs["type"] == "application/json"
-                           and "chainProgrammes" in script.text]
-        booking_cert_content = None
-        booking_stars = None
-        if len(relevant_script) != 1:
-            print("Problem retrieving chainProgrammes")
-        else:
-            relevant_script = relevant_script[0]
-            relevant_json = json.loads(relevant_script.contents[0])
-            if 'PropertySustainability:{}' in relevant_json and \
-                    'chainProgrammes' in relevant_json['PropertySustainability:{}'] and \
-                    relevant_json['PropertySustainability:{}']['chainProgrammes'] is not None:
-                booking_cert_content = [f"{x['chainName']}_{x['programmeName']}"
-                                        for x in relevant_json['PropertySustainability:{}']['chainProgrammes']]
-            if 'StarRating:{}' in relevant_json and 'value' in relevant_json['StarRating:{}']:
-                booking_stars = relevant_json['StarRating:{}']['value']
-
-        relevant_div = [div for div in all_divs
-                        if "data-capla-component" in div.attrs and div.attrs["data-capla-component"].endswith(
-                "PropertyReviewScoreRight")]
-        if len(relevant_div) != 1:
-            print("Problem retrieving PropertyReviewScoreRight")
-            score = None
-            comments = None
-        else:
-            relevant_div = relevant_div[0]
-            booking_review_content = relevant_div.contents[0].find_all("div")
-            try:
-                score = Parser._get_booking_score(booking_review_content)
-            except RuntimeError as e:
-                score = None
-                print(e)
-            try:
-                comments = Parser._get_booking_reviews(booking_review_content)
-            except Exception as e:
-                comments = None
-                print(e)
+    def _process_booking(nodes: BookingNodes, indicators: Dict, nif: str, results: Dict) -> None:
+        record = extract_booking(nodes)
+
+        # Facilities are resolved through the precomputed index and flagged in their own columns
+        if record.facility_ids is not None:
+            contexts = {}
+            for property_id in record.facility_ids:
+                facility = BookingFacilityIndex.get(property_id)
+                if facility is None:
+                    logger.warning(f"Unknown Booking sustainability facility {property_id}")
+                    continue
+                if facility.indicator not in indicators:
+                    continue
+                results[nif][facility.column] = True
+                contexts.setdefault(facility.indicator, []).append(facility.text)
+            for name, texts in contexts.items():
+                results[nif][name] = True
+                results[nif][name + Parser.CONTEXT_POSTFIX] = "".join(text + "; " for text in texts)
 
         # Find indicators
-        for name in tqdm(indicators, desc="Searching indicators"):
+        for name in indicators:
             if results[nif][name] != "":
                 continue  # skip if this indicator is already filled
 
-            if name in BookingSustainabilityMapping and booking_sustainability_content is not None:
-                prefix = BookingSustainabilityMapping[name]
-                for property_id in booking_sustainability_content:
-                    property_key = BookingPropertySustainabilityFacilityMapping[property_id]
-                    if property_key.startswith(prefix):
-                        # Set flag
-                        results[nif][name] = True
-
-                        # Add context
-                        if name + Parser.CONTEXT_POSTFIX not in results[nif]:
-                            results[nif][name + Parser.CONTEXT_POSTFIX] = ""
-                        results[nif][name + Parser.CONTEXT_POSTFIX] += BookingPropertySustainabilityTextMapping[property_key] + "; "
-
-            if name == "Booking_Puntuación" and score is not None:
+            if name == "Booking_Puntuación" and record.score is not None:
                 results[nif][name] = True
-                results[nif][name + Parser.CONTEXT_POSTFIX] = score
+                results[nif][name + Parser.CONTEXT_POSTFIX] = record.score
 
-            elif name == "Booking_Comentarios" and comments is not None:
+            elif name == "Booking_Comentarios" and record.review_count is not None:
                 results[nif][name] = True
-                results[nif][name + Parser.CONTEXT_POSTFIX] = comments
+                results[nif][name + Parser.CONTEXT_POSTFIX] = record.review_count
 
-            elif name == "Booking_Estrellas" and booking_stars is not None:
+            elif name == "Booking_Estrellas" and record.stars is not None:
                 results[nif][name] = True
-                results[nif][name + Parser.CONTEXT_POSTFIX] = booking_stars
+                results[nif][name + Parser.CONTEXT_POSTFIX] = record.stars
 
-            elif name == "Booking_Certificados_Sostenibilidad" and booking_cert_content is not None:
+            elif name == "Booking_Certificados_Sostenibilidad" and record.chain_programmes is not None:
                 results[nif][name] = True
-                results[nif][name + Parser.CONTEXT_POSTFIX] = ";".join(booking_cert_content)
+                results[nif][name + Parser.CONTEXT_POSTFIX] = ";".join(record.chain_programmes)
 
-            elif name == "Booking_Nivel_Sostenibilidad" and booking_sustainability_tier is not None:
+            elif name == "Booking_Nivel_Sostenibilidad" and record.tier is not None:
                 results[nif][name] = True
-                results[nif][name + Parser.CONTEXT_POSTFIX] = booking_sustainability_tier
-                print(nif, booking_sustainability_tier)
-
-    @staticmethod
-    def _get_booking_reviews(booking_review_content: List) -> str:
-        comments = [div.text for div in booking_review_content if div.text.endswith("comentarios")][0]
-        regex_result = Parser._BOOKING_COMMENTS_REGEX.search(comments)
-        if regex_result is not None:
-            comments = regex_result.group(1)
-        return comments
-
-    @staticmethod
-    def _get_booking_score(booking_review_content: List) -> str:
-        score = [div.attrs["aria-label"] for div in booking_review_content
-                 if "aria-label" in div.attrs and div.attrs["aria-label"].startswith("Puntuación")]
-        if len(score) != 1:
-            raise RuntimeError("Problem retrieving Puntuación")
-        score = score[0]
-        regex_result = Parser._BOOKING_SCORE_REGEX.search(score)
-        if regex_result is not None:
-            score = regex_result.group(1)
-        return score
+                results[nif][name + Parser.CONTEXT_POSTFIX] = record.tier
 
     @staticmethod
-    def _process_google(soup: BeautifulSoup, indicators: Dict, nif: str, results: Dict) -> None:
-        all_h4 = soup.find_all("h4")
-
-        expected_keywords = []
-        for name in indicators:
-            expected_keywords.extend(indicators[name]["keywords"])
-
-        all_div = [div for div in soup.find_all("div")
-                   if "aria-label" in div.attrs and (div.attrs["aria-label"].lower() in expected_keywords
-                                                     or Parser._GOOGLE_STARS_REGEX.match(
-                        div.attrs["aria-label"]) is not None)]
+    def _process_google(nodes: GoogleNodes, indicators: Dict, nif: str, results: Dict) -> None:
+        index = index_google(nodes)
 
         # Find indicators
-        for name in tqdm(indicators, desc="Searching indicators"):
+        for name in indicators:
             if results[nif][name] != "":
                 continue  # skip if this indicator is already filled
 
@@ -289,28 +512,21 @@ class Parser:
             keywords = indicators[name]["keywords"]
             for keyword in keywords:
                 if extraction_type == ExtractionTypes.SECTION:
-                    for h4 in all_h4:
-                        if keyword == h4.text.lower():
-                            results[nif][name] = True
-                            results[nif][name + Parser.CONTEXT_POSTFIX] = h4.text
-                            results[nif][name + Parser.CONTEXT_POSTFIX] += ";" + ";".join(list(h4.nextSibling.strings))
-                            break
+                    h4 = index.headings.get(keyword)
+                    if h4 is not None:
+                        results[nif][name] = True
+                        results[nif][name + Parser.CONTEXT_POSTFIX] = h4.text + ";" + ";".join(h4.sibling_strings)
                 elif extraction_type == ExtractionTypes.PHRASE:
-                    for div in all_div:
-                        if keyword == div.attrs["aria-label"].lower():
-                            results[nif][name] = True
-                            results[nif][name + Parser.CONTEXT_POSTFIX] = div.text
-                            break
-                elif name in ["Google_Reseñas", "Google_Puntuación"]:
-                    for div in all_div:
-                        regex_result = Parser._GOOGLE_STARS_REGEX.match(div.attrs["aria-label"])
-                        if regex_result is not None:
-                            results[nif][name] = True
-                            if name == "Google_Reseñas":
-                                results[nif][name + Parser.CONTEXT_POSTFIX] = regex_result.group(2)
-                            elif name == "Google_Puntuación":
-                                results[nif][name + Parser.CONTEXT_POSTFIX] = regex_result.group(1)
-                            break
+                    div = index.labels.get(keyword)
+                    if div is not None:
+                        results[nif][name] = True
+                        results[nif][name + Parser.CONTEXT_POSTFIX] = div.text
+                elif name == "Google_Reseñas" and index.reviews is not None:
+                    results[nif][name] = True
+                    results[nif][name + Parser.CONTEXT_POSTFIX] = index.reviews
+                elif name == "Google_Puntuación" and index.score is not None:
+                    results[nif][name] = True
+                    results[nif][name + Parser.CONTEXT_POSTFIX] = index.score
 
                 if results[nif][name] is True:
                     break
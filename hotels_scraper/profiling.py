@@ -0,0 +1,100 @@
+import json
+import platform
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# (stage, flavor, nif) -> [count, wall, cpu]
+Stats = Dict[Tuple[str, Optional[str], Optional[str]], List[float]]
+
+
+class Profiler:
+    """Wall-clock and CPU time spent in every stage of the pipeline, per flavor and per NIF.
+
+    A disabled profiler doesn't measure anything, so instrumented code doesn't need to check.
+    Worker processes profile with their own instance and their stats are merged by the parent.
+    """
+    VERSION = 1
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._stats: Stats = {}
+        self._started = time.time()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+    @property
+    def stats(self) -> Stats:
+        return self._stats
+
+    @contextmanager
+    def stage(self, name: str, flavor: Optional[str] = None, nif: Optional[str] = None) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.add(name, flavor, nif, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def add(self, name: str, flavor: Optional[str], nif: Optional[str], wall: float, cpu: float,
+            count: int = 1) -> None:
+        if not self.enabled:
+            return
+        key = (name, None if flavor is None else str(flavor), nif)
+        entry = self._stats.setdefault(key, [0, 0.0, 0.0])
+        entry[0] += count
+        entry[1] += wall
+        entry[2] += cpu
+
+    def merge(self, stats: Stats) -> None:
+        for (name, flavor, nif), (count, wall, cpu) in stats.items():
+            self.add(name, flavor, nif, wall, cpu, count)
+
+    def totals(self, per_nif: bool = False) -> Stats:
+        """Stats aggregated per stage and flavor, or per NIF"""
+        totals = {}
+        for (name, flavor, nif), (count, wall, cpu) in self._stats.items():
+            key = (None, None, nif) if per_nif else (name, flavor, None)
+            entry = totals.setdefault(key, [0, 0.0, 0.0])
+            entry[0] += count
+            entry[1] += wall
+            entry[2] += cpu
+        return totals
+
+    def report(self, top: int = 10) -> str:
+        lines = [f"{'stage':<10} {'flavor':<8} {'count':>7} {'wall (s)':>10} {'cpu (s)':>10}"]
+        for (name, flavor, _), (count, wall, cpu) in self._sorted_totals():
+            lines.append(f"{name:<10} {flavor or '-':<8} {count:>7} {wall:>10.3f} {cpu:>10.3f}")
+
+        slowest = sorted(((nif, stats) for (_, _, nif), stats in self.totals(per_nif=True).items() if nif is not None),
+                         key=lambda item: item[1][1], reverse=True)[:top]
+        if len(slowest) > 0:
+            lines.append("Slowest NIFs (wall time of all their stages):")
+            lines.extend(f"  {nif:<12} {wall:>10.3f} s" for nif, (_, wall, _) in slowest)
+
+        lines.append(f"Total: {time.perf_counter() - self._wall:.3f} s wall, "
+                     f"{time.process_time() - self._cpu:.3f} s cpu in the main process")
+        return "\n".join(lines)
+
+    def write(self, path: str, extra: Optional[Dict] = None) -> None:
+        """Metrics as JSON, to compare runs"""
+        metrics = {
+            "version": Profiler.VERSION,
+            "started": self._started,
+            "wall": time.perf_counter() - self._wall,
+            "cpu": time.process_time() - self._cpu,
+            "python": platform.python_version(),
+            **(extra or {}),
+            "totals": [{"stage": name, "flavor": flavor, "count": count, "wall": wall, "cpu": cpu}
+                       for (name, flavor, _), (count, wall, cpu) in self._sorted_totals()],
+            "stages": [{"stage": name, "flavor": flavor, "nif": nif, "count": count, "wall": wall, "cpu": cpu}
+                       for (name, flavor, nif), (count, wall, cpu) in self._stats.items()],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(metrics, f, indent=2, ensure_ascii=False)
+
+    def _sorted_totals(self) -> List[Tuple[Tuple[str, Optional[str], Optional[str]], List[float]]]:
+        return sorted(self.totals().items(), key=lambda item: (item[0][0], item[0][1] or ""))
@@ -0,0 +1,146 @@
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import threading
+from typing import Optional
+
+from tqdm import tqdm
+
+LOGGER_NAME = "hotels_scraper"
+
+
+class JsonLinesHandler(logging.Handler):
+    """Appends every record to a JSON lines file with the NIF, file and reason of the failure"""
+
+    def __init__(self, path: str, level: int = logging.WARNING):
+        super().__init__(level)
+        self._path = path
+
+    def emit(self, record: logging.LogRecord) -> None:
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "nif": getattr(record, "nif", None),
+            "file": getattr(record, "file", None),
+            "reason": record.getMessage(),
+        }
+        try:
+            with open(self._path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError:
+            self.handleError(record)
+
+
+class TqdmHandler(logging.Handler):
+    """Writes records through tqdm, so they don't break the progress bar"""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            tqdm.write(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+class _ConsoleFilter(logging.Filter):
+    # records about a single NIF only go to the failures file, unless they are errors
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.ERROR or not hasattr(record, "nif")
+
+
+def configure_logging(failures_path: Optional[str] = None, level: int = logging.INFO) -> None:
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level)
+    logger.handlers.clear()
+    logger.propagate = False
+
+    console = TqdmHandler()
+    console.addFilter(_ConsoleFilter())
+    logger.addHandler(console)
+    if failures_path is not None:
+        logger.addHandler(JsonLinesHandler(failures_path))
+
+
+class ProgressReporter(logging.Filter):
+    """Worker side of a ProgressMonitor: counters and log records are sent through its queue.
+
+    Records logged while a file is being processed are tagged with its NIF and path.
+    """
+
+    def __init__(self, queue: multiprocessing.Queue, level: int):
+        super().__init__()
+        self._queue = queue
+        self._level = level
+        self._nif: Optional[str] = None
+        self._file: Optional[str] = None
+
+    def install(self) -> None:
+        handler = logging.handlers.QueueHandler(self._queue)
+        handler.addFilter(self)
+        logger = logging.getLogger(LOGGER_NAME)
+        logger.setLevel(self._level)
+        logger.handlers = [handler]
+        logger.propagate = False
+
+    def start(self, nif: str, html_file: str) -> None:
+        self._nif = nif
+        self._file = html_file
+
+    def done(self, size: int) -> None:
+        self._queue.put((1, size))
+        self._nif = None
+        self._file = None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self._nif is not None and not hasattr(record, "nif"):
+            record.nif = self._nif
+            record.file = self._file
+        return True
+
+
+class ProgressMonitor:
+    """Renders one aggregate progress bar from the counters reported by all workers.
+
+    Log records of the workers arrive through the same queue and are handled here, so only
+    the parent process writes to the terminal and to the failures file.
+    """
+
+    def __init__(self, total: int, desc: str):
+        self._total = total
+        self._desc = desc
+        self._queue = multiprocessing.Queue()
+        self._bar: Optional[tqdm] = None
+        self._thread: Optional[threading.Thread] = None
+        self._bytes = 0
+        self._failures = 0
+
+    def reporter(self) -> ProgressReporter:
+        return ProgressReporter(self._queue, logging.getLogger(LOGGER_NAME).getEffectiveLevel())
+
+    def __enter__(self) -> "ProgressMonitor":
+        self._bar = tqdm(total=self._total, desc=self._desc, unit="file")
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        self._bar.close()
+
+    def _drain(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if isinstance(item, logging.LogRecord):
+                if item.levelno >= logging.ERROR:
+                    self._failures += 1
+                logger = logging.getLogger(item.name)
+                if logger.isEnabledFor(item.levelno):
+                    logger.handle(item)
+                continue
+            files, size = item
+            self._bytes += size
+            self._bar.set_postfix(MB=f"{self._bytes / 2 ** 20:.1f}", failed=self._failures, refresh=False)
+            self._bar.update(files)
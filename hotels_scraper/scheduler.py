@@ -0,0 +1,296 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional
+from urllib.parse import urlparse
+
+from tqdm import tqdm
+
+from hotels_scraper.fetchers import Fetcher, FetchError, FetchResponse
+from hotels_scraper.manifest import FetchManifest
+from hotels_scraper.profiling import Profiler
+from hotels_scraper.storage import DumpStore, LooseStore
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}  # the host asks to slow down
+
+# tells why a fetched page can't be saved, None when it is what was expected
+PageValidator = Callable[[str], Optional[str]]
+
+
+class FetchJob(NamedTuple):
+    nif: str
+    url: str
+    html_file: str
+
+
+class TokenBucket:
+    """Requests allowed to a host: `rate` per second on average, in bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: float = 1):
+        self.rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def delay(self) -> float:
+        """Takes a token, returns how long to wait until it is available"""
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        return max(-self._tokens / self.rate, 0)
+
+
+class HostLimiter:
+    """Politeness towards a single host: AIMD limits of its request rate and of the simultaneous requests.
+
+    Both limits grow additively with every successful response, the concurrency by one and the rate by one
+    request per second after about as many requests as the current limit, up to `max_concurrency` and
+    `max_rate`. Both halve when the host throttles a request (multiplicative decrease), at most once for all
+    the requests sent before the previous decrease, and the host is paused for the backoff of the request.
+    Without a `max_rate` the rate is unlimited until the host first throttles, then it starts from half the
+    rate requests were being sent at. The state outlives a scheduler run, so a crawl remembers across its
+    waves how fast each host can be fetched.
+    """
+    MIN_RATE = 0.1
+
+    def __init__(self, max_concurrency: int, max_rate: Optional[float] = None):
+        self._max_concurrency = max_concurrency
+        self._max_rate = max_rate
+        self._limit = float(max_concurrency)
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._bucket = TokenBucket(max_rate) if max_rate is not None else None
+        self._sent: Deque[float] = deque()  # when the requests of the last second were sent
+        self._paused_until = 0.0
+        self._decreased = 0.0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def rate(self) -> Optional[float]:
+        return self._bucket.rate if self._bucket is not None else None
+
+    async def acquire(self) -> float:
+        """Waits for a slot and a turn to send a request, returns when it is sent"""
+        while self._active >= self.limit:
+            waiter = asyncio.get_event_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+        self._active += 1
+        try:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            if self._bucket is not None:
+                await asyncio.sleep(self._bucket.delay())
+        except BaseException:
+            self.release()
+            raise
+        sent = time.monotonic()
+        self._sent.append(sent)
+        while self._sent[0] < sent - 1:
+            self._sent.popleft()
+        return sent
+
+    def release(self) -> None:
+        self._active -= 1
+        self._wake()
+
+    def succeeded(self) -> None:
+        self._limit = min(self._limit + 1 / self._limit, self._max_concurrency)
+        if self._bucket is not None:
+            self._bucket.rate += 1 / self._bucket.rate
+            if self._max_rate is not None:
+                self._bucket.rate = min(self._bucket.rate, self._max_rate)
+        self._wake()
+
+    def throttled(self, sent: float, pause: float) -> None:
+        """The host throttled the request sent at `sent`: backs off and pauses the host for `pause` seconds"""
+        self._paused_until = max(self._paused_until, time.monotonic() + pause)
+        if sent < self._decreased:
+            return  # sent at the previous rate, which was already decreased
+        now = time.monotonic()
+        self._decreased = now
+        self._limit = max(self._limit / 2, 1)
+        # rate of the requests sent in the last second
+        sending = len(self._sent) / max(now - self._sent[0], 0.1) if len(self._sent) > 0 else HostLimiter.MIN_RATE
+        if self._bucket is None:
+            self._bucket = TokenBucket(sending)
+        self._bucket.rate = max(min(self._bucket.rate, sending) / 2, HostLimiter.MIN_RATE)
+
+    def _wake(self) -> None:
+        free = self.limit - self._active
+        while free > 0 and len(self._waiters) > 0:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+
+class DownloadScheduler:
+    """Downloads many pages concurrently with a global and a per-host concurrency limit.
+
+    Each host has its own HostLimiter: requests are spaced by `rate_per_host` and the concurrency against
+    it backs off while it throttles (HTTP 429 or 503). Failed fetches, throttled responses and pages
+    rejected by the validator of the run (blocked or captcha pages) are requeued up to `max_retries`
+    times, after an exponential backoff or the Retry-After of the response; the slots are released
+    while waiting, so other pages go first. Pages that never pass aren't saved.
+
+    When profiling, the "fetch" stage only records wall-clock time: the CPU time of concurrent
+    downloads can't be attributed to a single page.
+
+    Pages are saved in `store`, as loose html files by default. With a manifest, every saved page
+    is recorded in it. Pages already saved are revalidated with a conditional request when the
+    fetcher supports it, and are only rewritten if their content changed, so the parser doesn't
+    process them again.
+    """
+
+    def __init__(self, concurrency: int = 8, per_host_concurrency: int = 2, profiler: Optional[Profiler] = None,
+                 manifest: Optional[FetchManifest] = None, store: Optional[DumpStore] = None,
+                 rate_per_host: Optional[float] = None, max_retries: int = 4, backoff: float = 1.0,
+                 max_backoff: float = 60.0):
+        self._concurrency = concurrency
+        self._per_host_concurrency = per_host_concurrency
+        self._profiler = profiler or Profiler(enabled=False)
+        self._manifest = manifest
+        self._store = store or LooseStore(os.curdir)
+        self._rate_per_host = rate_per_host
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._hosts: Dict[str, HostLimiter] = {}
+
+    def host(self, url: str) -> HostLimiter:
+        hostname = urlparse(url).hostname or ""
+        if hostname not in self._hosts:
+            self._hosts[hostname] = HostLimiter(self._per_host_concurrency, self._rate_per_host)
+        return self._hosts[hostname]
+
+    def run(self, jobs: List[FetchJob], fetcher: Fetcher, desc: str = "Downloading",
+            on_done: Optional[Callable[[FetchJob, bool], None]] = None, flavor: Optional[str] = None,
+            validate: Optional[PageValidator] = None) -> List[FetchJob]:
+        """Runs all jobs and returns the ones whose page was saved.
+
+        `on_done` is called as soon as each job finishes, with whether its page was saved.
+        """
+        if len(jobs) == 0:
+            return []
+        return asyncio.run(self._run(jobs, fetcher, desc, on_done, flavor, validate))
+
+    async def _run(self, jobs: List[FetchJob], fetcher: Fetcher, desc: str,
+                   on_done: Optional[Callable[[FetchJob, bool], None]], flavor: Optional[str],
+                   validate: Optional[PageValidator]) -> List[FetchJob]:
+        global_slots = asyncio.Semaphore(self._concurrency)
+
+        with tqdm(total=len(jobs), desc=desc) as progress:
+            async with fetcher:
+                saved = await asyncio.gather(*(self._download(job, fetcher, global_slots, progress, on_done, flavor,
+                                                              validate)
+                                               for job in jobs))
+        return [job for job, ok in zip(jobs, saved) if ok]
+
+    async def _download(self, job: FetchJob, fetcher: Fetcher, global_slots: asyncio.Semaphore, progress: tqdm,
+                        on_done: Optional[Callable[[FetchJob, bool], None]], flavor: Optional[str],
+                        validate: Optional[PageValidator]) -> bool:
+        saved = await self._fetch_and_save(job, fetcher, global_slots, flavor, validate)
+        progress.update()
+        if on_done is not None:
+            on_done(job, saved)
+        return saved
+
+    async def _fetch_and_save(self, job: FetchJob, fetcher: Fetcher, global_slots: asyncio.Semaphore,
+                              flavor: Optional[str], validate: Optional[PageValidator]) -> bool:
+        headers = {}
+        if self._manifest is not None and fetcher.conditional:
+            headers = self._manifest.conditional_headers(job.html_file, job.url)
+
+        host = self.host(job.url)
+        for attempt in range(self._max_retries + 1):
+            # wait for the host first, so busy hosts don't hold global slots
+            sent = await host.acquire()
+            try:
+                async with global_slots:
+                    started = time.perf_counter()
+                    try:
+                        response = await fetcher.fetch(job.url, headers or None)
+                    except FetchError as e:
+                        response = e
+                    finally:
+                        self._profiler.add("fetch", flavor, job.nif, time.perf_counter() - started, 0.0)
+            finally:
+                host.release()
+
+            if isinstance(response, FetchError):
+                reason, throttled, retry_after = str(response), False, None
+            elif response.status == 304 and len(headers) > 0:
+                host.succeeded()
+                self._manifest.revalidated(job.html_file, response.headers)
+                return True
+            elif response.status in RETRY_STATUSES:
+                reason, throttled = f"HTTP {response.status}", response.status in THROTTLE_STATUSES
+                retry_after = DownloadScheduler._retry_after(response)
+            elif response.status >= 300:
+                # redirects are followed by the fetchers and a 304 that wasn't asked for has no page to save
+                logger.warning(f"Can't download {job.url}: HTTP {response.status}",
+                               extra={"nif": job.nif, "file": job.html_file})
+                return False
+            else:
+                reason = validate(response.text) if validate is not None else None
+                if reason is None:
+                    host.succeeded()
+                    self._save(job, response, flavor)
+                    return True
+                # the page is fetched again, but only the statuses of the host change its limits
+                throttled, retry_after = False, None
+
+            if attempt == self._max_retries:
+                break
+            delay = self._delay(attempt, retry_after)
+            if throttled:
+                host.throttled(sent, delay)
+            logger.debug(f"Retrying {job.url} in {delay:.1f} s: {reason}")
+            await asyncio.sleep(delay)
+
+        logger.warning(f"Can't download {job.url} after {self._max_retries + 1} attempts: {reason}",
+                       extra={"nif": job.nif, "file": job.html_file})
+        return False
+
+    def _delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        # exponential backoff with jitter, so requeued pages don't come back all at once
+        backoff = min(self._backoff * 2 ** attempt, self._max_backoff)
+        backoff = random.uniform(backoff / 2, backoff)
+        return backoff if retry_after is None else max(backoff, min(retry_after, self._max_backoff))
+
+    @staticmethod
+    def _retry_after(response: FetchResponse) -> Optional[float]:
+        value = next((value for name, value in response.headers.items() if name.lower() == "retry-after"), None)
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            return None
+
+    def _save(self, job: FetchJob, response: FetchResponse, flavor: Optional[str]) -> None:
+        content_hash = FetchManifest.content_hash(response.text) if self._manifest is not None else None
+        entry = self._manifest.get(job.html_file) if self._manifest is not None else None
+        # an identical page is not rewritten, so it keeps its modification time and isn't parsed again
+        if entry is None or entry["hash"] != content_hash or not self._store.exists(job.html_file):
+            with self._profiler.stage("write", flavor, job.nif):
+                self._store.write(job.html_file, response.text)
+        if self._manifest is not None:
+            self._manifest.record(job.html_file, job.url, response.status, response.headers, content_hash)
@@ -0,0 +1,343 @@
+import codecs
+import gzip
+import json
+import os
+import time
+import zlib
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+
+class PageInfo(NamedTuple):
+    html_file: str
+    size: int  # in bytes, as stored by gzip dumps and uncompressed otherwise; weighs the work of parsing it
+    mtime_ns: int
+
+
+class DumpStore(ABC):
+    """Storage of the pages of a dump folder.
+
+    Whatever the format, a page is named by the path its loose html file would have,
+    <dump>/<nif>/<nif>_<flavor>[_<hash>].html, so downloads, work units, manifests and
+    failure records refer to pages the same way. The folder of each NIF is kept, it also
+    holds its crawl manifest. Pages are listed sorted by name, so the merge order of their results
+    is the same whatever the format or filesystem.
+
+    Pages can be read whole or in chunks: `read_chunks` never holds more than a chunk of a page,
+    so parsers that consume it incrementally can stop before the end of the page.
+    """
+    name = ""
+    CHUNK_SIZE = 1 << 16  # characters
+
+    def __init__(self, folder: str):
+        self._folder = folder
+
+    @property
+    def folder(self) -> str:
+        return self._folder
+
+    def exists(self, html_file: str) -> bool:
+        return self.stat(html_file) is not None
+
+    def find(self, nif: str, prefix: str) -> List[PageInfo]:
+        """Pages of `nif` whose name starts with `prefix`"""
+        return [page for page in self.pages(nif) if os.path.basename(page.html_file).startswith(prefix)]
+
+    @staticmethod
+    def _sorted_entries(folder: str) -> List[os.DirEntry]:
+        return sorted(os.scandir(folder), key=lambda entry: entry.name)
+
+    @abstractmethod
+    def stat(self, html_file: str) -> Optional[PageInfo]:
+        pass
+
+    @abstractmethod
+    def pages(self, nif: str) -> List[PageInfo]:
+        pass
+
+    @abstractmethod
+    def read(self, html_file: str) -> str:
+        pass
+
+    @abstractmethod
+    def read_chunks(self, html_file: str, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+        """Text of the page in successive chunks of up to `chunk_size` characters"""
+        pass
+
+    @abstractmethod
+    def write(self, html_file: str, text: str, mtime_ns: Optional[int] = None) -> None:
+        """Saves the page, replacing any previous version. `mtime_ns` keeps the time of a migrated page"""
+        pass
+
+    @abstractmethod
+    def delete(self, nif: str) -> None:
+        """Removes every page of `nif` kept in this format"""
+        pass
+
+    def _nif_folder(self, nif: str) -> str:
+        return os.path.join(self._folder, nif)
+
+
+class LooseStore(DumpStore):
+    """One uncompressed html file per page, the original layout"""
+    name = "loose"
+
+    def stat(self, html_file: str) -> Optional[PageInfo]:
+        try:
+            stat = os.stat(html_file)
+        except FileNotFoundError:
+            return None
+        return PageInfo(html_file, stat.st_size, stat.st_mtime_ns)
+
+    def pages(self, nif: str) -> List[PageInfo]:
+        folder = self._nif_folder(nif)
+        if not os.path.isdir(folder):
+            return []
+        return [PageInfo(os.path.join(folder, entry.name), entry.stat().st_size, entry.stat().st_mtime_ns)
+                for entry in DumpStore._sorted_entries(folder) if entry.name.endswith(".html")]
+
+    def read(self, html_file: str) -> str:
+        with open(html_file, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def read_chunks(self, html_file: str, chunk_size: int = DumpStore.CHUNK_SIZE) -> Iterator[str]:
+        with open(html_file, "r", encoding="utf-8") as f:
+            yield from iter(lambda: f.read(chunk_size), "")
+
+    def write(self, html_file: str, text: str, mtime_ns: Optional[int] = None) -> None:
+        # write to a temporary file first so an interrupted run never leaves half a page behind
+        os.makedirs(os.path.dirname(html_file), exist_ok=True)
+        tmp_file = html_file + ".part"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(text)
+        if mtime_ns is not None:
+            os.utime(tmp_file, ns=(mtime_ns, mtime_ns))
+        os.replace(tmp_file, html_file)
+
+    def delete(self, nif: str) -> None:
+        for page in self.pages(nif):
+            os.remove(page.html_file)
+
+
+class GzipStore(DumpStore):
+    """One gzip compressed file per page, <page>.html.gz"""
+    name = "gzip"
+    SUFFIX = ".gz"
+    COMPRESS_LEVEL = 6
+
+    def stat(self, html_file: str) -> Optional[PageInfo]:
+        # the compressed size, reading the uncompressed one from the gzip trailer costs an open per page
+        try:
+            stat = os.stat(html_file + GzipStore.SUFFIX)
+        except FileNotFoundError:
+            return None
+        return PageInfo(html_file, stat.st_size, stat.st_mtime_ns)
+
+    def pages(self, nif: str) -> List[PageInfo]:
+        folder = self._nif_folder(nif)
+        if not os.path.isdir(folder):
+            return []
+        return [PageInfo(entry.path[:-len(GzipStore.SUFFIX)], entry.stat().st_size, entry.stat().st_mtime_ns)
+                for entry in DumpStore._sorted_entries(folder) if entry.name.endswith(".html" + GzipStore.SUFFIX)]
+
+    def read(self, html_file: str) -> str:
+        # decompressed while it is read, the compressed file is never loaded whole
+        with gzip.open(html_file + GzipStore.SUFFIX, "rt", encoding="utf-8") as f:
+            return f.read()
+
+    def read_chunks(self, html_file: str, chunk_size: int = DumpStore.CHUNK_SIZE) -> Iterator[str]:
+        with gzip.open(html_file + GzipStore.SUFFIX, "rt", encoding="utf-8") as f:
+            yield from iter(lambda: f.read(chunk_size), "")
+
+    def write(self, html_file: str, text: str, mtime_ns: Optional[int] = None) -> None:
+        os.makedirs(os.path.dirname(html_file), exist_ok=True)
+        gz_file = html_file + GzipStore.SUFFIX
+        tmp_file = gz_file + ".part"
+        with gzip.open(tmp_file, "wt", encoding="utf-8", compresslevel=GzipStore.COMPRESS_LEVEL) as f:
+            f.write(text)
+        if mtime_ns is not None:
+            os.utime(tmp_file, ns=(mtime_ns, mtime_ns))
+        os.replace(tmp_file, gz_file)
+
+    def delete(self, nif: str) -> None:
+        for page in self.pages(nif):
+            os.remove(page.html_file + GzipStore.SUFFIX)
+
+
+class PackStore(DumpStore):
+    """Every page of a NIF appended, gzip compressed, to a single <nif>.pack file.
+
+    An index of JSON lines, <nif>.pack.idx, gives the offset and length of each page. A page
+    written again is appended and its latest index entry wins; the index line is written after
+    the page, so an interrupted write leaves unreferenced bytes but never a broken page. Only one
+    process may write the pages of a NIF at a time. Indexes are read incrementally, a process only
+    reads the lines appended since it last looked.
+    """
+    name = "pack"
+    PACK_SUFFIX = ".pack"
+    INDEX_SUFFIX = ".pack.idx"
+    COMPRESS_LEVEL = 6
+
+    def __init__(self, folder: str):
+        super().__init__(folder)
+        self._indexes: Dict[str, Tuple[int, Dict[str, Dict]]] = {}  # nif -> (bytes of the index read, entries)
+
+    def __getstate__(self) -> Dict:
+        # indexes are read again by each process
+        return {"_folder": self._folder, "_indexes": {}}
+
+    def _paths(self, nif: str) -> Tuple[str, str]:
+        folder = self._nif_folder(nif)
+        return os.path.join(folder, nif + PackStore.PACK_SUFFIX), os.path.join(folder, nif + PackStore.INDEX_SUFFIX)
+
+    @staticmethod
+    def _nif_of(html_file: str) -> str:
+        return os.path.basename(os.path.dirname(html_file))
+
+    def _index(self, nif: str) -> Dict[str, Dict]:
+        _, index_path = self._paths(nif)
+        read, entries = self._indexes.get(nif, (0, {}))
+        try:
+            size = os.path.getsize(index_path)
+        except FileNotFoundError:
+            self._indexes.pop(nif, None)
+            return {}
+        if size < read:  # replaced by a migration
+            read, entries = 0, {}
+        if size > read:
+            entries = dict(entries)
+            with open(index_path, "rb") as f:
+                f.seek(read)
+                tail = f.read(size - read)
+            complete = tail.rfind(b"\n") + 1  # the last line may still be being written
+            for line in tail[:complete].splitlines():
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # last line of an interrupted run
+                entries[entry["name"]] = entry
+            read += complete
+        self._indexes[nif] = (read, entries)
+        return entries
+
+    def stat(self, html_file: str) -> Optional[PageInfo]:
+        entry = self._index(PackStore._nif_of(html_file)).get(os.path.basename(html_file))
+        if entry is None:
+            return None
+        return PageInfo(html_file, entry["size"], entry["mtime_ns"])
+
+    def pages(self, nif: str) -> List[PageInfo]:
+        folder = self._nif_folder(nif)
+        return [PageInfo(os.path.join(folder, name), entry["size"], entry["mtime_ns"])
+                for name, entry in sorted(self._index(nif).items())]
+
+    def read(self, html_file: str) -> str:
+        pack_path, entry = self._entry(html_file)
+        with open(pack_path, "rb") as f:
+            f.seek(entry["offset"])
+            data = f.read(entry["length"])
+        return gzip.decompress(data).decode("utf-8")
+
+    def read_chunks(self, html_file: str, chunk_size: int = DumpStore.CHUNK_SIZE) -> Iterator[str]:
+        pack_path, entry = self._entry(html_file)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)  # gzip member
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        with open(pack_path, "rb") as f:
+            f.seek(entry["offset"])
+            remaining = entry["length"]
+            data = b""
+            while len(data) > 0 or remaining > 0:
+                if len(data) == 0:
+                    data = f.read(min(chunk_size, remaining))
+                    if len(data) == 0:
+                        raise EOFError(f"{pack_path} ends within {html_file}")
+                    remaining -= len(data)
+                # pages compress well, the output of each step is bounded too
+                text = decoder.decode(decompressor.decompress(data, chunk_size))
+                data = decompressor.unconsumed_tail
+                if text != "":
+                    yield text
+        text = decoder.decode(decompressor.flush(), final=True)
+        if text != "":
+            yield text
+
+    def _entry(self, html_file: str) -> Tuple[str, Dict]:
+        nif = PackStore._nif_of(html_file)
+        entry = self._index(nif).get(os.path.basename(html_file))
+        if entry is None:
+            raise FileNotFoundError(html_file)
+        pack_path, _ = self._paths(nif)
+        return pack_path, entry
+
+    def write(self, html_file: str, text: str, mtime_ns: Optional[int] = None) -> None:
+        nif = PackStore._nif_of(html_file)
+        pack_path, index_path = self._paths(nif)
+        os.makedirs(os.path.dirname(pack_path), exist_ok=True)
+        raw = text.encode("utf-8")
+        data = gzip.compress(raw, compresslevel=PackStore.COMPRESS_LEVEL, mtime=0)
+        with open(pack_path, "ab") as f:
+            offset = f.tell()
+            f.write(data)
+        entry = {"name": os.path.basename(html_file), "offset": offset, "length": len(data), "size": len(raw),
+                 "mtime_ns": mtime_ns if mtime_ns is not None else time.time_ns()}
+        with open(index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def delete(self, nif: str) -> None:
+        for path in self._paths(nif):
+            if os.path.exists(path):
+                os.remove(path)
+        self._indexes.pop(nif, None)
+
+
+DUMP_STORES = {store.name: store for store in [LooseStore, GzipStore, PackStore]}
+STORE_FILE = "dump_store.json"
+
+
+def stored_format(folder: str) -> str:
+    """Format of the pages of a dump folder, loose when it was never set"""
+    try:
+        with open(os.path.join(folder, STORE_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)["format"]
+    except FileNotFoundError:
+        return LooseStore.name
+
+
+def set_format(folder: str, name: str) -> None:
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, STORE_FILE), "w", encoding="utf-8") as f:
+        json.dump({"format": name}, f)
+
+
+def open_store(folder: str, name: Optional[str] = None) -> DumpStore:
+    """Store of a dump folder, in the format recorded in it.
+
+    `name` sets the format of a new folder; an existing folder with pages in another format
+    has to be converted with utils.migrate_dump first.
+    """
+    current = stored_format(folder)
+    if name is not None and name != current:
+        if any(os.path.isdir(os.path.join(folder, nif)) for nif in _listdir(folder)):
+            raise ValueError(f"{folder} stores its pages as {current}, convert it with "
+                             f"python -m utils.migrate_dump --dump {folder} --to {name}")
+        set_format(folder, name)
+        current = name
+    return DUMP_STORES[current](folder)
+
+
+def _listdir(folder: str) -> List[str]:
+    return os.listdir(folder) if os.path.isdir(folder) else []
+
+
+def migrate_nif(source: DumpStore, target: DumpStore, nif: str) -> int:
+    """Copies the pages of `nif` between stores of the same folder, then deletes them from `source`.
+
+    Pages keep their order and modification time, so parse results and resume fingerprints
+    only change where the format itself is part of them. Returns the number of pages moved.
+    """
+    pages = source.pages(nif)
+    for page in pages:
+        target.write(page.html_file, source.read(page.html_file), page.mtime_ns)
+    source.delete(nif)
+    return len(pages)
+
@@ -0,0 +1,203 @@
+import re
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from hotels_scraper.enums import ExtractionTypes
+
+Span = Tuple[int, int]
+
+_SENTENCE_END = re.compile(r"[.!?\r\n|•·]+")
+_TOKEN = re.compile(r"\w+")
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+class Extraction(NamedTuple):
+    hits: int
+    contexts: List[str]
+
+
+class TextIndex:
+    """Headings and numbers of the visible text of a page, as sorted offsets.
+
+    Numbers are found once, the first time they are needed, with a single pass over the text;
+    extractions are then answered by binary searches around the keyword occurrences, so finding
+    all of them doesn't scan the text again per keyword. Sentences and words are only looked up
+    within `CONTEXT_LIMIT` characters of the hits that need them: splitting whole pages costs
+    more than matching them.
+
+    Keywords are found in the normalized text, `offsets` maps them back to `text` (see
+    `normalize`), so contexts are cut from the original text.
+    """
+    CONTEXT_LIMIT = 300  # longer sentences and sections are cut around the hit
+    WORD_WINDOW = 5  # words on each side of a hit of a word indicator
+    _WORD_LIMIT = 40  # longest word looked for around a hit
+
+    def __init__(self, text: str, headings: Iterable[Span] = (), offsets: Optional[List[int]] = None):
+        self._text = text
+        self._offsets = offsets
+        self._headings = sorted(headings)
+        self._heading_starts = [start for start, _ in self._headings]
+        self._heading_bounds = sorted(offset for heading in self._headings for offset in heading)
+        self._numbers: Optional[Tuple[List[int], List[int]]] = None
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def _boundary(self, position: int) -> bool:
+        # only letters or digits on both sides of `position` join them into a word
+        pair = self._text[position - 1:position + 1] if position > 0 else ""
+        return len(pair) < 2 or not pair.isalnum()
+
+    def is_word(self, span: Span) -> bool:
+        """Whether `span` starts and ends at word boundaries, so "agua" is not found in "paraguas" """
+        return self._boundary(span[0]) and self._boundary(span[1])
+
+    def sentence(self, position: int) -> Span:
+        """Sentence around `position`, sentences end with punctuation, line breaks and headings.
+
+        Only `CONTEXT_LIMIT` characters on each side of `position` are looked at, longer sentences are cut there.
+        """
+        lower = max(position - TextIndex.CONTEXT_LIMIT, 0)
+        upper = min(position + TextIndex.CONTEXT_LIMIT, len(self._text))
+        i = bisect_right(self._heading_bounds, position)
+        if i > 0:
+            lower = max(lower, self._heading_bounds[i - 1])
+        if i < len(self._heading_bounds):
+            upper = min(upper, self._heading_bounds[i])
+        start = lower
+        for start in self._sentence_ends(lower, position):
+            pass
+        return start, next(self._sentence_ends(position, upper), upper)
+
+    def _sentence_ends(self, start: int, end: int) -> Iterator[int]:
+        for match in _SENTENCE_END.finditer(self._text, start, end):
+            # a period within a word or a number ("3.5", "www.hotel.com") doesn't end a sentence
+            if match.end() == len(self._text) or self._text[match.end()].isspace() or \
+                    match.group().strip(".!?") != "":
+                yield match.end()
+
+    def heading(self, position: int) -> Optional[Span]:
+        """Heading that contains `position`, if any"""
+        i = bisect_right(self._heading_starts, position) - 1
+        if i >= 0 and position < self._headings[i][1]:
+            return self._headings[i]
+        return None
+
+    def section_end(self, heading: Span) -> int:
+        """End of the section under `heading`: the next heading or the end of the text"""
+        i = bisect_right(self._heading_starts, heading[0])
+        return self._heading_starts[i] if i < len(self._heading_starts) else len(self._text)
+
+    def words_around(self, span: Span, window: int) -> Span:
+        """`span` extended by `window` words on each side"""
+        reach = window * TextIndex._WORD_LIMIT
+        before = list(_TOKEN.finditer(self._text, max(span[0] - reach, 0), span[0]))[-window:]
+        after = list(islice(_TOKEN.finditer(self._text, span[1], span[1] + reach), window))
+        return before[0].start() if before else span[0], after[-1].end() if after else span[1]
+
+    def number_near(self, span: Span, within: Span) -> Optional[Span]:
+        """First number after `span` within the `within` span, otherwise the last one before it"""
+        if self._numbers is None:
+            self._numbers = TextIndex._spans(_NUMBER, self._text)
+        starts, ends = self._numbers
+        i = bisect_left(starts, span[1])
+        if i < len(starts) and ends[i] <= within[1]:
+            return starts[i], ends[i]
+        i = bisect_right(ends, span[0]) - 1
+        if i >= 0 and starts[i] >= within[0]:
+            return starts[i], ends[i]
+        return None
+
+    def extract(self, forms: List[str], occurrences: Dict[str, List[int]], extraction_type: ExtractionTypes,
+                max_contexts: int) -> Extraction:
+        """Hits of the keyword forms of an indicator and the contexts of the first `max_contexts` of them.
+
+        `occurrences` are the offsets of every form in the normalized text. Only whole words count, and a
+        form within a longer one of the same indicator ("agua" in "consumo de agua") is the same hit.
+        """
+        # longest form first at each offset, the offsets of each form are already in order
+        found = [(start, -len(form)) for form in forms for start in occurrences.get(form, ())]
+        if len(forms) > 1:
+            found.sort()
+        hits = []
+        for start, length in found:
+            span = (start, start - length)
+            if self._offsets is not None:
+                span = (self._offsets[span[0]], self._offsets[span[1]])
+            if (len(hits) == 0 or span[0] >= hits[-1][1]) and self.is_word(span):
+                hits.append(span)
+
+        if extraction_type == ExtractionTypes.NUMBER:
+            # the number next to each hit is the context, hits without one don't count
+            numbers = [self.number_near(hit, self.sentence(hit[0])) for hit in hits]
+            numbers = [self._text[number[0]:number[1]] for number in numbers if number is not None]
+            return Extraction(len(numbers), list(dict.fromkeys(numbers))[:max_contexts])
+        if extraction_type == ExtractionTypes.SECTION:
+            hits = [hit for hit in hits if self.heading(hit[0]) is not None]  # sections are found by their heading
+
+        # the first hits get the region reported as their context, later hits within it are marked in it too
+        regions: List[Tuple[Span, List[Span]]] = []
+        for hit in hits:
+            if len(regions) > 0 and hit[0] < regions[-1][0][1]:
+                region, region_hits = regions[-1]
+                if extraction_type == ExtractionTypes.WORD:
+                    region = (region[0], self.words_around(hit, TextIndex.WORD_WINDOW)[1])
+                regions[-1] = (region, region_hits + [hit])
+            elif len(regions) < max_contexts:
+                regions.append((self._region(hit, extraction_type), [hit]))
+
+        contexts = []
+        for region, region_hits in regions:
+            if extraction_type == ExtractionTypes.SECTION:
+                heading = self.heading(region[0])
+                context = self._marked(heading, region_hits) + ";" + \
+                    self._text[heading[1]:min(region[1], heading[1] + TextIndex.CONTEXT_LIMIT)]
+            else:
+                context = self._marked(self._clip(region, region_hits), region_hits)
+            context = " ".join(context.split())
+            if context not in contexts:
+                contexts.append(context)
+        return Extraction(len(hits), contexts)
+
+    def _region(self, hit: Span, extraction_type: ExtractionTypes) -> Span:
+        if extraction_type == ExtractionTypes.SECTION:
+            heading = self.heading(hit[0])
+            return heading[0], self.section_end(heading)
+        if extraction_type == ExtractionTypes.WORD:
+            return self.words_around(hit, TextIndex.WORD_WINDOW)
+        return self.sentence(hit[0])
+
+    def _clip(self, region: Span, hits: List[Span]) -> Span:
+        if region[1] - region[0] <= TextIndex.CONTEXT_LIMIT:
+            return region
+        start = max(region[0], min(hits[0][0] - TextIndex.CONTEXT_LIMIT // 2, region[1] - TextIndex.CONTEXT_LIMIT))
+        end = max(min(region[1], start + TextIndex.CONTEXT_LIMIT), hits[0][1])
+        # cut at spaces, so the context doesn't start or end with half a word
+        if start > region[0]:
+            start = self._text.find(" ", start, hits[0][0]) + 1 or start
+        if end < region[1]:
+            space = self._text.rfind(" ", hits[0][1], end)
+            end = space if space >= 0 else end
+        return start, end
+
+    def _marked(self, region: Span, hits: List[Span]) -> str:
+        pieces = []
+        position = region[0]
+        for start, end in hits:
+            if start < position or end > region[1]:
+                continue  # outside the clipped region
+            pieces += [self._text[position:start], "**", self._text[start:end], "**"]
+            position = end
+        pieces.append(self._text[position:region[1]])
+        return "".join(pieces)
+
+    @staticmethod
+    def _spans(regex: "re.Pattern", text: str) -> Tuple[List[int], List[int]]:
+        starts = []
+        ends = []
+        for match in regex.finditer(text):
+            starts.append(match.start())
+            ends.append(match.end())
+        return starts, ends
@@ -0,0 +1,63 @@
+from typing import Dict, List, NamedTuple, Tuple
+
+from hotels_scraper.enums import Flavor
+from hotels_scraper.storage import DumpStore
+
+
+class WorkUnit(NamedTuple):
+    nif: str
+    flavor: Flavor
+    order: Tuple[int, int]  # (flavor, file) position, results are merged in this order
+    html_file: str
+    size: int
+
+
+def plan_units(store: DumpStore, nifs: List[str], flavors: List[Flavor]) -> Dict[str, List[WorkUnit]]:
+    """One unit per page of every NIF, in the order their results must be merged"""
+    units = {}
+    for nif in nifs:
+        units[nif] = []
+        for flavor_index, flavor in enumerate(flavors):
+            for file_index, page in enumerate(store.find(nif, f"{nif}_{flavor}")):
+                units[nif].append(WorkUnit(nif, flavor, (flavor_index, file_index), page.html_file, page.size))
+    return units
+
+
+def balance_chunks(units: Dict[str, List[WorkUnit]], workers: int, batch_size: int = 64,
+                   chunks_per_worker: int = 4) -> List[List[WorkUnit]]:
+    """Groups units into chunks of similar size in bytes.
+
+    NIFs are taken in batches of about `batch_size` units per worker, so their rows complete
+    early in the run. Within a batch, units are sorted by decreasing size (largest first)
+    and packed into `chunks_per_worker` chunks per worker, so a large site is spread over
+    all workers and idle workers keep pulling the remaining chunks.
+    """
+    chunks = []
+    batch = []
+    for nif_units in units.values():
+        batch.extend(nif_units)
+        if len(batch) >= batch_size * workers:
+            chunks.extend(_pack(batch, workers * chunks_per_worker))
+            batch = []
+    if len(batch) > 0:
+        chunks.extend(_pack(batch, workers * chunks_per_worker))
+    return chunks
+
+
+def _pack(batch: List[WorkUnit], number_of_chunks: int) -> List[List[WorkUnit]]:
+    batch = sorted(batch, key=lambda unit: unit.size, reverse=True)
+    target_size = max(sum(unit.size for unit in batch) / number_of_chunks, 1)
+
+    chunks = []
+    chunk = []
+    chunk_size = 0
+    for unit in batch:
+        chunk.append(unit)
+        chunk_size += unit.size
+        if chunk_size >= target_size:
+            chunks.append(chunk)
+            chunk = []
+            chunk_size = 0
+    if len(chunk) > 0:
+        chunks.append(chunk)
+    return chunks
@@ -0,0 +1,179 @@
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from hotels_scraper.enums import Flavor
+from hotels_scraper.work import WorkUnit
+
+Task = Tuple[int, WorkUnit]
+
+
+class WorkQueue:
+    """Html files to parse shared by the workers of several machines, backed by a SQLite file.
+
+    A coordinator plans the tasks of every NIF once; workers claim batches of them with a lease and
+    store the results of each file. Tasks whose lease expires, because their worker died, are claimed
+    again by another one, and a task that kills `max_attempts` workers is given up as failed. Results
+    are keyed by task, so completing a task twice leaves the same row.
+
+    The file lives on the filesystem shared by the machines: it uses the rollback journal and file
+    locks, WAL needs shared memory and doesn't work across machines.
+    """
+    _connections: Dict = {}
+
+    def __init__(self, path: str, lease_timeout: float = 300, max_attempts: int = 3):
+        self._path = path
+        self._lease_timeout = lease_timeout
+        self._max_attempts = max_attempts
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def lease_timeout(self) -> float:
+        return self._lease_timeout
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        # connections can't be shared across processes, so keep one per worker; transactions are explicit
+        key = (os.getpid(), self._path)
+        if key not in WorkQueue._connections:
+            connection = sqlite3.connect(self._path, timeout=600, isolation_level=None)
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS nifs ("
+                               "nif TEXT PRIMARY KEY, "
+                               "fingerprint TEXT NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS tasks ("
+                               "id INTEGER PRIMARY KEY, "
+                               "nif TEXT NOT NULL, "
+                               "flavor TEXT NOT NULL, "
+                               "flavor_order INTEGER NOT NULL, "
+                               "file_order INTEGER NOT NULL, "
+                               "html_file TEXT NOT NULL, "
+                               "size INTEGER NOT NULL, "
+                               "state TEXT NOT NULL DEFAULT 'pending', "  # pending, leased, done or failed
+                               "owner TEXT, "
+                               "expires REAL, "
+                               "attempts INTEGER NOT NULL DEFAULT 0, "
+                               "result TEXT)")
+            connection.execute("CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state)")
+            connection.execute("CREATE INDEX IF NOT EXISTS tasks_nif ON tasks (nif)")
+            WorkQueue._connections[key] = connection
+        return WorkQueue._connections[key]
+
+    def _transaction(self) -> sqlite3.Connection:
+        # writers are serialized from the start, so two workers never claim the same task
+        self._connection.execute("BEGIN IMMEDIATE")
+        return self._connection
+
+    def _run(self, statements) -> None:
+        connection = self._transaction()
+        try:
+            statements(connection)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def configuration(self) -> Optional[Dict]:
+        """Fingerprints of the indicators and options the tasks were planned with"""
+        row = self._connection.execute("SELECT value FROM meta WHERE key = 'configuration'").fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def nif_fingerprints(self) -> Dict[str, str]:
+        return dict(self._connection.execute("SELECT nif, fingerprint FROM nifs"))
+
+    def plan(self, configuration: Dict, nif_fingerprints: Dict[str, str], units: List[WorkUnit]) -> None:
+        """Records the NIFs of the dump and the tasks of those whose fingerprint changed since they were planned.
+
+        `nif_fingerprints` has every NIF of the dump, NIFs no longer in it are dropped; `units` are the
+        html files of the changed NIFs, in the order they should be claimed.
+        """
+        def statements(connection: sqlite3.Connection) -> None:
+            connection.execute("INSERT OR REPLACE INTO meta VALUES ('configuration', ?)",
+                               (json.dumps(configuration, sort_keys=True),))
+            planned = dict(connection.execute("SELECT nif, fingerprint FROM nifs"))
+            for nif in planned.keys() - nif_fingerprints.keys():
+                connection.execute("DELETE FROM tasks WHERE nif = ?", (nif,))
+                connection.execute("DELETE FROM nifs WHERE nif = ?", (nif,))
+            for nif, fingerprint in nif_fingerprints.items():
+                if planned.get(nif) != fingerprint:
+                    connection.execute("DELETE FROM tasks WHERE nif = ?", (nif,))
+                    connection.execute("INSERT OR REPLACE INTO nifs VALUES (?, ?)", (nif, fingerprint))
+            connection.executemany("INSERT INTO tasks (nif, flavor, flavor_order, file_order, html_file, size) "
+                                   "VALUES (?, ?, ?, ?, ?, ?)",
+                                   [(unit.nif, str(unit.flavor), unit.order[0], unit.order[1], unit.html_file,
+                                     unit.size) for unit in units])
+
+        self._run(statements)
+
+    def claim(self, owner: str, count: int) -> List[Task]:
+        """Up to `count` pending tasks, or tasks whose lease expired, leased to `owner`"""
+        now = time.time()
+        tasks = []
+
+        def statements(connection: sqlite3.Connection) -> None:
+            connection.execute("UPDATE tasks SET state = 'failed', owner = NULL "
+                               "WHERE state = 'leased' AND expires < ? AND attempts >= ?", (now, self._max_attempts))
+            rows = connection.execute("SELECT id, nif, flavor, flavor_order, file_order, html_file, size FROM tasks "
+                                      "WHERE state = 'pending' OR (state = 'leased' AND expires < ?) "
+                                      "ORDER BY id LIMIT ?", (now, count)).fetchall()
+            connection.executemany("UPDATE tasks SET state = 'leased', owner = ?, expires = ?, "
+                                   "attempts = attempts + 1 WHERE id = ?",
+                                   [(owner, now + self._lease_timeout, row[0]) for row in rows])
+            tasks.extend((row[0], WorkUnit(row[1], Flavor(row[2]), (row[3], row[4]), row[5], row[6]))
+                         for row in rows)
+
+        self._run(statements)
+        return tasks
+
+    def renew(self, owner: str, task_ids: List[int]) -> None:
+        """Extends the lease of the tasks of `owner` that aren't finished yet"""
+        expires = time.time() + self._lease_timeout
+        self._run(lambda connection: connection.executemany(
+            "UPDATE tasks SET expires = ? WHERE id = ? AND owner = ? AND state = 'leased'",
+            [(expires, task_id, owner) for task_id in task_ids]))
+
+    def complete(self, results: List[Tuple[int, Optional[Dict]]]) -> None:
+        """Stores the results of finished tasks, None if they couldn't be parsed; tasks already done keep theirs"""
+        self._run(lambda connection: connection.executemany(
+            "UPDATE tasks SET state = 'done', owner = NULL, result = ? WHERE id = ? AND state != 'done'",
+            [(json.dumps(task_results, ensure_ascii=False), task_id) for task_id, task_results in results]))
+
+    def counts(self) -> Dict[str, int]:
+        """Number of tasks in each state"""
+        return dict(self._connection.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state"))
+
+    def next_expiry(self) -> Optional[float]:
+        """Seconds until the first lease of another worker expires, None if no task is leased"""
+        row = self._connection.execute("SELECT MIN(expires) FROM tasks WHERE state = 'leased'").fetchone()
+        return None if row[0] is None else max(row[0] - time.time(), 0)
+
+    def results(self) -> Iterator[Tuple[str, Dict[Tuple[int, int], Optional[Dict]]]]:
+        """Results of the files of every NIF, in NIF order; NIFs without files have none"""
+        rows = self._connection.execute(
+            "SELECT nifs.nif, tasks.flavor_order, tasks.file_order, tasks.state, tasks.html_file, tasks.result "
+            "FROM nifs LEFT JOIN tasks ON tasks.nif = nifs.nif "
+            "ORDER BY nifs.nif, tasks.flavor_order, tasks.file_order")
+        nif = None
+        file_results: Dict[Tuple[int, int], Optional[Dict]] = {}
+        for row_nif, flavor_order, file_order, state, html_file, result in rows:
+            if row_nif != nif:
+                if nif is not None:
+                    yield nif, file_results
+                nif = row_nif
+                file_results = {}
+            if state is None:
+                continue  # NIF without files
+            if state not in ("done", "failed"):
+                raise RuntimeError(f"{html_file} is not parsed yet, wait for the workers to finish before merging")
+            file_results[(flavor_order, file_order)] = json.loads(result) if state == "done" else None
+        if nif is not None:
+            yield nif, file_results
+
+    def failed(self) -> List[Tuple[str, str]]:
+        """NIF and file of the tasks given up after killing too many workers"""
+        return self._connection.execute("SELECT nif, html_file FROM tasks WHERE state = 'failed'").fetchall()
@@ -0,0 +1,103 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, NamedTuple, Union
+
+import pytest
+
+
+class Response(NamedTuple):
+    status: int = 200
+    body: str = ""
+    headers: Dict[str, str] = {}
+    delay: float = 0.0  # seconds before answering
+
+
+# answers a request from its headers
+Responder = Callable[[Dict[str, str]], Response]
+
+
+class StandInServer:
+    """Local HTTP server standing in for the hotel websites, Booking and Google.
+
+    Each path is answered by its route: a list of responses given in turn, the last one repeated, or a
+    function of the request headers. Other paths get a 404. Every request is recorded with its headers,
+    and so is the highest number of requests answered at the same time.
+    """
+
+    def __init__(self):
+        self.routes: Dict[str, Union[List[Response], Responder]] = {}
+        self.requests: List[Dict] = []
+        self.max_active = 0
+        self._active = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}{path}"
+
+    def route(self, path: str, *responses: Union[Response, Responder]) -> str:
+        """Answers `path` with `responses` in turn, or with a responder; returns its url"""
+        self.routes[path] = responses[0] if len(responses) == 1 and callable(responses[0]) else list(responses)
+        return self.url(path)
+
+    def hits(self, path: str) -> List[Dict[str, str]]:
+        """Headers of the requests to `path`, in order"""
+        return [request["headers"] for request in self.requests if request["path"] == path]
+
+    def _respond(self, path: str, headers: Dict[str, str]) -> Response:
+        with self._lock:
+            self.requests.append({"path": path, "headers": headers})
+            route = self.routes.get(path)
+            if route is None:
+                return Response(404, "not found")
+            if callable(route):
+                return route(headers)
+            return route.pop(0) if len(route) > 1 else route[0]
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:
+                headers = {name.lower(): value for name, value in self.headers.items()}
+                response = server._respond(self.path, headers)
+                with server._lock:
+                    server._active += 1
+                    server.max_active = max(server.max_active, server._active)
+                try:
+                    time.sleep(response.delay)
+                    body = response.body.encode("utf-8")
+                    self.send_response(response.status)
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    for name, value in response.headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with server._lock:
+                        server._active -= 1
+
+            def log_message(self, *args) -> None:
+                pass
+
+        return Handler
+
+    def start(self) -> None:
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def server() -> Iterator[StandInServer]:
+    stand_in = StandInServer()
+    stand_in.start()
+    yield stand_in
+    stand_in.stop()
@@ -0,0 +1,47 @@
+import sqlite3
+import time
+
+from hotels_scraper.cache import ParseCache
+
+
+def last_access(path: str, content_hash: str) -> float:
+    with sqlite3.connect(path) as connection:
+        return connection.execute("SELECT last_access FROM results WHERE content_hash = ?",
+                                  (content_hash,)).fetchone()[0]
+
+
+def age(path: str, content_hash: str, seconds: float) -> None:
+    with sqlite3.connect(path) as connection:
+        connection.execute("UPDATE results SET last_access = ? WHERE content_hash = ?",
+                           (time.time() - seconds, content_hash))
+
+
+def test_hits_refresh_stale_access_times_in_batches(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ParseCache(path)
+    cache.put("recent", "fingerprint", {"indicator": True})
+    cache.put("stale", "fingerprint", {"indicator": True})
+    age(path, "stale", 2 * ParseCache.ACCESS_INTERVAL)
+    recent, stale = last_access(path, "recent"), last_access(path, "stale")
+
+    assert cache.get("recent", "fingerprint") == {"indicator": True}
+    assert cache.get("stale", "fingerprint") == {"indicator": True}
+    assert cache.get("missing", "fingerprint") is None
+    # nothing is written until the batch is
+    assert (last_access(path, "recent"), last_access(path, "stale")) == (recent, stale)
+
+    cache.flush()
+    assert last_access(path, "recent") == recent
+    assert last_access(path, "stale") > stale
+
+
+def test_put_writes_the_pending_access_times(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ParseCache(path)
+    cache.put("stale", "fingerprint", {})
+    age(path, "stale", 2 * ParseCache.ACCESS_INTERVAL)
+    stale = last_access(path, "stale")
+
+    cache.get("stale", "fingerprint")
+    cache.put("other", "fingerprint", {})
+    assert last_access(path, "stale") > stale
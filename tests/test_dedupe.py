@@ -0,0 +1,48 @@
+import os
+
+from benchmarks.synthetic import generate_dump
+from hotels_scraper.dedupe import NearDuplicates, sketch
+from hotels_scraper.enums import Flavor
+from hotels_scraper.indicators import IndicatorRegistry
+from hotels_scraper.parser import Parser
+
+INDICATORS = os.path.join(os.path.dirname(__file__), os.pardir, "resources", "indicators.csv")
+
+
+def test_near_duplicates_are_compared_with_the_pages_kept():
+    near_duplicates = NearDuplicates(0.5)
+    assert not near_duplicates.seen(sketch(["menu", "a", "b", "c"]))
+    assert near_duplicates.seen(sketch(["menu", "a", "b", "c", "d"]))
+    assert not near_duplicates.seen(sketch(["menu", "x", "y", "z"]))
+    # a skipped page is not kept, only the first of the pages it resembles
+    assert near_duplicates.seen(sketch(["menu", "x", "y", "z", "w"]))
+    assert sketch(["menu", "a"]) == sketch(["a", "menu", ""])
+
+
+def add_near_duplicates(dump: str, copies: int) -> None:
+    """Copies of the home page of every NIF with one more line"""
+    for nif in os.listdir(dump):
+        if not os.path.isdir(os.path.join(dump, nif)):
+            continue
+        with open(os.path.join(dump, nif, f"{nif}_{Flavor.EMPRESA}.html"), encoding="utf-8") as f:
+            html = f.read()
+        for copy in range(copies):
+            with open(os.path.join(dump, nif, f"{nif}_{Flavor.EMPRESA}_copia{copy}.html"), "w",
+                      encoding="utf-8") as f:
+                f.write(f"{html}\n<p>copia {copy}</p>\n")
+
+
+def parse(dump: str, indicators: IndicatorRegistry, processes: int) -> str:
+    parser = Parser(dump, indicators, processes=processes, near_duplicate_threshold=0.9)
+    return parser.find_indicators_in_htmls().sort_index().to_csv()
+
+
+def test_near_duplicates_are_skipped_whatever_the_number_of_processes(tmp_path):
+    indicators = IndicatorRegistry.load(INDICATORS, cache=False)
+    dump = str(tmp_path / "dump")
+    generate_dump(dump, indicators, nifs=4, pages=3, seed=1)
+    expected = parse(dump, indicators, 1)
+
+    add_near_duplicates(dump, copies=6)
+    assert parse(dump, indicators, 1) == expected
+    assert parse(dump, indicators, 3) == expected
@@ -0,0 +1,156 @@
+import json
+import os
+
+import pandas as pd
+
+from hotels_scraper.downloader import Downloader
+from hotels_scraper.fetchers import HttpFetcher
+from hotels_scraper.storage import open_store
+from tests.conftest import Response
+
+NIF = "B0000001"
+OLD_MTIME = 1_000_000_000
+
+
+def download(server, dump: str, **options) -> None:
+    df = pd.DataFrame({"Dirección web": [server.url("/")]}, index=[NIF])
+    Downloader(dump, fetcher=HttpFetcher.name, **options).download_htmls(df, url_column="Dirección web",
+                                                                         post_fix="Empresa")
+
+
+def manifest_entries(dump: str):
+    with open(Downloader.manifest_path(dump), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def versioned_page(versions):
+    """Answers with the current version of a page, or a 304 when the request has its ETag"""
+    def respond(headers):
+        etag, body = versions[-1]
+        if headers.get("if-none-match") == etag:
+            return Response(304, "", {"ETag": etag})
+        return Response(200, body, {"ETag": etag})
+
+    return respond
+
+
+def test_unchanged_page_is_revalidated_and_keeps_its_mtime(server, tmp_path):
+    dump = str(tmp_path / "dump")
+    html_file = os.path.join(dump, NIF, f"{NIF}_Empresa.html")
+    server.route("/", versioned_page([('"v1"', "<html>v1</html>")]))
+    download(server, dump, crawl_depth=0)
+    os.utime(html_file, (OLD_MTIME, OLD_MTIME))
+
+    download(server, dump, crawl_depth=0, refresh_older_than=0)
+
+    assert server.hits("/")[1]["if-none-match"] == '"v1"'
+    assert os.stat(html_file).st_mtime == OLD_MTIME
+    assert manifest_entries(dump)[-1]["status"] == 304
+    with open(html_file, encoding="utf-8") as f:
+        assert f.read() == "<html>v1</html>"
+
+
+def test_changed_page_is_rewritten(server, tmp_path):
+    dump = str(tmp_path / "dump")
+    html_file = os.path.join(dump, NIF, f"{NIF}_Empresa.html")
+    versions = [('"v1"', "<html>v1</html>")]
+    server.route("/", versioned_page(versions))
+    download(server, dump, crawl_depth=0)
+    os.utime(html_file, (OLD_MTIME, OLD_MTIME))
+
+    versions.append(('"v2"', "<html>v2</html>"))
+    download(server, dump, crawl_depth=0, refresh_older_than=0)
+
+    assert os.stat(html_file).st_mtime != OLD_MTIME
+    assert manifest_entries(dump)[-1]["etag"] == '"v2"'
+    with open(html_file, encoding="utf-8") as f:
+        assert f.read() == "<html>v2</html>"
+
+
+def test_pages_are_only_downloaded_again_when_stale(server, tmp_path):
+    dump = str(tmp_path / "dump")
+    server.route("/", versioned_page([('"v1"', "<html>v1</html>")]))
+    download(server, dump, crawl_depth=0)
+    download(server, dump, crawl_depth=0)
+    download(server, dump, crawl_depth=0, refresh_older_than=3600)
+    assert len(server.hits("/")) == 1
+
+
+def links(*paths: str) -> Response:
+    return Response(200, "<html><body>" + "".join(f'<a href="{path}">{path}</a>' for path in paths) + "</body></html>")
+
+
+def route_site(server) -> None:
+    server.route("/", links("/a", "/b", "/sostenibilidad", "https://elsewhere.example/c", "/d.pdf"))
+    server.route("/a", links("/a/deep"))
+    server.route("/b", links())
+    server.route("/sostenibilidad", links())
+    server.route("/a/deep", links())
+
+
+def requested(server):
+    return sorted({request["path"] for request in server.requests})
+
+
+def test_crawl_stops_at_its_depth_and_resumes_deeper(server, tmp_path):
+    dump = str(tmp_path / "dump")
+    route_site(server)
+
+    download(server, dump, crawl_depth=1)
+    assert requested(server) == ["/", "/a", "/b", "/sostenibilidad"]
+    assert len(open_store(dump).pages(NIF)) == 4
+
+    # a deeper crawl only downloads the new pages
+    server.requests.clear()
+    download(server, dump, crawl_depth=2)
+    assert requested(server) == ["/a/deep"]
+    assert len(open_store(dump).pages(NIF)) == 5
+
+
+def test_crawl_stops_at_its_budget_with_sustainability_pages_first(server, tmp_path):
+    dump = str(tmp_path / "dump")
+    route_site(server)
+
+    download(server, dump, crawl_depth=2, crawl_budget=2)
+
+    assert requested(server) == ["/", "/sostenibilidad"]
+    assert len(open_store(dump).pages(NIF)) == 2
+
+
+def count_stats(monkeypatch, dump: str):
+    """Counts the pages of the dump looked up on disk"""
+    store_type = type(open_store(dump))
+    calls = []
+    stat = store_type.stat
+    monkeypatch.setattr(store_type, "stat", lambda self, html_file: calls.append(html_file) or stat(self, html_file))
+    return calls
+
+
+def test_resumed_crawl_takes_fetched_pages_as_present_without_stating_them(server, tmp_path, monkeypatch):
+    dump = str(tmp_path / "dump")
+    route_site(server)
+    download(server, dump, crawl_depth=1)
+    stats = count_stats(monkeypatch, dump)
+    server.requests.clear()
+
+    download(server, dump, crawl_depth=1)
+    download(server, dump, crawl_depth=1, refresh_older_than=3600)
+
+    assert server.requests == []
+    assert stats == []
+
+
+def test_resumed_crawl_refreshes_pages_from_their_fetch_time(server, tmp_path):
+    dump = str(tmp_path / "dump")
+    route_site(server)
+    download(server, dump, crawl_depth=1)
+    for page in open_store(dump).pages(NIF):
+        os.utime(page.html_file, (OLD_MTIME, OLD_MTIME))
+    server.requests.clear()
+
+    # the files look old, but the manifest says they were just fetched
+    download(server, dump, crawl_depth=1, refresh_older_than=3600)
+    assert server.requests == []
+
+    download(server, dump, crawl_depth=1, refresh_older_than=0)
+    assert requested(server) == ["/", "/a", "/b", "/sostenibilidad"]
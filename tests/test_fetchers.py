@@ -0,0 +1,94 @@
+import asyncio
+import os
+import socket
+
+import pytest
+
+from hotels_scraper.fetchers import FetchError, HttpFetcher
+from hotels_scraper.scheduler import DownloadScheduler, FetchJob
+from hotels_scraper.storage import LooseStore
+from tests.conftest import Response
+
+
+def fetch(fetcher: HttpFetcher, url: str, headers=None):
+    async def run():
+        async with fetcher:
+            return await fetcher.fetch(url, headers)
+
+    return asyncio.run(run())
+
+
+def closed_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_http_fetcher_returns_page_and_headers(server):
+    url = server.route("/", Response(200, "<html>hotel</html>", {"ETag": '"v1"'}))
+    response = fetch(HttpFetcher(), url)
+    assert response.status == 200
+    assert response.text == "<html>hotel</html>"
+    assert {name.lower(): value for name, value in response.headers.items()}["etag"] == '"v1"'
+
+
+@pytest.mark.parametrize("status", [404, 429, 500, 503])
+def test_http_fetcher_returns_error_statuses_without_raising(server, status):
+    url = server.route("/", Response(status, "error"))
+    assert fetch(HttpFetcher(), url).status == status
+
+
+def test_http_fetcher_sends_request_headers(server):
+    url = server.route("/", Response(304))
+    response = fetch(HttpFetcher(), url, {"If-None-Match": '"v1"'})
+    assert response.status == 304
+    assert server.hits("/")[0]["if-none-match"] == '"v1"'
+
+
+def test_http_fetcher_raises_fetch_error_when_unreachable():
+    with pytest.raises(FetchError):
+        fetch(HttpFetcher(), f"http://127.0.0.1:{closed_port()}/")
+
+
+def test_http_fetcher_raises_fetch_error_on_timeout(server):
+    url = server.route("/", Response(200, "slow", delay=1))
+    with pytest.raises(FetchError):
+        fetch(HttpFetcher(timeout=0.2), url)
+
+
+def job(folder: str, nif: str, url: str) -> FetchJob:
+    return FetchJob(nif, url, os.path.join(folder, nif, f"{nif}_Empresa.html"))
+
+
+def test_scheduler_saves_pages_and_skips_client_errors(server, tmp_path):
+    folder = str(tmp_path)
+    found = job(folder, "B0000001", server.route("/found", Response(200, "<html>found</html>")))
+    missing = job(folder, "B0000002", server.route("/missing", Response(404, "not found")))
+    done = {}
+    scheduler = DownloadScheduler(store=LooseStore(folder), backoff=0.01)
+
+    saved = scheduler.run([found, missing], HttpFetcher(), on_done=lambda page, ok: done.update({page.nif: ok}))
+
+    assert saved == [found]
+    assert done == {"B0000001": True, "B0000002": False}
+    with open(found.html_file, encoding="utf-8") as f:
+        assert f.read() == "<html>found</html>"
+    assert not os.path.exists(missing.html_file)
+    assert len(server.hits("/missing")) == 1  # client errors are not retried
+
+
+def test_scheduler_retries_fetch_errors(tmp_path):
+    folder = str(tmp_path)
+    unreachable = job(folder, "B0000001", f"http://127.0.0.1:{closed_port()}/")
+    scheduler = DownloadScheduler(store=LooseStore(folder), max_retries=1, backoff=0.01)
+    assert scheduler.run([unreachable], HttpFetcher()) == []
+    assert not os.path.exists(unreachable.html_file)
+
+
+def test_scheduler_bounds_requests_per_host(server, tmp_path):
+    folder = str(tmp_path)
+    jobs = [job(folder, f"B000000{i}", server.route(f"/{i}", Response(200, "page", delay=0.2))) for i in range(6)]
+    scheduler = DownloadScheduler(concurrency=8, per_host_concurrency=2, store=LooseStore(folder))
+
+    assert len(scheduler.run(jobs, HttpFetcher())) == 6
+    assert server.max_active == 2
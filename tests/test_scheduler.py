@@ -0,0 +1,149 @@
+import asyncio
+import os
+import time
+from email.utils import formatdate
+
+import pytest
+
+from hotels_scraper.booking import validate_booking_page
+from hotels_scraper.fetchers import FetchResponse, HttpFetcher
+from hotels_scraper.scheduler import DownloadScheduler, FetchJob, HostLimiter
+from hotels_scraper.storage import LooseStore
+from tests.conftest import Response
+
+CAPTCHA = '<html><body><div class="g-recaptcha"></div></body></html>'
+
+
+def acquire(limiter: HostLimiter) -> float:
+    async def run():
+        sent = await limiter.acquire()
+        limiter.release()
+        return sent
+
+    return asyncio.run(run())
+
+
+def test_host_limiter_halves_its_limits_when_throttled():
+    limiter = HostLimiter(4, max_rate=2.0)
+    sent = acquire(limiter)
+    limiter.throttled(sent, 0)
+    assert limiter.limit == 2
+    assert limiter.rate == 1.0
+
+
+def test_host_limiter_decreases_once_for_the_requests_sent_before_a_decrease():
+    limiter = HostLimiter(8, max_rate=4.0)
+    first, second = acquire(limiter), acquire(limiter)
+    limiter.throttled(first, 0)
+    limiter.throttled(second, 0)
+    assert limiter.limit == 4
+
+    # a request sent at the decreased rate decreases it again
+    limiter.throttled(acquire(limiter), 0)
+    assert limiter.limit == 2
+
+
+def test_host_limiter_grows_additively_up_to_its_maximum():
+    limiter = HostLimiter(4, max_rate=2.0)
+    limiter.throttled(acquire(limiter), 0)
+    limiter.succeeded()
+    assert limiter.limit == 2  # 2.5
+    assert limiter.rate == 2.0
+    limiter.succeeded()
+    assert limiter.limit == 2  # 2.9
+    limiter.succeeded()
+    assert limiter.limit == 3
+    for _ in range(20):
+        limiter.succeeded()
+    assert limiter.limit == 4
+    assert limiter.rate == 2.0
+
+
+def test_host_limiter_without_a_rate_starts_limiting_when_throttled():
+    limiter = HostLimiter(2)
+    assert limiter.rate is None
+    limiter.throttled(acquire(limiter), 0)
+    assert HostLimiter.MIN_RATE <= limiter.rate <= 10 / 2
+
+
+def test_host_limiter_pauses_the_host():
+    limiter = HostLimiter(2)
+    limiter.throttled(acquire(limiter), 0.3)
+    started = time.monotonic()
+    acquire(limiter)
+    assert time.monotonic() - started >= 0.25
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"Retry-After": "3"}, 3),
+    ({"retry-after": "0"}, 0),
+    ({"Retry-After": "-5"}, 0),
+    ({"Retry-After": formatdate(0, usegmt=True)}, 0),
+    ({"Retry-After": "soon"}, None),
+    ({}, None),
+])
+def test_retry_after_in_seconds(headers, expected):
+    assert DownloadScheduler._retry_after(FetchResponse(429, "", headers)) == expected
+
+
+def test_retry_after_as_http_date():
+    response = FetchResponse(503, "", {"Retry-After": formatdate(time.time() + 30, usegmt=True)})
+    assert 28 <= DownloadScheduler._retry_after(response) <= 30
+
+
+def download(server, tmp_path, *responses, validate=None, **options):
+    folder = str(tmp_path)
+    job = FetchJob("B0000001", server.route("/", *responses), os.path.join(folder, "B0000001", "B0000001.html"))
+    scheduler = DownloadScheduler(store=LooseStore(folder), backoff=0.01, **options)
+    saved = scheduler.run([job], HttpFetcher(), validate=validate)
+    return scheduler, job, len(saved) == 1
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_throttled_pages_are_retried_after_the_host_backs_off(server, tmp_path, status):
+    scheduler, job, saved = download(server, tmp_path, Response(status, headers={"Retry-After": "0"}),
+                                     Response(status, headers={"Retry-After": "0"}), Response(200, "page"),
+                                     per_host_concurrency=4, rate_per_host=8.0)
+    assert saved
+    assert len(server.hits("/")) == 3
+    with open(job.html_file, encoding="utf-8") as f:
+        assert f.read() == "page"
+    host = scheduler.host(job.url)
+    assert host.limit < 4
+    assert host.rate < 8.0
+
+
+def test_server_errors_are_retried_without_throttling_the_host(server, tmp_path):
+    scheduler, job, saved = download(server, tmp_path, Response(500), Response(200, "page"), per_host_concurrency=4)
+    assert saved
+    assert len(server.hits("/")) == 2
+    assert scheduler.host(job.url).limit == 4
+    assert scheduler.host(job.url).rate is None
+
+
+def test_pages_are_given_up_after_max_retries(server, tmp_path):
+    _, job, saved = download(server, tmp_path, Response(503, headers={"Retry-After": "0"}), max_retries=2)
+    assert not saved
+    assert len(server.hits("/")) == 3
+    assert not os.path.exists(job.html_file)
+
+
+def test_blocked_pages_are_retried_without_throttling_the_host(server, tmp_path):
+    scheduler, job, saved = download(server, tmp_path, Response(200, CAPTCHA), Response(200, "<html>hotel</html>"),
+                                     validate=validate_booking_page, per_host_concurrency=4, rate_per_host=8.0)
+    assert saved
+    assert len(server.hits("/")) == 2
+    assert scheduler.host(job.url).limit == 4
+    assert scheduler.host(job.url).rate == 8.0
+
+
+def test_unsolicited_not_modified_is_not_saved(server, tmp_path):
+    _, job, saved = download(server, tmp_path, Response(304))
+    assert not saved
+    assert not os.path.exists(job.html_file)
+
+
+def test_booking_validator_only_rejects_blocked_pages():
+    assert validate_booking_page(CAPTCHA) is not None
+    assert validate_booking_page("<html>hotel without sustainability data</html>") is None
+    assert validate_booking_page('<script>{"PropertySustainability:1": {}}</script>' + CAPTCHA) is None
@@ -0,0 +1,125 @@
+import multiprocessing
+import os
+import time
+
+from benchmarks.synthetic import generate_dump
+from hotels_scraper.enums import Flavor
+from hotels_scraper.indicators import IndicatorRegistry
+from hotels_scraper.output import StreamingResultWriter
+from hotels_scraper.parser import Parser
+from hotels_scraper.work import WorkUnit
+from hotels_scraper.work_queue import WorkQueue
+
+INDICATORS = os.path.join(os.path.dirname(__file__), os.pardir, "resources", "indicators.csv")
+
+
+def plan(path: str, nifs: int, files: int, **options) -> WorkQueue:
+    queue = WorkQueue(path, **options)
+    units = [WorkUnit(f"B{nif:07d}", Flavor.EMPRESA, (0, file), f"B{nif:07d}_Empresa_{file}.html", 100)
+             for nif in range(nifs) for file in range(files)]
+    queue.plan({}, {unit.nif: "planned" for unit in units}, units)
+    return queue
+
+
+def claim_all(path: str, owner: str):
+    queue = WorkQueue(path)
+    claimed = []
+    while True:
+        tasks = queue.claim(owner, 3)
+        if len(tasks) == 0:
+            return claimed
+        queue.complete([(task_id, {"owner": owner}) for task_id, _ in tasks])
+        claimed.extend(task_id for task_id, _ in tasks)
+
+
+def claim_and_die(path: str, lease_timeout: float) -> None:
+    WorkQueue(path, lease_timeout).claim("dead", 2)
+    os._exit(1)
+
+
+def test_each_task_is_leased_by_a_single_worker_process(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    queue = plan(path, 20, 10)
+
+    with multiprocessing.Pool(4) as pool:
+        claims = pool.starmap(claim_all, [(path, f"worker{i}") for i in range(4)])
+
+    claimed = [task_id for worker_claims in claims for task_id in worker_claims]
+    assert sorted(claimed) == list(range(1, 201))
+    assert queue.counts() == {"done": 200}
+    # every result is the one of the worker that claimed the task
+    owners = {f"worker{i}": len(worker_claims) for i, worker_claims in enumerate(claims)}
+    results = [result["owner"] for _, file_results in queue.results() for result in file_results.values()]
+    assert {owner: results.count(owner) for owner in owners} == owners
+
+
+def run_process(target, *args) -> int:
+    process = multiprocessing.Process(target=target, args=args)
+    process.start()
+    process.join()
+    return process.exitcode
+
+
+def test_tasks_of_a_dead_worker_are_claimed_again_once_their_lease_expires(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    queue = plan(path, 1, 3, lease_timeout=0.5)
+    assert run_process(claim_and_die, path, 0.5) == 1
+
+    assert [task_id for task_id, _ in queue.claim("alive", 10)] == [3]
+    queue.complete([(3, {"owner": "alive"})])
+    assert queue.claim("alive", 10) == []
+    time.sleep(queue.next_expiry() + 0.1)
+    assert [task_id for task_id, _ in queue.claim("alive", 10)] == [1, 2]
+
+    queue.complete([(task_id, {"owner": "alive"}) for task_id in (1, 2)])
+    # a worker that was only slow finishes late, the results stored first are kept
+    queue.complete([(1, {"owner": "dead"})])
+    assert queue.counts() == {"done": 3}
+    assert [result["owner"] for _, file_results in queue.results() for result in file_results.values()] == \
+        ["alive"] * 3
+
+
+def test_tasks_that_kill_too_many_workers_are_failed(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    queue = plan(path, 1, 1, lease_timeout=0.2, max_attempts=1)
+    assert run_process(claim_and_die, path, 0.2) == 1
+
+    time.sleep(0.3)
+    assert queue.claim("alive", 10) == []
+    assert queue.failed() == [("B0000000", "B0000000_Empresa_0.html")]
+    assert list(queue.results()) == [("B0000000", {(0, 0): None})]
+
+
+def parse_queue(dump: str, path: str) -> None:
+    Parser(dump, IndicatorRegistry.load(INDICATORS, cache=False), processes=1).work(WorkQueue(path))
+
+
+def merge(parser: Parser, indicators: IndicatorRegistry, queue: WorkQueue, partial_output: str) -> str:
+    writer = StreamingResultWriter(partial_output, Parser.result_columns(indicators))
+    return parser.merge_queue(queue, writer).to_csv()
+
+
+def test_merge_of_several_workers_matches_a_single_process_run(tmp_path):
+    dump = str(tmp_path / "dump")
+    indicators = IndicatorRegistry.load(INDICATORS, cache=False)
+    generate_dump(dump, indicators, nifs=6, pages=4, seed=1)
+    parser = Parser(dump, indicators, processes=1)
+    # the single machine run of main.py
+    writer = StreamingResultWriter(str(tmp_path / "local.partial.csv"), Parser.result_columns(indicators))
+    expected = parser.find_indicators_in_htmls(writer).to_csv()
+
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"))
+    assert parser.enqueue(queue) > 0
+    workers = [multiprocessing.Process(target=parse_queue, args=(dump, queue.path)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert all(worker.exitcode == 0 for worker in workers)
+
+    partial_output = str(tmp_path / "merge.partial.csv")
+    assert merge(parser, indicators, queue, partial_output) == expected
+    # merging again, or after planning the same dump again, gives the same output
+    assert merge(parser, indicators, queue, partial_output) == expected
+    assert parser.enqueue(queue) == 0
+    assert merge(parser, indicators, queue, partial_output) == expected
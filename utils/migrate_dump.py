@@ -0,0 +1,42 @@
+"""
+Converts the pages of a dump folder to another storage format, in place.
+
+    python -m utils.migrate_dump --dump "dump_folder" --to pack
+
+Formats are described in hotels_scraper/storage.py: "loose" html files (the original layout), one "gzip" file per page
+or a "pack" file per NIF. Pages keep their names, order and modification times, so parse cache entries stay valid,
+and so do the fingerprints used by --resume except to or from "gzip", whose pages are listed with their compressed
+size. The folder is converted one NIF at a time; if the conversion is interrupted, run it again to finish it.
+"""
+import argparse
+import os
+
+from hotels_scraper.storage import DUMP_STORES, migrate_nif, set_format, stored_format
+
+
+def folder_size(folder: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(folder) for name in names)
+
+
+def main(args: argparse.Namespace) -> None:
+    current = stored_format(args.dump)
+    if current == args.to:
+        print(f"{args.dump} already stores its pages as {args.to}")
+        return
+
+    source = DUMP_STORES[current](args.dump)
+    target = DUMP_STORES[args.to](args.dump)
+    size_before = folder_size(args.dump)
+    nifs = sorted(nif for nif in os.listdir(args.dump) if os.path.isdir(os.path.join(args.dump, nif)))
+    pages = sum(migrate_nif(source, target, nif) for nif in nifs)
+    set_format(args.dump, args.to)
+    size_after = folder_size(args.dump)
+    print(f"{pages} pages of {len(nifs)} NIFs converted from {current} to {args.to}: "
+          f"{size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dump", type=str, help="Dump folder with the downloaded pages", required=True)
+    parser.add_argument("--to", type=str, choices=list(DUMP_STORES), help="New storage format", required=True)
+    main(parser.parse_args())
@@ -0,0 +1,151 @@
+"""
+Converts a SABI-style CSV export into typed Parquet, streaming it in chunks so memory stays bounded.
+
+    python -m utils.preprocess --input "export.csv" --output "export.parquet" [--rules "rules.json"]
+
+Every column is typed by the first rule whose prefix it starts with, columns without a rule are kept as strings:
+* n.d. and n.s. are read as missing
+* "float32", "Int32" and "Int64" columns are converted to numbers; Spanish formatted numbers (1.234,5) are understood
+  and rules with "thousands" remove the . separators of integer amounts
+* "category" columns are stored as dictionary encoded strings
+* duplicated columns (named like "Localidad.1" by pandas) are not read at all
+
+Rules can be given as a JSON list of objects with the fields of ColumnRule.
+"""
+import argparse
+import json
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class ColumnRule(NamedTuple):
+    prefix: str
+    dtype: str  # float32, Int32, Int64 or category
+    thousands: bool = False  # remove the . thousands separators before converting
+
+
+DEFAULT_RULES = [
+    ColumnRule("Rentabilidad", "float32"),
+    ColumnRule("Margen", "float32"),
+    ColumnRule("Rotación", "float32"),
+    ColumnRule("Ratio", "float32"),
+    ColumnRule("Costes", "float32"),
+    ColumnRule("Endeudamiento", "float32"),
+    ColumnRule("Período", "Int32"),
+    ColumnRule("Coste medio", "Int32"),
+    ColumnRule("Número empleados", "Int32"),
+    ColumnRule("Capital circulante", "Int64"),
+    ColumnRule("Ingresos de explotación", "Int64", thousands=True),
+    ColumnRule("Result. ordinarios", "Int64", thousands=True),
+    ColumnRule("Resultado del Ejercicio", "Int64", thousands=True),
+    ColumnRule("Total Activo", "Int64", thousands=True),
+    ColumnRule("EBIT", "Int64", thousands=True),
+    ColumnRule("Localidad", "category"),
+    ColumnRule("Provincia", "category"),
+    ColumnRule("Indicator de Independencia", "category"),
+    ColumnRule("Booking_Nivel_Sostenibilidad_Contexto", "category"),
+]
+MISSING_VALUES = ["n.d.", "n.s."]
+
+_ARROW_TYPES = {
+    "float32": pa.float32(),
+    "Int32": pa.int32(),
+    "Int64": pa.int64(),
+    "category": pa.dictionary(pa.int32(), pa.string()),
+    None: pa.string(),
+}
+_DUPLICATED_COLUMN_REGEX = re.compile(r"^(.*)\.\d+$")
+
+
+def load_rules(path: str) -> List[ColumnRule]:
+    with open(path, "r", encoding="utf-8") as f:
+        rules = [ColumnRule(**rule) for rule in json.load(f)]
+    for rule in rules:
+        if rule.dtype not in _ARROW_TYPES or rule.dtype is None:
+            raise ValueError(f"Unknown dtype {rule.dtype} for columns starting with {rule.prefix}")
+    return rules
+
+
+def resolve_columns(header: List[str], rules: List[ColumnRule]) -> Dict[str, Optional[ColumnRule]]:
+    """Rule of every column to keep, in the order of the file"""
+    columns = {}
+    for column in header:
+        duplicated = _DUPLICATED_COLUMN_REGEX.match(column)
+        if duplicated is not None and duplicated.group(1) in header:
+            continue
+        columns[column] = next((rule for rule in rules if _clean_name(column).startswith(rule.prefix)), None)
+    return columns
+
+
+def convert(chunk: pd.DataFrame, columns: Dict[str, Optional[ColumnRule]]) -> pd.DataFrame:
+    chunk = chunk.rename(columns=_clean_name)
+    for column, rule in columns.items():
+        column = _clean_name(column)
+        if rule is None:
+            continue
+        if rule.dtype == "category":
+            chunk[column] = chunk[column].astype("category")
+        else:
+            numbers = pd.to_numeric(_normalize_numbers(chunk[column], rule.thousands), errors="coerce")
+            if rule.dtype != "float32":
+                numbers = numbers.round()
+            chunk[column] = numbers.astype(rule.dtype)
+    return chunk
+
+
+def preprocess(input_path: str, output_path: str, rules: List[ColumnRule] = None, chunk_size: int = 100_000) -> int:
+    """Writes the typed Parquet file and returns the number of rows"""
+    rules = DEFAULT_RULES if rules is None else rules
+    header = list(pd.read_csv(input_path, nrows=0).columns)
+    columns = resolve_columns(header, rules)
+    schema = pa.schema([(_clean_name(column), _ARROW_TYPES[None if rule is None else rule.dtype])
+                        for column, rule in columns.items()])
+
+    rows = 0
+    writer = None
+    try:
+        # everything is read as text, so each chunk gets the same types whatever values it holds
+        for chunk in pd.read_csv(input_path, usecols=list(columns), dtype=str, na_values=MISSING_VALUES,
+                                 keep_default_na=True, chunksize=chunk_size):
+            table = pa.Table.from_pandas(convert(chunk[list(columns)], columns), schema=schema, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def _clean_name(column: str) -> str:
+    return column.replace("\n", " ")
+
+
+def _normalize_numbers(values: pd.Series, thousands: bool) -> pd.Series:
+    # 1.234,5 -> 1234.5 and, for amounts, 1.234 -> 1234
+    spanish = values.str.contains(",", regex=False, na=False)
+    if thousands:
+        values = values.str.replace(".", "", regex=False)
+    else:
+        values = values.where(~spanish, values.str.replace(".", "", regex=False))
+    return values.str.replace(",", ".", regex=False)
+
+
+def main(args: argparse.Namespace) -> None:
+    rules = load_rules(args.rules) if args.rules is not None else None
+    rows = preprocess(args.input, args.output, rules, args.chunk_size)
+    print(f"{rows} rows written to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", type=str, help="Path to the raw CSV file", required=True)
+    parser.add_argument("--output", type=str, help="Path to the resulting Parquet file", required=True)
+    parser.add_argument("--rules", type=str, help="JSON file with the column rules (default: DEFAULT_RULES)")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="Number of rows converted at a time")
+    main(parser.parse_args())
@@ -49,68 +49,93 @@ Crear buckets:
 * Google_Reseñas_Contexto
 """
 import argparse
+import re
 
 import numpy as np
 import pandas as pd
 
 from hotels_scraper.enums import BookingPropertySustainabilitySplits, BookingColumnsIndicators
 
-def main(args: argparse.Namespace) -> None:
-    indicador_independencia_mapping = {
-        "D": 0,
-        "C": 1,
-        "C+": 2,
-        "B-": 3,
-        "B": 4,
-        "B+": 5,
-        "A-": 6,
-        "A": 7,
-        "A+": 8
-    }
-    columns_to_remove = [
-        "Código NIF.1",
-        "Localidad.1",
-        "Dirección web.1",
-    ]
-    df = pd.read_csv(args.input)
+INDEPENDENCE_MAPPING = {
+    "D": 0,
+    "C": 1,
+    "C+": 2,
+    "B-": 3,
+    "B": 4,
+    "B+": 5,
+    "A-": 6,
+    "A": 7,
+    "A+": 8
+}
+SUSTAINABILITY_LEVEL_MAPPING = {
+    "NONE": "NO_LEVEL",
+    "BRONZE": "LEVEL_1",
+    "SILVER": "LEVEL_2",
+    "GOLD": "LEVEL_3",
+}
+COLUMNS_TO_REMOVE = [
+    "Código NIF.1",
+    "Localidad.1",
+    "Dirección web.1",
+]
+PREFIX_COLUMNS = [
+    "Rentabilidad sobre capital empleado",
+    "Rentabilidad económica",
+    "Rentabilidad financiera",
+    "Número empleados",
+    "Endeudamiento",
+    "Margen de beneficio",
+    "Ingresos de explotación",
+    "Ratio de solvencia",
+    "Result. ordinarios antes Impuestos",
+    "EBIT",
+    "Total Activo log",
+]
+# columns of 2019 starting with any of the prefixes, the other years are skipped
+PREFIX_COLUMNS_REGEX = re.compile(f"^(?:{'|'.join(re.escape(prefix) for prefix in PREFIX_COLUMNS)}).*2019$")
+RENAMED_COLUMNS = {
+    "Booking_Estrellas_Contexto": "Star rating",
+    "Genero Director Ejecutivo": "Gender of CEO",
+    "Número empleados 2019": "Employees",
+    "PERTENECE A UN GRUPO O HAY MÁS HOTELES": "Group",
+    "PLAYA (PLAYA= 1 HASTA 10 KM; otros)": "Beach",
+    "EBIT 2019": "EBIT",
+    "EBITDA 2019": "EBITDA",
+    "Endeudamiento (%) % 2019": "Indebtedness",
+    "Ingresos de explotación EUR 2019": "Operating income",
+    "Margen de beneficio (%) % 2019": "Profit margin",
+    "Ratio de solvencia % 2019": "Solvency",
+    "Rentabilidad económica (%) % 2019": "ROA",
+    "Rentabilidad financiera (%) % 2019": "ROE",
+    "Rentabilidad sobre capital empleado (%) % 2019": "ROIC",
+    "Result. ordinarios antes Impuestos EUR 2019": "EBT",
+    "Tasa variación rentabilidad económica": "Variation in ROA",
+    "Tasa variación rentabilidad financiera": "Variation in ROE",
+    "Total Activo log 2019": "Asset",
+    "Indicator de Independencia num": "Independence indicator",
+    "Booking_Nivel_Sostenibilidad_Contexto": "Level Sustainability Index",
+}
+
+
+def sanitize(df: pd.DataFrame) -> pd.DataFrame:
+    """Selects and derives the variables of the study, with whole-column operations only"""
     df.columns = df.columns.str.replace("\n", " ")
-    df.drop(columns=columns_to_remove, inplace=True)
+    df = df.drop(columns=COLUMNS_TO_REMOVE)
 
     # keep only hotels with number of employees between 10 and 250
-    mask_num_employees = (df["Número empleados 2019"] >= 10) & (df["Número empleados 2019"] <= 250)
-    df = df[mask_num_employees]
-
-    missing_level_index = pd.isna(df["Booking_Nivel_Sostenibilidad_Contexto"])
-    df.loc[missing_level_index, ["Booking_Nivel_Sostenibilidad_Contexto"]] = "NO_LEVEL"
-    df.loc[
-        df["Booking_Nivel_Sostenibilidad_Contexto"] == "NONE", ["Booking_Nivel_Sostenibilidad_Contexto"]] = "NO_LEVEL"
+    df = df[df["Número empleados 2019"].between(10, 250)].copy()
 
-    df.loc[
-        df["Booking_Nivel_Sostenibilidad_Contexto"] == "BRONZE", ["Booking_Nivel_Sostenibilidad_Contexto"]] = "LEVEL_1"
-    df.loc[
-        df["Booking_Nivel_Sostenibilidad_Contexto"] == "SILVER", ["Booking_Nivel_Sostenibilidad_Contexto"]] = "LEVEL_2"
-    df.loc[
-        df["Booking_Nivel_Sostenibilidad_Contexto"] == "GOLD", ["Booking_Nivel_Sostenibilidad_Contexto"]] = "LEVEL_3"
+    level = df["Booking_Nivel_Sostenibilidad_Contexto"].fillna("NONE")
+    df["Booking_Nivel_Sostenibilidad_Contexto"] = level.replace(SUSTAINABILITY_LEVEL_MAPPING)
 
-    missing_group_index = pd.isna(df["PERTENECE A UN GRUPO O HAY MÁS HOTELES"])
-    df.loc[missing_group_index, ["PERTENECE A UN GRUPO O HAY MÁS HOTELES"]] = 0
-
-    missing_playa_index = pd.isna(df["PLAYA (PLAYA= 1 HASTA 10 KM; otros)"])
-    no_playa_index = df["PLAYA (PLAYA= 1 HASTA 10 KM; otros)"] == "0"
-    playa_index = (df["PLAYA (PLAYA= 1 HASTA 10 KM; otros)"] == "1") | (
-                df["PLAYA (PLAYA= 1 HASTA 10 KM; otros)"] == "PLAYA")
-    df.loc[playa_index, ["PLAYA (PLAYA= 1 HASTA 10 KM; otros)"]] = 1
-    df.loc[~playa_index, ["PLAYA (PLAYA= 1 HASTA 10 KM; otros)"]] = 0
+    df["PERTENECE A UN GRUPO O HAY MÁS HOTELES"] = df["PERTENECE A UN GRUPO O HAY MÁS HOTELES"].fillna(0)
 
+    beach = df["PLAYA (PLAYA= 1 HASTA 10 KM; otros)"]
+    df["PLAYA (PLAYA= 1 HASTA 10 KM; otros)"] = beach.isin(["1", "PLAYA"]).astype(int)
 
     df["Total Activo log 2019"] = np.log(df["Total Activo EUR 2019"])
 
-
-    def convert_to_numerical(value):
-        return indicador_independencia_mapping.get(value, "")
-
-
-    df["Indicator de Independencia num"] = df["Indicator de Independencia BvD"].apply(convert_to_numerical)
+    df["Indicator de Independencia num"] = df["Indicator de Independencia BvD"].map(INDEPENDENCE_MAPPING).astype("Int64")
 
     df["Tasa variación rentabilidad económica"] = (df["Rentabilidad económica (%) % 2019"] - df[
         "Rentabilidad económica (%) % 2018"]) / df["Rentabilidad económica (%) % 2018"]
@@ -124,9 +149,18 @@ def main(args: argparse.Namespace) -> None:
         "Booking_Nivel_Sostenibilidad_Contexto",
     ]
     for context_key, context_dict in BookingPropertySustainabilitySplits.items():
+        codes, contexts = None, None
         for text, column_name in context_dict.items():
-            df[column_name] = df[context_key].apply(
-                lambda value: int(text in value if isinstance(value, str) else False))
+            if column_name in df.columns:
+                # one-hot column written by the parser
+                df[column_name] = df[column_name].isin([True, "True"]).astype(int)
+            else:
+                # results parsed before the facility columns existed: there are only a few distinct contexts,
+                # so texts are searched once per distinct context and spread to the rows by their codes
+                if codes is None:
+                    codes, contexts = pd.factorize(df[context_key])
+                found = np.array([isinstance(context, str) and text in context for context in contexts] + [False])
+                df[column_name] = found[codes].astype(int)  # missing contexts have code -1, the last entry
             booking_columns.append(column_name)
 
     target_columns = [
@@ -139,55 +173,20 @@ def main(args: argparse.Namespace) -> None:
                          "Tasa variación rentabilidad económica",
                          "Tasa variación rentabilidad financiera"
                      ] + booking_columns
-    prefix_columns = [
-        "Rentabilidad sobre capital empleado",
-        "Rentabilidad económica",
-        "Rentabilidad financiera",
-        "Número empleados",
-        "Endeudamiento",
-        "Margen de beneficio",
-        "Ingresos de explotación",
-        "Ratio de solvencia",
-        "Result. ordinarios antes Impuestos",
-        "EBIT",
-        "Total Activo log",
-    ]
-
-    for column in df.columns:
-        for pre in prefix_columns:
-            if not column.endswith("2019"):
-                continue  # skip all years except 2019
-
-            if column.startswith(pre):
-                target_columns.append(column)
+    target_columns += [column for column in df.columns if PREFIX_COLUMNS_REGEX.match(column)]
 
     # add up all indicators
     df["Número de indicadores"] = df[BookingColumnsIndicators].sum(axis=1)
     target_columns.append("Número de indicadores")
-    target_columns = list(set(target_columns))
+    target_columns = list(dict.fromkeys(target_columns))
     target_df = df[target_columns].set_index("NIF")
-    target_df.rename(columns={
-        "Booking_Estrellas_Contexto": "Star rating",
-        "Genero Director Ejecutivo": "Gender of CEO",
-        "Número empleados 2019": "Employees",
-        "PERTENECE A UN GRUPO O HAY MÁS HOTELES": "Group",
-        "PLAYA (PLAYA= 1 HASTA 10 KM; otros)": "Beach",
-        "EBIT 2019": "EBIT",
-        "EBITDA 2019": "EBITDA",
-        "Endeudamiento (%) % 2019": "Indebtedness",
-        "Ingresos de explotación EUR 2019": "Operating income",
-        "Margen de beneficio (%) % 2019": "Profit margin",
-        "Ratio de solvencia % 2019": "Solvency",
-        "Rentabilidad económica (%) % 2019": "ROA",
-        "Rentabilidad financiera (%) % 2019": "ROE",
-        "Rentabilidad sobre capital empleado (%) % 2019": "ROIC",
-        "Result. ordinarios antes Impuestos EUR 2019": "EBT",
-        "Tasa variación rentabilidad económica": "Variation in ROA",
-        "Tasa variación rentabilidad financiera": "Variation in ROE",
-        "Total Activo log 2019": "Asset",
-        "Indicator de Independencia num": "Independence indicator",
-        "Booking_Nivel_Sostenibilidad_Contexto": "Level Sustainability Index",
-    }, inplace=True)
+    target_df.rename(columns=RENAMED_COLUMNS, inplace=True)
+    return target_df
+
+
+def main(args: argparse.Namespace) -> None:
+    df = pd.read_csv(args.input)
+    target_df = sanitize(df)
     target_df.to_csv(args.output, index_label="NIF")
 
 
@@ -196,4 +195,4 @@ if __name__ == "__main__":
     parser.add_argument("--input", type=str, help="Path to the raw CSV file")
     parser.add_argument("--output", type=str, help="Path to the resulting CSV file")
     args = parser.parse_args()
-    main(args)
\ No newline at end of file
+    main(args)